@@ -0,0 +1,125 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Optional, TypeVar  # noqa: I101
+
+import numpy as np
+
+from deker_shell.export import ByteBudget
+from deker_shell.utils import get_memory_limit, get_workers
+
+
+if TYPE_CHECKING:
+    from deker.ABC.base_subset import BaseSubset
+
+T = TypeVar("T")
+
+
+def subset_nbytes(subset: "BaseSubset") -> int:
+    """Return size of subset data in bytes without reading it.
+
+    :param subset: Subset or VSubset
+    """
+    return int(np.prod(subset.shape, dtype=np.int64)) * np.dtype(subset.dtype).itemsize
+
+
+class AsyncIO:
+    """Awaitable deker reads and updates, run on a managed thread pool.
+
+    Blocking deker calls are moved off the event loop, so that ``asyncio.gather`` over many subsets
+    overlaps their I/O and the prompt stays responsive. At most ``workers`` calls run at once and
+    at most ``max_bytes`` of subsets data is read or written at once.
+
+    Example:
+        > data = await aread(array[0, :])
+        > await aupdate(array[1, :], data)
+        > results = await agather_reads([array[i, :] for i in range(24)])
+
+    :param workers: max amount of concurrent deker calls
+    :param max_bytes: max amount of subsets data bytes in flight
+    """
+
+    def __init__(self, workers: int, max_bytes: int) -> None:
+        self.workers = workers
+        self.budget = ByteBudget(max_bytes)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_client(cls, client: Any) -> "AsyncIO":
+        """Size the executor from the Client workers and memory limit.
+
+        :param client: Client instance
+        """
+        return cls(get_workers(client), get_memory_limit(client))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool, created on first use."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="deker-async")
+        return self._executor
+
+    def _with_budget(self, size: int, func: Callable[..., T], *args: Any) -> T:
+        self.budget.acquire(size)
+        try:
+            return func(*args)
+        finally:
+            self.budget.release(size)
+
+    async def run(self, size: int, func: Callable[..., T], *args: Any) -> T:
+        """Run blocking function on the executor within the bytes budget.
+
+        :param size: amount of bytes the function holds
+        :param func: blocking function
+        :param args: function arguments
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._with_budget, size, func, *args)
+
+    async def read(self, subset: "BaseSubset") -> Any:
+        """Read subset data without blocking the event loop.
+
+        :param subset: Subset or VSubset
+        """
+        return await self.run(subset_nbytes(subset), subset.read)
+
+    async def update(self, subset: "BaseSubset", data: Any) -> None:
+        """Update subset data without blocking the event loop.
+
+        :param subset: Subset or VSubset
+        :param data: new data
+        """
+        await self.run(subset_nbytes(subset), subset.update, data)
+
+    async def gather_reads(self, subsets: Iterable["BaseSubset"], return_exceptions: bool = False) -> List[Any]:
+        """Read subsets concurrently, return their data in the same order.
+
+        :param subsets: Subsets or VSubsets
+        :param return_exceptions: return exceptions of failed reads instead of raising the first one
+        """
+        return await asyncio.gather(*(self.read(subset) for subset in subsets), return_exceptions=return_exceptions)
+
+    def shutdown(self) -> None:
+        """Wait for running calls and stop the executor."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __repr__(self) -> str:
+        return f"AsyncIO(workers={self.workers}, max_bytes={self.budget.limit}, in_flight={self.budget.in_flight})"
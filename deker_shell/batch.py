@@ -0,0 +1,295 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import ast
+import asyncio
+import contextlib
+import datetime
+import functools
+import io
+import json
+import sys
+import time
+
+from inspect import CO_COROUTINE
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, Optional, TextIO, Tuple, Union  # noqa: I101
+
+from deker_shell.collection_names import CollectionNames
+from deker_shell.help import help
+from deker_shell.lazy import deker_namespace
+from deker_shell.locks import get_lock_waiter
+from deker_shell.profiling import mem, prof, timeit
+from deker_shell.rendering import view
+
+
+if TYPE_CHECKING:
+    from types import CodeType
+
+    from deker import Client, Collection
+
+PyCF_ALLOW_TOP_LEVEL_AWAIT = 0x2000
+
+
+def make_namespace(client: "Client", storages: Optional[Dict[str, str]] = None, **kwargs: Any) -> Dict[str, Any]:
+    """Build the shell namespace for non-interactive execution.
+
+    Contains the same preset variables as the interactive shell: deker public objects, ``np``,
+    ``datetime``, ``client``, ``collections``, ``collection``, ``use``, ``export``, ``ingest``, ``scan``,
+    async I/O, ``clients``, ``copy``, ``autotune``, ``check``, ``explain``, ``iter_chunks``, ``trace``,
+    ``locks`` and profiling helpers. Shall be closed with ``close_namespace``.
+
+    :param client: Client instance
+    :param storages: extra storages uris by name, connected on first access through ``clients``
+    :param kwargs: extra storages Client parameters
+    """
+    from deker_shell.aio import AsyncIO
+    from deker_shell.check import check
+    from deker_shell.chunks import iter_chunks
+    from deker_shell.clients import ClientRegistry
+    from deker_shell.explain import explain
+    from deker_shell.export import export
+    from deker_shell.ingest import ingest
+    from deker_shell.locks import locks
+    from deker_shell.scan import scan
+    from deker_shell.trace import trace
+    from deker_shell.tune import autotune
+
+    namespace = deker_namespace()
+    async_io = AsyncIO.from_client(client)
+    clients = ClientRegistry(storages, **kwargs)
+    clients.adopt("default", client)
+
+    def use(name: str) -> None:
+        """Get collection from client and saves it to collection variable.
+
+        :param name: collection name
+        """
+        coll = client.get_collection(name)
+        namespace["collection"] = coll
+        if not coll:
+            print(f"Collection {name} doesn't exist")
+        else:
+            print(f"Saved {coll.name} to 'collection' variable")
+
+    def get_global_coll_variable() -> Optional["Collection"]:
+        """Return 'collection' variable."""
+        return namespace["collection"]
+
+    namespace.update(
+        __name__="__main__",
+        client=client,
+        collections=CollectionNames(client),
+        collection=None,
+        use=use,
+        get_global_coll_variable=get_global_coll_variable,
+        help=help,
+        timeit=timeit,
+        prof=prof,
+        mem=mem,
+        view=view,
+        export=export,
+        ingest=ingest,
+        scan=scan,
+        async_io=async_io,
+        aread=async_io.read,
+        aupdate=async_io.update,
+        agather_reads=async_io.gather_reads,
+        clients=clients,
+        copy=clients.copy,
+        autotune=functools.partial(autotune, client),
+        check=functools.partial(check, client),
+        explain=explain,
+        iter_chunks=iter_chunks,
+        trace=trace,
+        locks=functools.partial(locks, client),
+    )
+    return namespace
+
+
+def close_namespace(namespace: Dict[str, Any]) -> None:
+    """Stop the async I/O thread pool and close the extra storages clients of a shell namespace.
+
+    :param namespace: namespace built by ``make_namespace``
+    """
+    from deker_shell.aio import AsyncIO
+    from deker_shell.clients import ClientRegistry
+
+    async_io, clients = namespace.get("async_io"), namespace.get("clients")
+    if isinstance(async_io, AsyncIO):
+        async_io.shutdown()
+    if isinstance(clients, ClientRegistry):
+        clients.close()
+
+
+def json_default(obj: Any) -> Any:
+    """Convert objects, unknown to json encoder, to serializable ones.
+
+    :param obj: statement result
+    """
+    if hasattr(obj, "tolist"):  # numpy arrays and scalars
+        return obj.tolist()
+    if isinstance(obj, CollectionNames):
+        return list(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    as_dict = getattr(obj, "as_dict", None)
+    if isinstance(as_dict, dict):
+        return as_dict
+    return repr(obj)
+
+
+def iter_statements(source: str, filename: str) -> Iterator[Tuple[int, str, "CodeType", bool]]:
+    """Split source into top level statements and compile them one by one.
+
+    Yields statement line number, its source, code object and a flag showing if the statement
+    is an expression, which result shall be reported.
+
+    :param source: python source code
+    :param filename: source name for tracebacks
+    """
+    flags = PyCF_ALLOW_TOP_LEVEL_AWAIT
+    tree = ast.parse(source, filename)
+    for node in tree.body:
+        code_text = ast.get_source_segment(source, node) or ""
+        if isinstance(node, ast.Expr):
+            code = compile(ast.Expression(node.value), filename, "eval", flags=flags)
+            yield node.lineno, code_text, code, True
+        else:
+            code = compile(ast.Module([node], type_ignores=[]), filename, "exec", flags=flags)
+            yield node.lineno, code_text, code, False
+
+
+def run_statement(code: "CodeType", namespace: Dict[str, Any]) -> Any:
+    """Execute compiled statement in namespace, awaiting top level await.
+
+    :param code: compiled statement
+    :param namespace: shell namespace
+    """
+    result = eval(code, namespace)  # nosec B307
+    if code.co_flags & CO_COROUTINE:
+        result = asyncio.get_event_loop().run_until_complete(result)
+    return result
+
+
+def write_record(output: TextIO, record: Dict[str, Any]) -> None:
+    """Write one NDJSON record and flush it.
+
+    :param output: text stream
+    :param record: statement record
+    """
+    error: Union[BaseException, None] = record.get("error")
+    if error is not None:
+        record["error"] = {"type": type(error).__name__, "message": str(error)}
+    try:
+        line = json.dumps(record, default=json_default)
+    except (TypeError, ValueError):
+        record["result"] = repr(record.get("result"))
+        line = json.dumps(record, default=json_default)
+    output.write(line + "\n")
+    output.flush()
+
+
+def run_batch(
+    client: "Client",
+    sources: Iterable[Tuple[str, str]],
+    output: Optional[TextIO] = None,
+    namespace: Optional[Dict[str, Any]] = None,
+) -> int:
+    """Execute sources statement by statement and stream their results as NDJSON, return exit code.
+
+    One JSON object per statement is written to output as soon as the statement is executed.
+    Execution stops on the first failed statement.
+
+    :param client: Client instance shared by all the statements
+    :param sources: pairs of source name and python source code
+    :param output: text stream for NDJSON records, stdout by default
+    :param namespace: shell namespace, built from client and closed on return if not passed
+    """
+    if output is None:
+        output = sys.stdout
+    owned = namespace is None
+    if namespace is None:
+        namespace = make_namespace(client)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    index = 0
+    try:
+        for name, source in sources:
+            try:
+                statements = list(iter_statements(source, name))
+            except SyntaxError as e:
+                write_record(output, {"index": index, "source": name, "line": e.lineno, "ok": False, "error": e})
+                return 1
+
+            for lineno, code_text, code, is_expression in statements:
+                record: Dict[str, Any] = {"index": index, "source": name, "line": lineno, "code": code_text}
+                stdout = io.StringIO()
+                waiter = get_lock_waiter()
+                lock_wait = waiter.wait_time if waiter is not None else 0.0
+                start = time.perf_counter()
+                try:
+                    with contextlib.redirect_stdout(stdout):
+                        result = run_statement(code, namespace)
+                except Exception as e:
+                    record.update(ok=False, error=e)
+                else:
+                    record.update(ok=True, result=result if is_expression else None)
+                record.update(stdout=stdout.getvalue(), time=time.perf_counter() - start)
+                if waiter is not None:
+                    record.update(lock_wait=waiter.wait_time - lock_wait)
+                write_record(output, record)
+                if not record["ok"]:
+                    return 1
+                index += 1
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        if owned:
+            close_namespace(namespace)
+    return 0
+
+
+def execute(
+    uri: str,
+    statements: Iterable[str],
+    script: Optional[TextIO] = None,
+    storages: Optional[Dict[str, str]] = None,
+    **kwargs: Any,
+) -> int:
+    """Open a client and execute statements and script against it without the REPL.
+
+    Returns process exit code.
+
+    :param uri: uri to Deker storage
+    :param statements: python statements, each of them may contain several lines
+    :param script: python script text stream
+    :param storages: extra storages uris by name
+    :param kwargs: Client parameters
+    """
+    from deker import Client
+
+    sources = [(f"<execute {i}>", statement) for i, statement in enumerate(statements)]
+    if script is not None:
+        sources.append((script.name, script.read()))
+    with Client(uri, **kwargs) as client:
+        namespace = make_namespace(client, storages, **kwargs)
+        try:
+            return run_batch(client, sources, namespace=namespace)
+        finally:
+            close_namespace(namespace)
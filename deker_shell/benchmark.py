@@ -0,0 +1,417 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Performance benchmarks of the shell startup, completions and collections listing.
+
+Usage:
+    python -m deker_shell.benchmark results.json --collections 50 --arrays 1000
+    python -m deker_shell.benchmark new.json --baseline old.json --threshold 1.25
+"""
+
+import json
+import os
+import platform
+import re
+import select
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence  # noqa: I101
+
+import click
+
+
+ROOT = Path(__file__).parent.parent
+SHELL_CODE = "from deker_shell.main import start; start()"
+PERCENTILES = (50, 90, 99)
+NAMESPACE_SIZES = (10, 100, 1000)
+COMPLETION_QUERIES = ("cli", "client.", "client.get_collection(", "collection.fi", "np.ar", "var_1")
+GROUPS = ("startup", "prompt", "completion", "listing")
+# regressions smaller than this are noise, whatever the ratio
+MIN_DELTA = 0.001
+
+_terminal_escape = re.compile(rb"\x1b(?:\[[0-9;?]*[a-zA-Z]|\][^\x07]*\x07|[()][A-Z0-9]|[=>])")
+# cursor position request, answered like a terminal would, otherwise prompt toolkit waits for it
+CPR_REQUEST = b"\x1b[6n"
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Return nearest-rank percentile of values.
+
+    :param values: measured values
+    :param q: percentile from 0 to 100
+    """
+    ordered = sorted(values)
+    index = max(int(-(-q * len(ordered) // 100)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarize(times: Sequence[float]) -> Dict[str, float]:
+    """Return min, mean, max and percentiles of times in seconds.
+
+    :param times: measured times in seconds
+    """
+    summary = {"n": len(times), "min": min(times), "mean": sum(times) / len(times), "max": max(times)}
+    summary.update({f"p{q}": percentile(times, q) for q in PERCENTILES})
+    return summary
+
+
+def measure(func: Callable[[], Any], repeat: int) -> List[float]:
+    """Call function repeat times, return wall times in seconds.
+
+    :param func: function to measure
+    :param repeat: number of calls
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def build_storage(path: str, collections: int = 10, arrays: int = 100) -> str:
+    """Create a synthetic local storage, return its uri.
+
+    Collections are named ``bench_0``, ``bench_1``, ...; each has ``arrays`` small arrays with an int primary
+    attribute ``k`` and a float custom attribute ``value``. An existing storage of the same layout is reused.
+
+    :param path: storage directory
+    :param collections: number of collections
+    :param arrays: number of arrays per collection
+    """
+    from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+
+    Path(path).mkdir(parents=True, exist_ok=True)
+    uri = f"file://{Path(path).resolve()}"
+    schema = ArraySchema(
+        dimensions=[DimensionSchema(name="y", size=4), DimensionSchema(name="x", size=4)],
+        dtype=float,
+        attributes=[
+            AttributeSchema(name="k", dtype=int, primary=True),
+            AttributeSchema(name="value", dtype=float, primary=False),
+        ],
+    )
+    with Client(uri) as client:
+        for i in range(collections):
+            name = f"bench_{i}"
+            collection = client.get_collection(name) or client.create_collection(name, schema)
+            existing = {array.primary_attributes["k"] for array in collection}
+            for k in range(arrays):
+                if k not in existing:
+                    collection.create({"k": k}, {"value": float(k)})
+    return uri
+
+
+def _shell_env(pycache: str) -> Dict[str, str]:
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache)
+    # warm runs need the bytecode written by the previous ones
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    return env
+
+
+def run_shell(args: Sequence[str], pycache: str) -> None:
+    """Run shell in a new interpreter and wait for it to exit.
+
+    :param args: shell command line arguments
+    :param pycache: bytecode cache directory of the interpreter
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", SHELL_CODE, *args],
+        env=_shell_env(pycache),
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Shell {' '.join(args)} failed: {result.stderr.strip()}")
+
+
+def bench_startup(uri: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Measure startup of ``start()`` executing one statement against the storage.
+
+    Cold runs start with an empty bytecode cache, so every module is compiled; warm runs reuse it.
+
+    :param uri: storage uri
+    :param repeat: number of runs
+    """
+    args = [uri, "-e", "len(collections)"]
+    cold = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as pycache:
+            cold.extend(measure(lambda: run_shell(args, pycache), 1))  # noqa: B023
+    with tempfile.TemporaryDirectory() as pycache:
+        run_shell(args, pycache)
+        warm = measure(lambda: run_shell(args, pycache), repeat)
+    return {"startup.cold": summarize(cold), "startup.warm": summarize(warm)}
+
+
+def time_to_prompt(uri: str, pycache: str, timeout: float = 60.0, args: Sequence[str] = ()) -> float:
+    """Start the REPL in a pseudo terminal, return seconds until the first prompt is drawn.
+
+    :param uri: storage uri
+    :param pycache: bytecode cache directory of the interpreter
+    :param timeout: max seconds to wait for the prompt
+    :param args: extra shell command line arguments
+    """
+    from deker_shell.consts import help_start
+
+    # the prompt is drawn after the help text, which has prompts in its examples
+    help_end = help_start.strip().splitlines()[-1].strip().encode()
+    master, slave = os.openpty()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", SHELL_CODE, uri, *args],
+        env=dict(_shell_env(pycache), TERM="xterm"),
+        stdin=slave,
+        stdout=slave,
+        stderr=slave,
+        close_fds=True,
+    )
+    os.close(slave)
+    output = b""
+    try:
+        while time.perf_counter() - start < timeout:
+            ready, _, _ = select.select([master], [], [], 0.05)
+            if ready:
+                try:
+                    chunk = os.read(master, 65536)
+                except OSError:
+                    break
+                if CPR_REQUEST in chunk:
+                    os.write(master, b"\x1b[1;1R")
+                output += chunk
+                _, found, after = _terminal_escape.sub(b"", output).partition(help_end)
+                if found and b">" in after:
+                    elapsed = time.perf_counter() - start
+                    os.write(master, b"\x04")
+                    return elapsed
+            elif process.poll() is not None:
+                break
+        raise RuntimeError(
+            f"No prompt in {timeout}s: {_terminal_escape.sub(b'', output)[-500:].decode(errors='replace')}"
+        )
+    finally:
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        os.close(master)
+
+
+def bench_prompt(uri: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Measure time to the first REPL prompt with a warm bytecode cache, standalone and attached to a daemon.
+
+    :param uri: storage uri
+    :param repeat: number of runs
+    """
+    daemon = ["--daemon", "--daemon-idle", "5"]
+    with tempfile.TemporaryDirectory() as pycache:
+        run_shell([uri, "-e", "1"], pycache)
+        times = [time_to_prompt(uri, pycache) for _ in range(repeat)]
+        # the first attach starts the daemon
+        time_to_prompt(uri, pycache, args=daemon)
+        attached = [time_to_prompt(uri, pycache, args=daemon) for _ in range(repeat)]
+    return {"prompt.first": summarize(times), "prompt.daemon": summarize(attached)}
+
+
+def bench_completion(
+    uri: str, repeat: int, sizes: Iterable[int] = NAMESPACE_SIZES, queries: Iterable[str] = COMPLETION_QUERIES
+) -> Dict[str, Dict[str, float]]:
+    """Measure ``JediCompleter.get_completions`` latency in namespaces of growing size.
+
+    The namespace is the shell one plus ``size`` extra variables. Uncached latency is measured after
+    invalidating the completer, cached latency is measured on the same input right after.
+
+    :param uri: storage uri
+    :param repeat: number of runs of each query
+    :param sizes: numbers of extra variables in the namespace
+    :param queries: inputs to complete
+    """
+    from deker import Client
+    from prompt_toolkit.completion import CompleteEvent
+    from prompt_toolkit.document import Document
+
+    from deker_shell.collection_names import CollectionNames
+    from deker_shell.completer import JediCompleter
+    from deker_shell.lazy import deker_namespace
+
+    event = CompleteEvent(completion_requested=True)
+    results = {}
+    with Client(uri) as client:
+        names = CollectionNames(client)
+        base = dict(deker_namespace(), client=client, collections=names, collection=client.get_collection(names[0]))
+        for size in sizes:
+            namespace = dict(base, **{f"var_{i}": i for i in range(size)})
+            completer = JediCompleter(lambda: namespace, lambda: {}, debounce=0)  # noqa: B023
+            uncached, cached = [], []
+            for _ in range(repeat):
+                for query in queries:
+                    document = Document(query)
+                    completer.invalidate()
+                    uncached.extend(measure(lambda: list(completer.get_completions(document, event)), 1))  # noqa: B023
+                    cached.extend(measure(lambda: list(completer.get_completions(document, event)), 1))  # noqa: B023
+            results[f"completion.uncached.{size}"] = summarize(uncached)
+            results[f"completion.cached.{size}"] = summarize(cached)
+    return results
+
+
+def bench_listing(uri: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Measure ``use()`` and collections and arrays listing.
+
+    :param uri: storage uri
+    :param repeat: number of runs
+    """
+    from deker import Client
+
+    from deker_shell.collection_names import CollectionNames
+
+    with Client(uri) as client:
+        names = list(CollectionNames(client))
+        if not names:
+            raise RuntimeError(f"No collections in {uri}")
+        use = measure(lambda: [client.get_collection(name) for name in names], repeat)
+        collection = client.get_collection(names[0])
+        return {
+            "listing.use": summarize([value / len(names) for value in use]),
+            "listing.collection_names": summarize(measure(lambda: list(CollectionNames(client)), repeat)),
+            "listing.collections": summarize(measure(lambda: list(client), repeat)),
+            "listing.arrays": summarize(measure(lambda: list(collection), repeat)),
+        }
+
+
+def run_benchmarks(
+    uri: str, repeat: int = 5, groups: Iterable[str] = GROUPS, params: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """Run benchmark groups against the storage, return JSON-serializable results.
+
+    :param uri: storage uri
+    :param repeat: number of runs of each measurement
+    :param groups: benchmark groups: startup, prompt, completion and listing
+    :param params: benchmark parameters saved with the results
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    benches: Dict[str, Callable[[str, int], Dict[str, Dict[str, float]]]] = {
+        "startup": bench_startup,
+        "prompt": bench_prompt,
+        "completion": bench_completion,
+        "listing": bench_listing,
+    }
+    try:
+        shell_version = version("deker_shell")
+    except PackageNotFoundError:
+        shell_version = "unknown"
+    metrics: Dict[str, Dict[str, float]] = {}
+    for group in groups:
+        metrics.update(benches[group](uri, repeat))
+    return {
+        "version": shell_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": dict(params or {}, repeat=repeat),
+        "metrics": metrics,
+    }
+
+
+class Regression(NamedTuple):
+    """Metric slower than in the baseline."""
+
+    metric: str
+    baseline: float
+    current: float
+
+    def __repr__(self) -> str:
+        ratio = f"x{self.current / self.baseline:.2f}" if self.baseline > 0 else "new cost"
+        return f"{self.metric}: {self.baseline:.4f}s -> {self.current:.4f}s ({ratio})"
+
+
+def compare(
+    current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 1.25, stat: str = "p50"
+) -> List[Regression]:
+    """Return metrics which got slower than the baseline by more than the threshold ratio.
+
+    Metrics missing in either results are skipped.
+
+    :param current: new results
+    :param baseline: results to compare with
+    :param threshold: max allowed current to baseline ratio
+    :param stat: compared statistic of each metric
+    """
+    regressions = []
+    for metric, values in current["metrics"].items():
+        base = baseline["metrics"].get(metric)
+        if base is None:
+            continue
+        if values[stat] > base[stat] * threshold and values[stat] - base[stat] > MIN_DELTA:
+            regressions.append(Regression(metric, base[stat], values[stat]))
+    return regressions
+
+
+@click.command()
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--storage", type=click.Path(file_okay=False), help="Synthetic storage directory, temporary by default.")
+@click.option("--collections", type=int, default=10, show_default=True, help="Number of collections.")
+@click.option("--arrays", type=int, default=100, show_default=True, help="Number of arrays per collection.")
+@click.option("--repeat", type=int, default=5, show_default=True, help="Number of runs of each measurement.")
+@click.option("--group", "groups", type=click.Choice(GROUPS), multiple=True, help="Benchmark group, all by default.")
+@click.option("--baseline", type=click.File("r"), help="Previous results JSON to compare with.")
+@click.option("--threshold", type=float, default=1.25, show_default=True, help="Max allowed slowdown ratio.")
+def main(
+    output: str,
+    storage: Optional[str],
+    collections: int,
+    arrays: int,
+    repeat: int,
+    groups: Sequence[str],
+    baseline: Optional[Any],
+    threshold: float,
+) -> None:
+    """Benchmark the shell against a synthetic local storage and write results to OUTPUT JSON.
+
+    Exits with code 1 if any metric median got slower than in --baseline by more than --threshold.
+
+    :param output: results JSON path
+    :param storage: synthetic storage directory
+    :param collections: number of collections
+    :param arrays: number of arrays per collection
+    :param repeat: number of runs of each measurement
+    :param groups: benchmark groups
+    :param baseline: previous results file
+    :param threshold: max allowed slowdown ratio
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = build_storage(storage or tmp, collections, arrays)
+        results = run_benchmarks(uri, repeat, groups or GROUPS, {"collections": collections, "arrays": arrays})
+    Path(output).write_text(json.dumps(results, indent=2))
+    for metric, values in results["metrics"].items():
+        click.echo(f"{metric}: p50 {values['p50']:.4f}s, p90 {values['p90']:.4f}s, max {values['max']:.4f}s")
+    if baseline is not None:
+        regressions = compare(results, json.load(baseline), threshold)
+        for regression in regressions:
+            click.echo(f"Regression {regression!r}", err=True)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
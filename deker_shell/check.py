@@ -0,0 +1,581 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import multiprocessing
+import os
+import time
+
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union  # noqa: I101
+
+import click
+
+from deker_shell.export import EXPORT_CHUNK_BYTES
+from deker_shell.locks import is_running, lock_owner
+from deker_shell.utils import get_client_params, get_config, get_memory_limit
+
+
+if TYPE_CHECKING:
+    from deker import Client, Collection
+
+CHECK_LEVELS = {
+    1: "collections load and have their locks, no orphaned collection locks or files",
+    2: "array files are readable, their metadata conforms to the schema, no orphaned locks or files",
+    3: "arrays have valid symlinks, no broken symlinks",
+    4: "arrays data is readable to the last chunk",
+}
+DEFAULT_REPORT = "deker-check.jsonl"
+# array files sent to a worker process at once
+CHECK_BATCH = 64
+# seconds between checkpoint writes
+CHECKPOINT_INTERVAL = 1.0
+# seconds between progress line updates
+PROGRESS_INTERVAL = 0.5
+# lock files of arrays and varrays, the collection ".lock" is checked by level 1
+LOCK_EXTENSIONS = (".arrlock", ".arrayreadlock", ".varraylock")
+
+
+class Finding(NamedTuple):
+    """Integrity problem of a collection file, path is relative to the collection directory."""
+
+    collection: str
+    path: str
+    kind: str
+    message: str
+
+
+class CheckReport(NamedTuple):
+    """Integrity check outcome, findings are in the report file."""
+
+    report: str
+    level: int
+    collections: int
+    checked: int
+    findings: Dict[str, int]
+    time: float
+    resumed: bool
+
+    def __repr__(self) -> str:
+        from deker_shell.profiling import format_time
+
+        total = sum(self.findings.values())
+        text = (
+            f"checked {self.checked} files of {self.collections} collections at level {self.level} "
+            f"in {format_time(self.time)}{' (resumed)' if self.resumed else ''}, {total} findings"
+        )
+        if total:
+            text += ": " + ", ".join(f"{count} {kind}" for kind, count in sorted(self.findings.items()))
+            text += f", see {self.report}"
+        return text
+
+
+def iter_files(root: Path, after: Tuple[str, ...] = (), skip: Tuple[str, ...] = ()) -> Iterator[Tuple[str, ...]]:
+    """Yield path parts of files and symlinks under root relative to it, in sorted depth-first order.
+
+    The order equals the order of the parts tuples, so a sweep is resumed from the last checked
+    file by passing it as ``after``: directories before it are not listed at all.
+
+    :param root: directory to walk
+    :param after: parts of the file to start after
+    :param skip: names of root subdirectories not to walk
+    """
+
+    def walk(parts: Tuple[str, ...]) -> Iterator[Tuple[str, ...]]:
+        try:
+            entries = sorted(os.scandir(root.joinpath(*parts)), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            # removed during the sweep
+            return
+        for entry in entries:
+            path = parts + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                if (parts or entry.name not in skip) and path >= after[: len(path)]:
+                    yield from walk(path)
+            elif path > after:
+                yield path
+
+    yield from walk(())
+
+
+def check_lock(path: Path, lock_timeout: float) -> Optional[str]:
+    """Return why lock file is orphaned, None if it may still be held.
+
+    A lock is orphaned if it is older than the write lock timeout and the process, which name it has,
+    isn't running on this machine; deker read and varray locks have the pid in their names.
+
+    :param path: lock file path
+    :param lock_timeout: Client write lock timeout
+    """
+    try:
+        age = time.time() - path.lstat().st_mtime
+    except FileNotFoundError:
+        # released during the sweep
+        return None
+    if age <= lock_timeout:
+        return None
+    pid = lock_owner(path.name)
+    if pid is not None and is_running(pid):
+        return None
+    return f"lock is {age:.0f}s old" + (f", process {pid} is not running" if pid is not None else "")
+
+
+def _collection_dirs(collection: "Collection") -> Dict[str, Tuple[str, Any]]:
+    """Return role (data or symlinks) and adapter of each collection subdirectory.
+
+    :param collection: Collection instance
+    """
+    dirs = {}
+    adapters = [collection.arrays._adapter]
+    if collection.varray_schema:
+        adapters.append(collection.varrays._adapter)
+    for adapter in adapters:
+        dirs[adapter.data_dir] = ("data", adapter)
+        dirs[adapter.symlinks_dir] = ("symlinks", adapter)
+    return dirs
+
+
+def _read_data(array: Any, chunk_bytes: int) -> List[str]:
+    """Read array chunk by chunk, return the read error.
+
+    :param array: Array instance
+    :param chunk_bytes: max chunk size in bytes
+    """
+    import numpy as np
+
+    from deker_shell.export import iter_chunk_bounds
+
+    try:
+        for bounds in iter_chunk_bounds(tuple(array.shape), np.dtype(array.dtype).itemsize, chunk_bytes):
+            array[bounds].read()
+    except Exception as e:
+        return [f"data: {type(e).__name__}: {e}"]
+    return []
+
+
+def check_array_file(collection: "Collection", adapter: Any, path: Path, level: int, chunk_bytes: int) -> List[str]:
+    """Return problems of Array or VArray file.
+
+    :param collection: Collection instance
+    :param adapter: local Array or VArray adapter of the file
+    :param path: array file path
+    :param level: check level
+    :param chunk_bytes: max chunk size in bytes read at level 4
+    """
+    from deker.arrays import Array, VArray
+    from deker.tools import get_paths
+
+    is_varray = adapter.file_ext == ".json"
+    try:
+        # VArray adapter read_meta takes a path, Array one takes only an array to lock it
+        meta = adapter.read_meta(path) if is_varray else adapter.storage_adapter.read_meta(path)
+    except Exception as e:
+        return [f"unreadable: {type(e).__name__}: {e}"]
+    array_id = path.name[: -len(adapter.file_ext)]
+    if meta.get("id") != array_id:
+        return [f"metadata: id {meta.get('id')} differs from the file name"]
+    try:
+        if is_varray:
+            array = VArray._create_from_meta(collection, meta, collection.arrays._adapter, adapter)
+        else:
+            array = Array._create_from_meta(collection, meta, adapter)
+    except Exception as e:
+        return [f"metadata: {e}"]
+    paths = get_paths(array, adapter.collection_path)
+    if paths.main / path.name != path:
+        return [f"metadata: file shall be in {paths.main.relative_to(adapter.collection_path)}"]
+    problems = []
+    if level >= 3:
+        symlink = paths.symlink / path.name
+        if not symlink.is_symlink() or symlink.resolve() != path.resolve():
+            problems.append(f"symlink: no symlink {symlink.relative_to(adapter.collection_path)} to the file")
+    if level >= 4 and not is_varray:
+        problems.extend(_read_data(array, chunk_bytes))
+    return problems
+
+
+def check_files(
+    collection: "Collection", paths: List[str], level: int, lock_timeout: float, chunk_bytes: int
+) -> List[Finding]:
+    """Check collection files, return their findings in the order of paths.
+
+    :param collection: Collection instance
+    :param paths: files paths relative to the collection directory
+    :param level: check level, 2 to 4
+    :param lock_timeout: Client write lock timeout, older locks of stopped processes are orphaned
+    :param chunk_bytes: max chunk size in bytes read at level 4
+    """
+    dirs = _collection_dirs(collection)
+    root = Path(collection.arrays._adapter.collection_path)
+    findings = []
+    for relative in paths:
+        path = root / relative
+        top = relative.split("/", 1)[0]
+        role, adapter = dirs.get(top, (None, None))
+        problems: List[str] = []
+        if path.name.endswith(LOCK_EXTENSIONS):
+            reason = check_lock(path, lock_timeout)
+            problems = [f"orphaned_lock: {reason}"] if reason else []
+        elif relative == f"{collection.name}.json":
+            pass
+        elif role == "data" and path.name.endswith(adapter.file_ext):
+            problems = check_array_file(collection, adapter, path, level, chunk_bytes)
+        elif role == "symlinks" and path.is_symlink():
+            if not path.exists():
+                problems = [f"symlink: broken symlink to {os.readlink(path)}"]
+        elif path.exists() or path.is_symlink():
+            problems = ["unexpected_file: not a deker file"]
+        for problem in problems:
+            kind, message = problem.split(": ", 1)
+            findings.append(Finding(collection.name, relative, kind, message))
+    return findings
+
+
+# Collections of the worker process by name
+_collections: Dict[str, "Collection"] = {}
+
+
+def _check_worker(
+    collection_name: str, paths: List[str], level: int, lock_timeout: float, chunk_bytes: int
+) -> List[Finding]:
+    """Check collection files in a worker process of the pool initialized by the scripts runner.
+
+    :param collection_name: collection name
+    :param paths: files paths relative to the collection directory
+    :param level: check level
+    :param lock_timeout: Client write lock timeout
+    :param chunk_bytes: max chunk size in bytes read at level 4
+    """
+    from deker_shell import runner
+
+    if collection_name not in _collections:
+        _collections[collection_name] = runner._client.get_collection(collection_name)  # type: ignore[union-attr]
+    return check_files(_collections[collection_name], paths, level, lock_timeout, chunk_bytes)
+
+
+def check_collections(client: "Client", name: Optional[str] = None) -> Tuple[List[str], List[Finding]]:
+    """Check that collections load and have their locks, return names of loaded collections and findings.
+
+    Without a name the whole collections directory is checked for collection locks and files
+    which don't belong to any collection.
+
+    :param client: Client instance
+    :param name: collection to check, all if None
+    """
+    root = Path(client.root_path)
+    names, findings = [], []
+    if name is not None:
+        candidates = [name]
+    else:
+        entries = sorted(os.scandir(root), key=lambda entry: entry.name)
+        candidates = [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.name.endswith(".lock") and not (root / entry.name[: -len(".lock")]).is_dir():
+                findings.append(Finding("", entry.name, "orphaned_lock", "lock of a missing collection"))
+            elif not entry.name.endswith(".lock"):
+                findings.append(Finding("", entry.name, "unexpected_file", "not a collection"))
+    for candidate in candidates:
+        try:
+            collection = client.get_collection(candidate)
+        except Exception as e:
+            findings.append(Finding(candidate, "", "collection", f"{type(e).__name__}: {e}"))
+            continue
+        if collection is None:
+            if name is not None:
+                raise ValueError(f"Collection {name} doesn't exist")
+            findings.append(Finding(candidate, "", "collection", "no collection metadata"))
+            continue
+        if not (root / f"{candidate}.lock").exists():
+            findings.append(Finding(candidate, "", "collection", "collection lock not found"))
+        names.append(candidate)
+    return names, findings
+
+
+class _Sweep:
+    """Report file writer with checkpoints and progress line of an integrity check.
+
+    The checkpoint is replaced atomically and points at the last file which findings are in the
+    report, and at the report size then; on resume the report is cut to that size.
+
+    :param report: report file path
+    :param params: check parameters, a checkpoint of other ones is not resumed
+    :param resume: resume from the checkpoint if there is one
+    :param progress: print progress line to stderr
+    """
+
+    def __init__(self, report: Path, params: Dict[str, Any], resume: bool, progress: bool) -> None:
+        self.checkpoint = report.with_name(report.name + ".checkpoint")
+        self.progress = progress
+        self.state: Dict[str, Any] = {
+            "params": params,
+            "listed": False,
+            "done": [],
+            "current": None,
+            "after": [],
+            "checked": 0,
+            "findings": {},
+            "report_size": 0,
+        }
+        self.resumed = False
+        if resume and self.checkpoint.exists() and report.exists():
+            state = json.loads(self.checkpoint.read_text())
+            if state["params"] != params:
+                raise ValueError(
+                    f"{self.checkpoint} belongs to a check with {state['params']}, remove it or pass resume=False"
+                )
+            self.state, self.resumed = state, True
+            os.truncate(report, state["report_size"])
+        self.file = open(report, "ab" if self.resumed else "wb")
+        self._saved_at = self._shown_at = self._start = time.monotonic()
+        self._checked_at_start = self.state["checked"]
+        self._shown = False
+
+    def write(self, findings: List[Finding], current: Optional[str] = None, last: Tuple[str, ...] = ()) -> None:
+        """Append findings to the report and move the checkpoint to the last checked file.
+
+        :param findings: findings of the checked files
+        :param current: collection name of the checked files
+        :param last: parts of the last checked file
+        """
+        for finding in findings:
+            self.file.write(json.dumps(finding._asdict()).encode() + b"\n")
+        counts = Counter(self.state["findings"])
+        counts.update(finding.kind for finding in findings)
+        self.state["findings"] = dict(counts)
+        if current is not None:
+            self.state["current"], self.state["after"] = current, list(last)
+        now = time.monotonic()
+        if now - self._saved_at >= CHECKPOINT_INTERVAL:
+            self.save()
+        if self.progress and now - self._shown_at >= PROGRESS_INTERVAL:
+            self._shown_at, self._shown = now, True
+            rate = (self.state["checked"] - self._checked_at_start) / max(now - self._start, 1e-9)
+            click.echo(
+                f"\rchecking {self.state['current'] or 'collections'}: {self.state['checked']} files, "
+                f"{sum(counts.values())} findings, {rate:.0f} files/s ",
+                nl=False,
+                err=True,
+            )
+
+    def save(self) -> None:
+        """Flush the report and write the checkpoint."""
+        self.file.flush()
+        self.state["report_size"] = self.file.tell()
+        tmp = self.checkpoint.with_suffix(".part")
+        tmp.write_text(json.dumps(self.state))
+        os.replace(tmp, self.checkpoint)
+        self._saved_at = time.monotonic()
+
+    def finish(self) -> None:
+        """Close the report and remove the checkpoint of the finished check."""
+        self.file.close()
+        self.checkpoint.unlink(missing_ok=True)
+        if self._shown:
+            click.echo(err=True)
+
+    def close(self) -> None:
+        """Save the checkpoint of an interrupted check and close the report."""
+        self.save()
+        self.file.close()
+        if self._shown:
+            click.echo(err=True)
+
+
+def _sweep_collection(
+    sweep: _Sweep,
+    collection: "Collection",
+    level: int,
+    submit: Callable[[str, List[str]], Future],
+    pending_limit: int,
+    batch_size: int,
+) -> None:
+    """Check collection files in batches, writing the findings in the walk order.
+
+    :param sweep: report writer
+    :param collection: Collection instance
+    :param level: check level
+    :param submit: function taking collection name and paths and returning a Future of their findings
+    :param pending_limit: max amount of submitted and not yet written batches
+    :param batch_size: amount of files per batch
+    """
+    state = sweep.state
+    after = tuple(state["after"]) if state["current"] == collection.name else ()
+    dirs = _collection_dirs(collection)
+    skip = () if level >= 3 else tuple(name for name, (role, _) in dirs.items() if role == "symlinks")
+    root = Path(collection.arrays._adapter.collection_path)
+    pending: "deque[Tuple[Tuple[str, ...], int, Future]]" = deque()
+
+    def submit_batch(batch: List[Tuple[str, ...]], limit: int) -> None:
+        if batch:
+            pending.append((batch[-1], len(batch), submit(collection.name, ["/".join(item) for item in batch])))
+        # the checkpoint moves only past batches which findings are written, so they are written in order
+        while pending and (len(pending) > limit or pending[0][2].done()):
+            last, size, future = pending.popleft()
+            findings = future.result()
+            state["checked"] += size
+            sweep.write(findings, collection.name, last)
+
+    batch: List[Tuple[str, ...]] = []
+    for parts in iter_files(root, after, skip):
+        batch.append(parts)
+        if len(batch) >= batch_size:
+            submit_batch(batch, pending_limit)
+            batch = []
+    submit_batch(batch, 0)
+
+
+def _make_submit(
+    client: "Client", processes: int, level: int, lock_timeout: float, chunk_bytes: int
+) -> Tuple[Callable[[str, List[str]], Future], Optional[ProcessPoolExecutor]]:
+    """Return function submitting collection files to check and the worker processes pool it uses.
+
+    :param client: Client instance
+    :param processes: number of worker processes, 0 checks in the shell process
+    :param level: check level
+    :param lock_timeout: Client write lock timeout
+    :param chunk_bytes: max chunk size in bytes read at level 4
+    """
+    if processes == 0:
+        loaded: Dict[str, "Collection"] = {}
+
+        def check_now(collection_name: str, paths: List[str]) -> Future:
+            if collection_name not in loaded:
+                loaded[collection_name] = client.get_collection(collection_name)
+            future: Future = Future()
+            future.set_result(check_files(loaded[collection_name], paths, level, lock_timeout, chunk_bytes))
+            return future
+
+        return check_now, None
+
+    from deker_shell.runner import _init_worker
+
+    uri, kwargs = get_client_params(client)
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker, initargs=(uri, kwargs))
+
+    def submit(collection_name: str, paths: List[str]) -> Future:
+        return pool.submit(_check_worker, collection_name, paths, level, lock_timeout, chunk_bytes)
+
+    return submit, pool
+
+
+def check(
+    client: "Client",
+    collection: Union[str, "Collection", None] = None,
+    level: int = 2,
+    report: Union[str, Path] = DEFAULT_REPORT,
+    resume: bool = True,
+    processes: Optional[int] = None,
+    batch_size: int = CHECK_BATCH,
+    progress: bool = True,
+) -> CheckReport:
+    """Check integrity of the local storage or a collection, in parallel worker processes.
+
+    Levels are cumulative:
+
+    1. collections load and have their locks, no orphaned collection locks or files;
+    2. array files are readable, their metadata conforms to the schema and their paths, no orphaned
+       array locks or unexpected files in the collections;
+    3. arrays have valid symlinks, no broken symlinks;
+    4. arrays data is readable to the last chunk.
+
+    Findings are streamed to the report file as JSON lines with collection, path, kind and message.
+    A checkpoint next to the report is updated while the check runs; an interrupted check with the
+    same parameters resumes after the last checked file.
+
+    Example:
+        > check()
+        > check(collection, level=4, report="weather.jsonl")
+
+    :param client: Client instance
+    :param collection: collection or its name to check, the whole storage if None
+    :param level: check level from 1 to 4
+    :param report: report file path
+    :param resume: resume an interrupted check from its checkpoint
+    :param processes: number of worker processes, CPU count if None; 0 checks in the shell process
+    :param batch_size: amount of files checked by a worker process at once
+    :param progress: print progress to stderr
+    """
+    if level not in CHECK_LEVELS:
+        raise ValueError(f"Check level shall be one of {', '.join(map(str, CHECK_LEVELS))}")
+    name = collection if collection is None or isinstance(collection, str) else collection.name
+    if processes is None:
+        processes = os.cpu_count() or 1
+    lock_timeout = get_config(client).write_lock_timeout
+    chunk_bytes = max(min(EXPORT_CHUNK_BYTES, get_memory_limit(client) // max(processes, 1)), 1)
+    report = Path(report)
+    params = {"uri": get_config(client).uri, "collection": name, "level": level}
+    if not params["uri"].startswith("file://"):
+        raise ValueError("Integrity check works with local storages only")
+
+    start = time.perf_counter()
+    names, findings = check_collections(client, name)
+    sweep = _Sweep(report, params, resume, progress)
+    pool = None
+    try:
+        if not sweep.state["listed"]:
+            sweep.write(findings)
+            sweep.state["listed"] = True
+        if level >= 2:
+            submit, pool = _make_submit(client, processes, level, lock_timeout, chunk_bytes)
+            for collection_name in names:
+                if collection_name in sweep.state["done"]:
+                    continue
+                coll = client.get_collection(collection_name)
+                _sweep_collection(sweep, coll, level, submit, processes * 2, batch_size)
+                sweep.state["done"].append(collection_name)
+                sweep.state["current"], sweep.state["after"] = None, []
+                sweep.save()
+    except BaseException:
+        sweep.close()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    sweep.finish()
+    state = sweep.state
+    return CheckReport(
+        str(report), level, len(names), state["checked"], state["findings"], time.perf_counter() - start, sweep.resumed
+    )
+
+
+def check_storage(
+    uri: str, name: Optional[str], level: int, report: str, processes: Optional[int] = None, **kwargs: Any
+) -> int:
+    """Open a client, check the storage or a collection and print the outcome, return exit code.
+
+    The exit code is 1 if there are findings.
+
+    :param uri: uri to Deker storage
+    :param name: collection to check, the whole storage if empty
+    :param level: check level from 1 to 4
+    :param report: report file path
+    :param processes: number of worker processes, CPU count if None
+    :param kwargs: Client parameters
+    """
+    from deker import Client
+
+    with Client(uri, **kwargs) as client:
+        try:
+            result = check(client, name or None, level, report, processes=processes)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    click.echo(repr(result))
+    return int(bool(sum(result.findings.values())))
@@ -0,0 +1,265 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple, Union  # noqa: I101
+
+import numpy as np
+
+from deker_shell.export import chunk_split
+from deker_shell.read_cache import normalize_bounds
+
+
+# normalized bound of one dimension: an index or (start, stop)
+Bound = Union[int, Tuple[int, int]]
+Index = Tuple[Union[int, slice], ...]
+
+
+class Split(NamedTuple):
+    """Pieces a region is split in: ``ranges`` along ``axis`` for each index of the axes before ``outer``.
+
+    Axes between ``outer`` and ``axis`` and after ``axis`` are kept whole; ``axis`` is -1 if the region is
+    not split.
+    """
+
+    bounds: Tuple[Bound, ...]
+    axis: int
+    outer: int
+    ranges: List[Tuple[int, int]]
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of the region with index dimensions of length 1."""
+        return tuple(1 if isinstance(bound, int) else bound[1] - bound[0] for bound in self.bounds)
+
+    @property
+    def pieces(self) -> int:
+        """Amount of pieces."""
+        outer = self.outer
+        return math.prod(self.shape[:outer]) * len(self.ranges) if self.axis >= 0 else 1
+
+    @property
+    def max_cells(self) -> int:
+        """Amount of cells in the biggest piece."""
+        shape, outer, axis = self.shape, self.outer, self.axis
+        if axis < 0:
+            return math.prod(shape)
+        longest = max(stop - start for start, stop in self.ranges)
+        return math.prod(shape[outer:]) // shape[axis] * longest
+
+    def indexes(self) -> Iterator[Index]:
+        """Yield index expressions of the pieces."""
+        whole = tuple(bound if isinstance(bound, int) else slice(*bound) for bound in self.bounds)
+        outer, axis = self.outer, self.axis
+        if axis < 0:
+            yield whole
+            return
+        middle, tail = whole[outer:axis], whole[axis:][1:]
+        for position in np.ndindex(*self.shape[:outer]):
+            head = tuple(
+                bound if isinstance(bound, int) else slice(bound[0] + i, bound[0] + i + 1)
+                for bound, i in zip(self.bounds, position)
+            )
+            for start, stop in self.ranges:
+                yield head + middle + (slice(start, stop),) + tail
+
+
+def resolve_bounds(obj: Any, item: Any = None) -> Tuple[Any, Tuple[Bound, ...]]:
+    """Return Array or VArray and normalized bounds of a subset or of an array index.
+
+    :param obj: Subset, VSubset, Array or VArray
+    :param item: index of Array or VArray, the whole array if None
+    """
+    array = getattr(obj, "_BaseSubset__array", None)
+    if array is not None:
+        item = obj.bounds
+    else:
+        array = obj
+        item = array._get_fancy_item(item) if item is not None else ...
+    return array, normalize_bounds(item, tuple(array.shape))  # type: ignore[return-value]
+
+
+def split_bounds(
+    bounds: Tuple[Bound, ...],
+    itemsize: int,
+    max_bytes: int,
+    align: Optional[Tuple[int, ...]] = None,
+    along: Optional[int] = None,
+) -> Split:
+    """Split bounds into pieces of at most max_bytes if possible.
+
+    The innermost axes are kept whole and the region is split along the outermost axis that doesn't fit,
+    or only along ``along`` keeping all the other axes whole. Pieces borders are aligned to ``align``
+    multiples, storage chunks or VArray arrays shape, so that no chunk is decoded or file opened twice.
+
+    :param bounds: normalized bounds
+    :param itemsize: dtype itemsize
+    :param max_bytes: max piece size in bytes
+    :param align: shape to align pieces borders to
+    :param along: axis to split along
+    """
+    shape = tuple(1 if isinstance(bound, int) else bound[1] - bound[0] for bound in bounds)
+    if along is None:
+        axis, step = chunk_split(shape, itemsize, max_bytes)
+        outer = max(axis, 0)
+    else:
+        axis, outer = along, 0
+        step = max_bytes * shape[axis] // (math.prod(shape) * itemsize)
+        if step < 1:
+            raise ValueError(
+                f"One index along axis {along} is {math.prod(shape) // shape[axis] * itemsize} bytes, "
+                f"more than {max_bytes} bytes"
+            )
+    bound = bounds[axis] if axis >= 0 else 0
+    if isinstance(bound, int):
+        return Split(bounds, -1, 0, [])
+    ranges, start = [], bound[0]
+    while start < bound[1]:
+        stop = start + step
+        if align is not None and stop - stop % align[axis] > start:
+            stop -= stop % align[axis]
+        ranges.append((start, min(stop, bound[1])))
+        start = stop
+    return Split(bounds, axis, outer, ranges)
+
+
+class Block(NamedTuple):
+    """Piece of the iterated subset: its index in the array and its data."""
+
+    bounds: Index
+    data: Any
+
+
+def _read_direct(adapter: Any, array: Any, bounds: Index, out: np.ndarray) -> None:
+    """Read array data into out, as deker reads it, without allocating it.
+
+    :param adapter: local array adapter
+    :param array: Array instance
+    :param bounds: index of slices
+    :param out: C-contiguous buffer of bounds shape
+    """
+    import h5py
+
+    with h5py.File(adapter._get_main_path_to_file(array), "r", locking=False) as f:
+        dataset = f.get("data")
+        if dataset is None:
+            out[...] = array.fill_value
+        else:
+            dataset.read_direct(out, bounds)
+
+
+def get_direct_reader(array: Any) -> Optional[Any]:
+    """Return function reading array data into a buffer under deker read lock, None if it isn't supported.
+
+    Only Arrays of local storage are read directly; VArrays and other storages are read by deker.
+    Direct reads don't go through deker Subset, so they are added to the installed ``IOCounters``
+    themselves and traced as ``chunks._read_direct`` spans.
+
+    :param array: Array or VArray instance
+    """
+    adapter = getattr(array, "_BaseArray__adapter", None)
+    if type(adapter).__name__ != "LocalArrayAdapter":
+        return None
+
+    from deker.locks import ReadArrayLock
+    from deker.tools.decorators import check_ctx_state
+
+    from deker_shell.telemetry import get_io_counters
+
+    locked = check_ctx_state(ReadArrayLock()(_read_direct))
+
+    def read(bounds: Index, out: np.ndarray) -> None:
+        start = time.perf_counter()
+        locked(adapter, array, bounds, out)
+        counters = get_io_counters()
+        if counters is not None:
+            counters.add(read_bytes=out.nbytes, read_time=time.perf_counter() - start)
+
+    return read
+
+
+def iter_chunks(
+    obj: Any,
+    item: Any = None,
+    max_bytes: int = 0,
+    along: Optional[Union[int, str]] = None,
+    prefetch: bool = True,
+) -> Iterator[Block]:
+    """Iterate over a subset in blocks fitting the memory limit, reading the next block in background.
+
+    Blocks borders are aligned to storage chunks (VArray arrays for virtual arrays). Arrays of local storages
+    are read into two preallocated buffers used in turns, so a block data is valid until the next block is
+    taken: copy it to keep it. VArrays are read by deker, allocating new arrays.
+
+    Example:
+        > total = 0
+        > for bounds, data in iter_chunks(array[:, 0]):
+        >     total += data.sum()
+        > means = [data.mean(axis=1) for _, data in iter_chunks(varray, along="time")]
+
+    :param obj: Subset, VSubset, Array or VArray
+    :param item: index of Array or VArray, the whole array if None
+    :param max_bytes: max block size in bytes, the memory limit divided by the blocks in memory if 0
+    :param along: dimension name or axis to split along, keeping the others whole; the outermost axes
+      that don't fit are split if None
+    :param prefetch: read the next block on a background thread while the current one is processed
+    """
+    from deker_shell.explain import get_read_limit, get_storage_chunks
+
+    array, bounds = resolve_bounds(obj, item)
+    dtype = np.dtype(array.dtype)
+    if isinstance(along, str):
+        names = [dimension.name for dimension in array.dimensions]
+        if along not in names:
+            raise ValueError(f"No dimension {along} in {names}")
+        along = names.index(along)
+    read_direct = get_direct_reader(array)
+    in_memory = 2 if prefetch else 1
+    if read_direct is not None:
+        align = get_storage_chunks(array)[1]
+    else:
+        align = tuple(array.arrays_shape) if hasattr(array, "arrays_shape") else None
+    split = split_bounds(bounds, dtype.itemsize, max_bytes or max(get_read_limit(array) // in_memory, 1), align, along)
+
+    buffers = [np.empty(split.max_cells, dtype) for _ in range(in_memory)] if read_direct is not None else []
+
+    def read(index: Index, number: int) -> Block:
+        if read_direct is None:
+            return Block(index, array[index].read())
+        slices = tuple(slice(i, i + 1) if isinstance(i, int) else i for i in index)
+        shape = tuple(s.stop - s.start for s in slices)
+        out = buffers[number % len(buffers)][: math.prod(shape)].reshape(shape)
+        read_direct(slices, out)
+        return Block(index, out.reshape(tuple(s.stop - s.start for s in index if isinstance(s, slice))))
+
+    pieces = enumerate(split.indexes())
+    if not prefetch:
+        for number, index in pieces:
+            yield read(index, number)
+        return
+    # leaving the executor waits for the read in flight, so no buffer is written after the iteration stops
+    with ThreadPoolExecutor(1, thread_name_prefix="deker-shell-chunks") as executor:
+        pending: Optional[Future] = None
+        for number, index in pieces:
+            future = executor.submit(read, index, number)
+            if pending is not None:
+                yield pending.result()
+            pending = future
+        if pending is not None:
+            yield pending.result()
@@ -0,0 +1,260 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple, Union  # noqa: I101
+
+import numpy as np
+
+from deker_shell.export import EXPORT_CHUNK_BYTES, ByteBudget, iter_chunk_bounds  # noqa: I101
+from deker_shell.ingest import retry_locked
+from deker_shell.profiling import format_bytes, format_time
+from deker_shell.utils import get_config, get_memory_limit, get_workers
+
+
+if TYPE_CHECKING:
+    from deker import Array, Client, Collection, VArray
+
+
+class CopyReport(NamedTuple):
+    """Copy outcome."""
+
+    copied: int
+    skipped: int
+    bytes: int
+    time: float
+    errors: List[Tuple[str, str]]
+
+    def __repr__(self) -> str:
+        speed = self.bytes / self.time if self.time > 0 else 0.0
+        text = (
+            f"copied {self.copied} arrays, skipped {self.skipped} already existing, "
+            f"{format_bytes(self.bytes)} in {format_time(self.time)} ({format_bytes(speed)}/s)"
+        )
+        for array_id, error in self.errors:
+            text += f"\nfailed {array_id}: {error}"
+        return text
+
+
+def _copy_array(
+    array: Union["Array", "VArray"],
+    dst: "Collection",
+    budget: ByteBudget,
+    chunk_bytes: int,
+    retry: Tuple[float, float],
+) -> Optional[int]:
+    """Create array with the same id and attributes in dst and stream its data chunk by chunk.
+
+    Returns amount of bytes copied, None if dst already has the array.
+
+    :param array: source Array or VArray
+    :param dst: destination collection
+    :param budget: in-flight bytes budget shared by all the workers
+    :param chunk_bytes: max chunk size in bytes
+    :param retry: destination write lock timeout and check interval
+    """
+    if dst.filter({"id": str(array.id)}).last() is not None:
+        return None
+    primary = dict(array.primary_attributes) or None
+    custom = dict(array.custom_attributes or {}) or None
+    target = retry_locked(lambda: dst.create(primary, custom, str(array.id)), *retry)
+    dtype = np.dtype(array.dtype)
+    try:
+        for bounds in iter_chunk_bounds(tuple(array.shape), dtype.itemsize, chunk_bytes):
+            size = int(np.prod([bound.stop - bound.start for bound in bounds], dtype=np.int64)) * dtype.itemsize
+            budget.acquire(size)
+            try:
+                data = array[bounds].read()
+                retry_locked(lambda: target[bounds].update(data), *retry)  # noqa: B023
+            finally:
+                budget.release(size)
+    except Exception:
+        # don't leave a partially copied array behind, so that the copy can be repeated
+        target.delete()
+        raise
+    return int(np.prod(array.shape, dtype=np.int64)) * dtype.itemsize
+
+
+def copy_collection(
+    collection: "Collection",
+    dst_client: "Client",
+    name: Optional[str] = None,
+    workers: int = 0,
+    memory_limit: int = 0,
+) -> CopyReport:
+    """Copy collection arrays to another storage, several arrays at a time, without staging them on disk.
+
+    The destination collection is created with the same schema and options if it doesn't exist.
+    Arrays keep their ids and attributes; arrays already present in the destination are skipped,
+    so an interrupted copy can be repeated.
+
+    :param collection: source Collection
+    :param dst_client: destination Client
+    :param name: destination collection name, the source one by default
+    :param workers: number of arrays copied concurrently, source Client workers if 0
+    :param memory_limit: max amount of bytes read and not yet written at once, the smaller Client memory limit if 0
+    """
+    name = name or collection.name
+    dst = dst_client.get_collection(name)
+    if dst is None:
+        schema = collection.varray_schema or collection.array_schema
+        dst = dst_client.create_collection(name, schema, collection.options)
+    workers = workers or get_workers(collection)
+    memory_limit = memory_limit or min(get_memory_limit(collection), get_memory_limit(dst_client))
+    chunk_bytes = max(min(EXPORT_CHUNK_BYTES, memory_limit // workers), 1)
+    budget = ByteBudget(memory_limit)
+    config = get_config(dst_client)
+    retry = (config.write_lock_timeout, config.write_lock_check_interval)
+
+    start = time.perf_counter()
+    copied, skipped, total_bytes = 0, 0, 0
+    errors: List[Tuple[str, str]] = []
+    with ThreadPoolExecutor(workers, thread_name_prefix="copy") as pool:
+        pending: Dict[Future, str] = {}
+
+        def collect(futures: Set[Future]) -> None:
+            nonlocal copied, skipped, total_bytes
+            for future in futures:
+                array_id = pending.pop(future)
+                try:
+                    size = future.result()
+                except Exception as e:
+                    errors.append((array_id, f"{type(e).__name__}: {e}"))
+                    continue
+                if size is None:
+                    skipped += 1
+                else:
+                    copied += 1
+                    total_bytes += size
+
+        for array in collection:
+            # keep the amount of pending arrays bounded for huge collections
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending[pool.submit(_copy_array, array, dst, budget, chunk_bytes, retry)] = str(array.id)
+        collect(wait(pending).done)
+    return CopyReport(copied, skipped, total_bytes, time.perf_counter() - start, errors)
+
+
+class ClientRegistry(Mapping):
+    """Named storages of the session, each connected on first access.
+
+    There is one Client per uri, so http connection pools are reused by all the names of a server;
+    all the clients, except the adopted ones, share one thread pool and are closed with the registry.
+
+    Example:
+        > clients  # names, uris and connection state
+        > clients["remote"].get_collection("weather")
+        > copy(clients["remote"].get_collection("weather"), "default")
+
+    :param uris: storages uris by name
+    :param kwargs: Client parameters
+    """
+
+    def __init__(self, uris: Optional[Dict[str, str]] = None, **kwargs: Any) -> None:
+        self.uris: Dict[str, str] = dict(uris or {})
+        self.kwargs = kwargs
+        self._clients: Dict[str, "Client"] = {}
+        self._adopted: Set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = Lock()
+
+    def add(self, name: str, uri: str) -> None:
+        """Register storage without connecting to it.
+
+        :param name: storage name
+        :param uri: storage uri
+        """
+        self.uris[name] = uri
+
+    def adopt(self, name: str, client: "Client") -> None:
+        """Register already opened client, which is not closed by the registry.
+
+        :param name: storage name
+        :param client: Client instance
+        """
+        uri = get_config(client).uri
+        self.uris[name] = uri
+        self._clients[uri] = client
+        self._adopted.add(uri)
+
+    def __getitem__(self, name: str) -> "Client":
+        uri = self.uris[name]
+        with self._lock:
+            if uri not in self._clients:
+                from deker import Client
+
+                if self._executor is None:
+                    workers = self.kwargs.get("workers") or get_workers()
+                    self._executor = ThreadPoolExecutor(int(workers), thread_name_prefix="deker-clients")
+                self._clients[uri] = Client(uri, executor=self._executor, **self.kwargs)
+            return self._clients[uri]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.uris)
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+    def is_connected(self, name: str) -> bool:
+        """Check if storage client is open.
+
+        :param name: storage name
+        """
+        client = self._clients.get(self.uris[name])
+        return client is not None and not client.is_closed
+
+    def copy(
+        self,
+        collection: "Collection",
+        dst: Union[str, "Client"],
+        name: Optional[str] = None,
+        workers: int = 0,
+        memory_limit: int = 0,
+    ) -> CopyReport:
+        """Copy collection arrays to another storage in parallel, streaming them chunk by chunk.
+
+        :param collection: source Collection
+        :param dst: destination storage name or Client
+        :param name: destination collection name, the source one by default
+        :param workers: number of arrays copied concurrently, source Client workers if 0
+        :param memory_limit: max amount of bytes in flight, the smaller Client memory limit if 0
+        """
+        dst_client = self[dst] if isinstance(dst, str) else dst
+        return copy_collection(collection, dst_client, name, workers, memory_limit)
+
+    def close(self) -> None:
+        """Close all the clients opened by the registry and their thread pool."""
+        with self._lock:
+            for uri, client in self._clients.items():
+                if uri not in self._adopted and not client.is_closed:
+                    client.close()
+            self._clients = {uri: client for uri, client in self._clients.items() if uri in self._adopted}
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def __repr__(self) -> str:
+        lines = [
+            f"{name}: {uri} ({'connected' if self.is_connected(name) else 'not connected'})"
+            for name, uri in self.uris.items()
+        ]
+        return "\n".join(lines) or "no storages"
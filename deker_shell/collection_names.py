@@ -0,0 +1,172 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+
+from bisect import bisect_left
+from itertools import islice
+from threading import RLock
+from typing import TYPE_CHECKING, Iterator, List, Optional, Union  # noqa: I101
+
+
+if TYPE_CHECKING:
+    from deker import Client
+
+
+def iter_collection_names(client: "Client") -> Iterator[str]:
+    """Yield collection names without building Collection objects.
+
+    Client iteration instantiates every collection from its metadata, so the names are read
+    from the collection adapter metadata directly when it is available.
+
+    :param client: Client instance
+    """
+    adapter = getattr(client, "_Client__adapter", None)
+    if adapter is None:
+        for coll in client:
+            yield coll.name
+        return
+
+    for meta in adapter:
+        yield meta["name"]
+
+
+class CollectionNames:
+    """Lazy, paged and cached view of the storage collection names.
+
+    Names are fetched on demand in pages of ``page_size`` and kept for ``ttl`` seconds,
+    after which the next access starts over from the storage.
+    """
+
+    def __init__(self, client: "Client", page_size: int = 100, ttl: Optional[float] = 60.0) -> None:
+        if page_size <= 0:
+            raise ValueError("page_size shall be a positive integer")
+        self.client = client
+        self.page_size = page_size
+        self.ttl = ttl
+        self._lock = RLock()
+        self._names: List[str] = []
+        self._sorted: Optional[List[str]] = None
+        self._iterator: Optional[Iterator[str]] = None
+        self._exhausted = False
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """Check if all the names have been fetched from the storage."""
+        return self._exhausted and not self._is_expired()
+
+    def _is_expired(self) -> bool:
+        return self.ttl is not None and self._loaded_at is not None and time.monotonic() - self._loaded_at > self.ttl
+
+    def refresh(self) -> None:
+        """Drop cached names; they will be fetched again on the next access."""
+        with self._lock:
+            self._names = []
+            self._sorted = None
+            self._iterator = None
+            self._exhausted = False
+            self._loaded_at = None
+
+    def _fetch_page(self) -> bool:
+        """Fetch the next page of names; return False if the storage is exhausted."""
+        if self._exhausted:
+            return False
+        if self._iterator is None:
+            self._iterator = iter_collection_names(self.client)
+            self._loaded_at = time.monotonic()
+        page = list(islice(self._iterator, self.page_size))
+        self._names.extend(page)
+        self._sorted = None
+        if len(page) < self.page_size:
+            self._exhausted = True
+            self._iterator = None
+        return bool(page)
+
+    def _ensure(self, size: Optional[int] = None) -> None:
+        """Fetch pages until ``size`` names are cached, or all of them if ``size`` is None.
+
+        :param size: required amount of cached names
+        """
+        with self._lock:
+            if self._is_expired():
+                self.refresh()
+            while size is None or len(self._names) < size:
+                if not self._fetch_page():
+                    break
+
+    def __len__(self) -> int:
+        self._ensure()
+        return len(self._names)
+
+    def __iter__(self) -> Iterator[str]:
+        self._ensure(0)
+        index = 0
+        while True:
+            self._ensure(index + 1)
+            if index >= len(self._names):
+                return
+            yield self._names[index]
+            index += 1
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(item, slice):
+            start, stop, step = item.start, item.stop, item.step
+            if any(i is not None and i < 0 for i in (start, stop)) or stop is None or (step or 1) < 0:
+                self._ensure()
+            else:
+                self._ensure(max(start or 0, stop))
+        elif item < 0:
+            self._ensure()
+        else:
+            self._ensure(item + 1)
+        return self._names[item]
+
+    def __contains__(self, name: object) -> bool:
+        if name in self._names and not self._is_expired():
+            return True
+        self._ensure()
+        return name in self._names
+
+    def startswith(self, prefix: str) -> List[str]:
+        """Return sorted collection names starting with prefix.
+
+        :param prefix: collection name prefix
+        """
+        self._ensure()
+        with self._lock:
+            if self._sorted is None:
+                self._sorted = sorted(self._names)
+            names = self._sorted
+        result = []
+        for name in islice(names, bisect_left(names, prefix), None):
+            if not name.startswith(prefix):
+                break
+            result.append(name)
+        return result
+
+    def __repr__(self) -> str:
+        self._ensure(self.page_size)
+        if self._exhausted:
+            return repr(self._names)
+        return repr(self._names)[:-1] + ", ...]"
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, CollectionNames):
+            other = list(other)
+        return list(self) == other
+
+    __hash__ = None  # type: ignore
@@ -14,27 +14,193 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-from typing import Any, Callable, Dict, Iterable
+import re
+import time
 
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from deker import Collection
+from deker.ABC.base_array import BaseArray
 from deker.types.private.shell import shell_completions
 from prompt_toolkit.completion import CompleteEvent, Completer, Completion
 from prompt_toolkit.document import Document
 from ptpython.completer import PythonCompleter, _get_style_for_jedi_completion
 from ptpython.utils import get_jedi_script_from_document
 
+from deker_shell.collection_names import CollectionNames
+
+
+_identifier_before_cursor = re.compile(r"\w*$")
+
+# use("name or client.get_collection("name
+_collection_name_arg = re.compile(
+    r"""(?:^|[^\w.])use\(\s*(?:name\s*=\s*)?["'](?P<prefix>[^"']*)$|"""
+    r"""\.get_collection\(\s*(?:name\s*=\s*)?["'](?P<get_prefix>[^"']*)$"""
+)
+# key of a dict literal passed to filter, create or update_custom_attributes
+_attributes_dict_key = re.compile(
+    r"""(?P<expr>[\w.]*get_collection\(\s*["'][^"']+["']\s*\)|[\w.]+)"""
+    r"""\.(?P<method>filter|create|update_custom_attributes)\(\s*(?:(?P<kwarg>\w+)\s*=\s*)?\{"""
+    r"""(?:[^{}]*,)?\s*["'](?P<prefix>\w*)$"""
+)
+_get_collection_expr = re.compile(r"""get_collection\(\s*["'](?P<name>[^"']+)["']\s*\)$""")
+
+
+class Candidate(NamedTuple):
+    """Jedi completion data needed to build a prompt toolkit completion."""
+
+    name: str
+    type: str
+    style: str
+    # characters before the identifier under the cursor replaced by the completion, like an opening quote
+    offset: int = 0
+
+    def matches(self, text: str, prefix_length: int) -> bool:
+        """Check if the completion starts with the text it replaces.
+
+        :param text: input before the cursor
+        :param prefix_length: length of the identifier under the cursor
+        """
+        start = max(len(text) - prefix_length - self.offset, 0)
+        return self.name.lower().startswith(text[start:].lower())
+
+
+class CompletionCache:
+    """LRU cache of jedi candidates.
+
+    Entries are keyed by the input with the identifier under the cursor cut off and by the
+    namespace version, and keep the identifier prefix they were computed for. Any longer
+    prefix of the same identifier is served by filtering the cached candidates by the text
+    they replace.
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Tuple[str, str, int], Tuple[str, List[Candidate]]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Tuple[str, str, int], prefix: str) -> Optional[List[Candidate]]:
+        """Return cached candidates matching prefix or None.
+
+        :param key: input before the identifier, input after the cursor and namespace version
+        :param prefix: identifier before the cursor
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not prefix.startswith(entry[0]):
+                return None
+            self._entries.move_to_end(key)
+        if prefix == entry[0]:
+            return entry[1]
+        text = key[0] + prefix
+        return [candidate for candidate in entry[1] if candidate.matches(text, len(prefix))]
+
+    def set(self, key: Tuple[str, str, int], prefix: str, candidates: List[Candidate]) -> None:
+        """Store candidates computed for prefix.
+
+        :param key: input before the identifier, input after the cursor and namespace version
+        :param prefix: identifier before the cursor
+        :param candidates: jedi candidates
+        """
+        with self._lock:
+            self._entries[key] = (prefix, candidates)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all the entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
 
 class JediCompleter(Completer):
-    """Overrided ptpython jedi completer."""
+    """Overrided ptpython jedi completer.
+
+    Completions are computed in the ptpython completion thread. Jedi results are memoized in
+    ``cache`` until the namespace changes, requests made while typing are debounced for
+    ``debounce`` seconds and dropped as soon as a newer request arrives.
+    """
 
     def __init__(
         self,
         get_globals: Callable[[], Dict[str, Any]],
         get_locals: Callable[[], Dict[str, Any]],
+        cache_size: int = 128,
+        debounce: float = 0.05,
     ) -> None:
         super().__init__()
 
         self.get_globals = get_globals
         self.get_locals = get_locals
+        self.cache = CompletionCache(cache_size)
+        self.debounce = debounce
+        self.namespace_version = 0
+        self._generation = 0
+        self._lock = Lock()
+
+    def invalidate(self) -> None:
+        """Bump namespace version, making cached completions stale.
+
+        Shall be called after every statement executed in the REPL.
+        """
+        with self._lock:
+            self.namespace_version += 1
+        self.cache.clear()
+
+    def _is_stale(self, generation: int) -> bool:
+        return generation != self._generation
+
+    def _get_candidates(self, document: Document) -> Optional[List[Candidate]]:
+        """Run jedi and return sorted candidates or None on jedi failure.
+
+        :param document: user input
+        """
+        script = get_jedi_script_from_document(document, self.get_locals(), self.get_globals())
+        if not script:
+            return None
+        try:
+            jedi_completions = [
+                completion
+                for completion in script.complete(
+                    column=document.cursor_position_col,
+                    line=document.cursor_position_row + 1,
+                )
+                if not completion.name.startswith(("_", "__", "mro"))
+            ]  # hide private and magic methods
+        except Exception:
+            # Supress all Jedi exceptions.
+            return None
+
+        # Move function parameters to the top.
+        jedi_completions = sorted(
+            jedi_completions,
+            key=lambda jc: (
+                # Params first.
+                jc.type != "param",
+                # non builtins libs first
+                not jc.module_name.startswith("jedi"),
+                # Private at the end.
+                jc.name.startswith("_"),
+                # Then sort by name.
+                jc.name_with_symbols.lower(),
+            ),
+        )
+        prefix = _identifier_before_cursor.search(document.text_before_cursor).group()  # type: ignore[union-attr]
+        return [
+            Candidate(
+                jc.name_with_symbols,
+                jc.type,
+                _get_style_for_jedi_completion(jc),
+                jc.get_completion_prefix_length() - len(prefix),
+            )
+            for jc in jedi_completions
+        ]
 
     def get_completions(self, document: Document, complete_event: CompleteEvent) -> Iterable[Completion]:
         """Yields prompt toolkit completions.
@@ -42,67 +208,262 @@ class JediCompleter(Completer):
         :param document: user input
         :param complete_event: event that called the completer
         """
-        script = get_jedi_script_from_document(document, self.get_locals(), self.get_globals())
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            version = self.namespace_version
 
-        if script:
-            try:
-                jedi_completions = [
-                    completion
-                    for completion in script.complete(
-                        column=document.cursor_position_col,
-                        line=document.cursor_position_row + 1,
-                    )
-                    if not completion.name.startswith(("_", "__", "mro"))
-                ]  # hide private and magic methods
-            except Exception:
-                # Supress all Jedi exceptions.
-                pass
+        text_before_cursor = document.text_before_cursor
+        prefix = _identifier_before_cursor.search(text_before_cursor).group()  # type: ignore[union-attr]
+        key = (text_before_cursor[: len(text_before_cursor) - len(prefix)], document.text_after_cursor, version)
+
+        candidates = self.cache.get(key, prefix)
+        if candidates is None:
+            if self.debounce and not complete_event.completion_requested:
+                time.sleep(self.debounce)
+                if self._is_stale(generation):
+                    return
+            candidates = self._get_candidates(document)
+            if candidates is None:
+                return
+            self.cache.set(key, prefix, candidates)
+
+        params_only = any(deker_obj in document.text for deker_obj in shell_completions)
+        for candidate in candidates:
+            if self._is_stale(generation):
+                return
+            if params_only and candidate.type != "param":
+                continue
+            if candidate.type == "function":
+                suffix = "()"
             else:
-                # Move function parameters to the top.
-                jedi_completions = sorted(
-                    jedi_completions,
-                    key=lambda jc: (
-                        # Params first.
-                        jc.type != "param",
-                        # non builtins libs first
-                        not jc.module_name.startswith("jedi"),
-                        # Private at the end.
-                        jc.name.startswith("_"),
-                        # Then sort by name.
-                        jc.name_with_symbols.lower(),
-                    ),
-                )
-                for jc in jedi_completions:
-                    if any(deker_obj in document.text for deker_obj in shell_completions) and jc.type != "param":
-                        continue
-                    if jc.type == "function":
-                        suffix = "()"
-                    else:
-                        suffix = ""
-
-                    if jc.type == "param":
-                        suffix = "..."
-
-                    yield Completion(
-                        jc.name_with_symbols,
-                        len(jc.complete) - len(jc.name_with_symbols),
-                        display=jc.name_with_symbols + suffix,
-                        display_meta=jc.type,
-                        style=_get_style_for_jedi_completion(jc),
-                    )
+                suffix = ""
+
+            if candidate.type == "param":
+                suffix = "..."
+
+            yield Completion(
+                candidate.name,
+                -len(prefix) - candidate.offset,
+                display=candidate.name + suffix,
+                display_meta=candidate.type,
+                style=candidate.style,
+            )
+
+
+class SchemaEntry(NamedTuple):
+    """Collection metadata used for completions."""
+
+    primary_attributes: Tuple[str, ...]
+    custom_attributes: Tuple[str, ...]
+
+    @classmethod
+    def from_collection(cls, collection: Collection) -> "SchemaEntry":
+        """Build entry from collection schema.
+
+        :param collection: deker collection
+        """
+        schema = collection.varray_schema or collection.array_schema
+        return cls(
+            tuple(attr.name for attr in schema.attributes if attr.primary),
+            tuple(attr.name for attr in schema.attributes if not attr.primary),
+        )
+
+
+class SchemaIndex:
+    """In-memory index of collection names and collection schemas.
+
+    Collection names are served by the ``collections`` view of the shell namespace. Schema entries
+    are added one collection at a time, when a collection is first completed or met in the namespace,
+    and are kept until ``refresh``.
+    """
+
+    def __init__(self, get_globals: Callable[[], Dict[str, Any]], get_locals: Callable[[], Dict[str, Any]]) -> None:
+        self.get_globals = get_globals
+        self.get_locals = get_locals
+        self._entries: Dict[str, SchemaEntry] = {}
+        self._names: Optional[CollectionNames] = None
+
+    def lookup(self, name: str) -> Any:
+        """Find variable in the REPL namespace.
+
+        :param name: variable name
+        """
+        locals_ = self.get_locals()
+        if name in locals_:
+            return locals_[name]
+        return self.get_globals().get(name)
+
+    @property
+    def names(self) -> Optional[CollectionNames]:
+        """Collection names view."""
+        collections = self.lookup("collections")
+        if isinstance(collections, CollectionNames):
+            return collections
+        client = self.lookup("client")
+        if client is None:
+            return None
+        if self._names is None or self._names.client is not client:
+            self._names = CollectionNames(client)
+        return self._names
+
+    def collection_names(self, prefix: str) -> List[str]:
+        """Return collection names starting with prefix.
+
+        :param prefix: collection name prefix
+        """
+        names = self.names
+        return names.startswith(prefix) if names is not None else []
+
+    def update(self, collection: Collection) -> SchemaEntry:
+        """Add or replace collection entry.
+
+        :param collection: deker collection
+        """
+        entry = self._entries[collection.name] = SchemaEntry.from_collection(collection)
+        return entry
+
+    def get(self, name: str) -> Optional[SchemaEntry]:
+        """Return collection entry, reading collection metadata from storage on the first request.
+
+        :param name: collection name
+        """
+        entry = self._entries.get(name)
+        if entry is not None:
+            return entry
+        client = self.lookup("client")
+        if client is None:
+            return None
+        try:
+            collection = client.get_collection(name)
+        except Exception:
+            return None
+        return self.update(collection) if collection is not None else None
+
+    def refresh(self) -> None:
+        """Drop all the entries and cached collection names."""
+        self._entries.clear()
+        names = self.names
+        if names is not None:
+            names.refresh()
+
+
+class DekerCompleter(Completer):
+    """Completer of deker storage metadata served from ``SchemaIndex`` without jedi.
+
+    Completes collection names in ``use("...")`` and ``get_collection("...")`` calls and attribute
+    names in dict keys of ``filter({...})``, ``create({...})`` and ``update_custom_attributes({...})``.
+    """
+
+    def __init__(self, index: SchemaIndex) -> None:
+        super().__init__()
+        self.index = index
+
+    def _resolve_collection_name(self, expr: str) -> Optional[str]:
+        """Return collection name of a collection, array manager or array expression.
+
+        :param expr: dotted variable name or get_collection call
+        """
+        match = _get_collection_expr.search(expr)
+        if match:
+            return match.group("name")
+
+        names = expr.split(".")
+        if names[-1] in ("arrays", "varrays"):
+            names.pop()
+        obj = self.index.lookup(names[0])
+        try:
+            for name in names[1:]:
+                obj = getattr(obj, name)
+        except Exception:
+            return None
+        if isinstance(obj, Collection):
+            self.index.update(obj)
+            return obj.name
+        if isinstance(obj, BaseArray):
+            return obj.collection
+        return None
+
+    def _get_attributes(self, match: "re.Match") -> List[Tuple[str, str]]:
+        """Return attribute names with their kind for the dict key context.
+
+        :param match: dict key regex match
+        """
+        name = self._resolve_collection_name(match.group("expr"))
+        entry = self.index.get(name) if name else None
+        if entry is None:
+            return []
+
+        method, kwarg = match.group("method"), match.group("kwarg")
+        primary = [(attr, "primary attribute") for attr in entry.primary_attributes]
+        custom = [(attr, "custom attribute") for attr in entry.custom_attributes]
+        if method == "filter":
+            return [("id", "array id")] + primary
+        if method == "update_custom_attributes" or kwarg == "custom_attributes":
+            return custom
+        return primary
+
+    def get_completions(self, document: Document, complete_event: CompleteEvent) -> Iterable[Completion]:
+        """Yields prompt toolkit completions.
+
+        :param document: user input
+        :param complete_event: event that called the completer
+        """
+        text = document.current_line_before_cursor
+
+        match = _collection_name_arg.search(text)
+        if match:
+            prefix = match.group("prefix") if match.group("prefix") is not None else match.group("get_prefix")
+            for name in self.index.collection_names(prefix):
+                yield Completion(name, -len(prefix), display_meta="collection")
+            return
+
+        match = _attributes_dict_key.search(text)
+        if match:
+            prefix = match.group("prefix")
+            for name, kind in self._get_attributes(match):
+                if name.startswith(prefix):
+                    yield Completion(name, -len(prefix), display_meta=kind)
+
+
+class ReplCompleter(PythonCompleter):
+    """Ptpython completer trying deker metadata completions before dictionary, path and jedi ones."""
+
+    def __init__(
+        self,
+        get_globals: Callable[[], Dict[str, Any]],
+        get_locals: Callable[[], Dict[str, Any]],
+        enable_dictionary_completion: Callable[[], bool],
+    ) -> None:
+        super().__init__(get_globals, get_locals, enable_dictionary_completion)
+        self.schema_index = SchemaIndex(get_globals, get_locals)
+        self._deker_completer = DekerCompleter(self.schema_index)
+
+    def get_completions(self, document: Document, complete_event: CompleteEvent) -> Iterable[Completion]:
+        """Yields prompt toolkit completions.
+
+        :param document: user input
+        :param complete_event: event that called the completer
+        """
+        found = False
+        for completion in self._deker_completer.get_completions(document, complete_event):
+            found = True
+            yield completion
+        if not found:
+            yield from super().get_completions(document, complete_event)
 
 
 def get_repl_completer(
     get_globals: Callable, get_locals: Callable, enable_dictionary_completion: bool
 ) -> PythonCompleter:
-    """Return repl completer with custom jedi completer.
+    """Return repl completer with deker metadata completer and custom jedi completer.
 
     :param get_globals: function returning globals
     :param get_locals: function returning locals
     :param enable_dictionary_completion: repl flag
     """
     jedi_completer = JediCompleter(get_globals, get_locals)
-    repl_completer = PythonCompleter(
+    repl_completer = ReplCompleter(
         get_globals,
         get_locals,
         lambda: enable_dictionary_completion,
@@ -14,20 +14,63 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+from typing import Any, Optional
+
+from prompt_toolkit.filters import is_done
 from prompt_toolkit.formatted_text import AnyFormattedText
+from prompt_toolkit.layout import ConditionalContainer, FormattedTextControl, HSplit, Window
 from ptpython.prompt_style import PromptStyle
 from ptpython.repl import PythonRepl
 
-from deker_shell.completer import get_repl_completer
+from deker_shell.completer import JediCompleter, get_repl_completer
+from deker_shell.rendering import render_results
+from deker_shell.telemetry import Telemetry, wrap_eval
+
+
+def invalidate_completions_after_eval(repl: PythonRepl) -> None:
+    """Bump jedi completer namespace version after every statement executed in the REPL.
+
+    :param repl: ptpyton repl
+    """
+    jedi_completer = getattr(repl.completer, "_jedi_completer", None)
+    if not isinstance(jedi_completer, JediCompleter):
+        return
+    eval_async = repl.eval_async
+
+    async def eval_and_invalidate(line: str) -> Any:
+        try:
+            return await eval_async(line)
+        finally:
+            jedi_completer.invalidate()
+
+    repl.eval_async = eval_and_invalidate  # type: ignore
+
+
+def add_telemetry_toolbar(repl: PythonRepl, telemetry: Telemetry) -> None:
+    """Record statements stats and show them in a toolbar above the ptpython status bar.
+
+    :param repl: ptpyton repl
+    :param telemetry: session telemetry
+    """
+    repl.eval_async = wrap_eval(telemetry, repl.eval_async)  # type: ignore
+    toolbar = ConditionalContainer(
+        Window(FormattedTextControl(lambda: [("class:status-toolbar", telemetry.toolbar_text())]), height=1),
+        filter=~is_done,
+    )
+    root = repl.ptpython_layout.root_container
+    if isinstance(root, HSplit):
+        # the last child is the status bar
+        root.children.insert(len(root.children) - 1, toolbar)
 
 
-def configure(repl: PythonRepl) -> None:
+def configure(repl: PythonRepl, telemetry: Optional[Telemetry] = None) -> None:
     """Ptpython REPL config.
 
     Ptpython version 3.0.23
     https://github.com/prompt-toolkit/ptpython/blob/master/examples/python-embed-with-custom-prompt.py
 
     :param repl: ptpyton repl
+    :param telemetry: session telemetry, shown in a toolbar if passed
     """
 
     class CustomPrompt(PromptStyle):
@@ -47,4 +90,8 @@ def configure(repl: PythonRepl) -> None:
     repl.show_status_bar = False
     repl.confirm_exit = False
     repl.completer = get_repl_completer(repl.get_globals, repl.get_locals, repl.enable_dictionary_completion)
+    invalidate_completions_after_eval(repl)
+    render_results(repl)
+    if telemetry is not None:
+        add_telemetry_toolbar(repl, telemetry)
     repl.use_code_colorscheme("zenburn")
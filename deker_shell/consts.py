@@ -14,7 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import deker
+from typing import Tuple
 
 
 help_start = """
@@ -42,9 +42,19 @@ F3 - history
 help_text = """
 Preset variables:
 - client: Client (registry of collections) instance, connected to the uri-database
-- collections: list of Client collections names
+- collections: lazy list of Client collections names, fetched in pages and cached;
+  collections.refresh() drops the cache, collections.startswith("prefix") looks names up by prefix
 - collection: global default collection variable, set by use("coll_name") method;
 - np: numpy library
+- clients: registry of storages passed with --storage NAME=URI, each connected on first access: clients["NAME"];
+  clients["default"] is the main client
+- prefetch: collections metadata loaded in background at start, recently used collections first;
+  use("coll_name") takes the collection from it, prefetch.count("coll_name") returns its arrays count
+- read_cache: session cache of subset reads if the shell is started with --read-cache;
+  shows hits, misses and evictions, read_cache.clear() drops the cached data
+- index: local attributes index of the collection, set by use("coll_name") if the shell is started with --index;
+  index.find(name=value, name__ge=value, name__prefix="abc", name__in=[...]) returns lazily fetched arrays,
+  index.refresh() reads only arrays changed since the last refresh
 
 Classes:
 - Client: registry of collections
@@ -60,8 +70,60 @@ Classes:
 Methods:
 - use("name"): gets collection from client and saves it to 'collection' variable
 - get_global_coll_variable: returns 'collection' global variable
+- view(obj, page=0, rows=0): prints a page of ndarray, xarray or Subset rows; subsets are read page by page.
+  Large arrays and subsets are shown as a summary (shape, dtype, min/max/mean, head and tail), use view to see the data
+- export(collection, dest, workers=0, memory_limit=0, resume=True): streams collection arrays to .npy files
+  with a manifest.jsonl on a thread pool; an interrupted export is resumed when called again
+- ingest(collection, sources, attrs_fn=None, workers=0, memory_limit=0): creates an array per .npy or raw file
+  (or per file in a directory) and writes the memory-mapped data on a thread pool; attrs_fn(path) returns
+  the array attributes, taken from an export manifest or <file name>.json sidecar files if not passed
+- copy(collection, dst, name=None, workers=0, memory_limit=0): copies collection arrays with their ids and
+  attributes to another storage (a clients name or a Client) in parallel, streaming them chunk by chunk
+- scan(collection, stats=["min", "max", "mean", "nan"], by=None, processes=None): single chunked pass
+  statistics (count, nan, min, max, sum, mean, std) of each array, or of each position of dimension 'by',
+  computed on a process pool; returns a table with rows, column(name) and to_csv(path)
+- autotune(collection=None, save=True): probes cores, RAM and read/write throughput of the storage with different
+  numbers of workers (writes go to a scratch collection), recommends --workers, --memory-limit and lock intervals
+  and saves them for the next start
+- check(collection=None, level=2, report="deker-check.jsonl", resume=True, processes=None): checks integrity of
+  the storage or a collection on a process pool: 1 collections and their locks, 2 array files, metadata schema
+  conformance, orphaned locks and stray files, 3 symlinks, 4 data; findings are streamed to the JSON lines report,
+  an interrupted check is resumed from its checkpoint when called again
+- explain(subset) or explain(array, item): plans a read without doing it: result shape and bytes, storage chunks
+  and files touched (VArray arrays for virtual arrays), read time estimated from the read throughput measured
+  in the session or by autotune, and pieces fitting the memory limit in plan.iter_pieces()
+- iter_chunks(subset, max_bytes=0, along=None, prefetch=True): yields (bounds, data) blocks of the subset
+  aligned to storage chunks and sized to the memory limit, reading the next block in background; local arrays
+  are read into two reused buffers, so copy a block data to keep it after taking the next one
+- locks(collection=None): deker locks held in the storage (read and VArray lock files, collection and write
+  flocks) with their collection, kind, array, owner pid, age and whether the owner is alive; waits for locks
+  resume on file events instead of polling with --inotify-locks ('lock_waiter' shows the waits)
+
+Async I/O (top level await is supported; calls run on a thread pool of --workers threads
+within --memory-limit bytes in flight, so the prompt stays responsive):
+- await aread(subset): reads subset data
+- await aupdate(subset, data): updates subset data
+- await agather_reads(subsets, return_exceptions=False): reads subsets concurrently, returns their data in order
+
+Profiling (expr is a python code string or a callable without arguments):
+- timeit(expr, number=0, repeat=5): repeated timing of expr, prints best and mean time per loop
+- prof(expr, sort="cumulative", limit=20): runs expr under cProfile, prints the hottest functions
+- mem(expr, limit=10): traces expr allocations with tracemalloc, prints peak and top allocating lines
+- with trace(path=None) as tracer: spans of deker calls in the block (collections access, filters, subsets reads
+  and writes, HDF5 I/O, lock checks and waits); 'tracer' shows time per call, path gets a Chrome trace JSON and
+  a .folded flamegraph file next to it; the session is traced with --trace
 
 Call help(class or function) to read more
 """
 
-deker_objects = tuple(deker_obj + "(" for deker_obj in deker.__all__)
+
+def __getattr__(name: str) -> Tuple[str, ...]:
+    """Build deker dependent constants on first access, so that importing consts doesn't import deker.
+
+    :param name: module attribute name
+    """
+    if name == "deker_objects":
+        import deker
+
+        return tuple(deker_obj + "(" for deker_obj in deker.__all__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
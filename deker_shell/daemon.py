@@ -0,0 +1,316 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import fcntl
+import hashlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple  # noqa: I101
+
+
+DAEMON_IDLE_TIMEOUT = 900
+CONNECT_TIMEOUT = 60.0
+MAX_MESSAGE = 1024 * 1024
+FORWARDED_SIGNALS = (signal.SIGINT, signal.SIGWINCH, signal.SIGTERM, signal.SIGHUP)
+
+
+def get_daemon_dir() -> Path:
+    """Return directory of daemon sockets, only accessible by the current user.
+
+    $XDG_RUNTIME_DIR/deker-shell or deker-shell-<uid> in the temporary directory.
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    path = Path(runtime) / "deker-shell" if runtime else Path(tempfile.gettempdir()) / f"deker-shell-{os.getuid()}"
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if path.stat().st_uid != os.getuid() or path.stat().st_mode & 0o077:
+        raise PermissionError(f"{path} shall be owned by the current user and not accessible by others")
+    return path
+
+
+def get_socket_path(uri: str) -> Path:
+    """Return daemon socket path of storage uri.
+
+    Daemons of different interpreters don't share sockets, as they have different modules.
+
+    :param uri: storage uri
+    """
+    key = hashlib.sha1(f"{sys.executable}\0{uri}".encode()).hexdigest()[:16]
+    return get_daemon_dir() / f"{key}.sock"
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any], fds: Tuple[int, ...] = ()) -> None:
+    """Send newline terminated JSON message, optionally passing file descriptors with it.
+
+    :param sock: connected UNIX socket
+    :param message: JSON-serializable message
+    :param fds: file descriptors to pass
+    """
+    data = json.dumps(message).encode() + b"\n"
+    if fds:
+        sent = socket.send_fds(sock, [data], list(fds))
+        data = data[sent:]
+    sock.sendall(data)
+
+
+def recv_message(
+    sock: socket.socket, with_fds: bool = False, buffer: Optional[bytearray] = None
+) -> Tuple[Optional[Dict[str, Any]], List[int]]:
+    """Receive newline terminated JSON message and file descriptors passed with it.
+
+    Returns None message if the connection is closed. Messages sent back to back may be received
+    at once, so data received past the message is kept in buffer for the next call.
+
+    :param sock: connected UNIX socket
+    :param with_fds: expect file descriptors with the message
+    :param buffer: data received from sock past the previous message, only one message is expected if None
+    """
+    fds: List[int] = []
+    data = bytes(buffer or b"")
+    if b"\n" not in data:
+        if with_fds:
+            chunk, fds, _, _ = socket.recv_fds(sock, MAX_MESSAGE, 3)
+        else:
+            chunk = sock.recv(MAX_MESSAGE)
+        data += chunk
+        while chunk and b"\n" not in data:
+            chunk = sock.recv(MAX_MESSAGE)
+            data += chunk
+    line, end, rest = data.partition(b"\n")
+    if buffer is not None:
+        buffer[:] = rest
+    if not end:
+        for fd in fds:
+            os.close(fd)
+        return None, []
+    return json.loads(line), fds
+
+
+def warm_up() -> None:
+    """Import the shell modules and run jedi over the shell namespace, so that sessions start warm."""
+    import ptpython.repl  # noqa F401
+
+    from prompt_toolkit.completion import CompleteEvent
+    from prompt_toolkit.document import Document
+
+    import deker_shell.config  # noqa F401
+
+    from deker_shell.completer import JediCompleter
+    from deker_shell.lazy import deker_namespace
+
+    namespace = deker_namespace()
+    completer = JediCompleter(lambda: namespace, lambda: {}, debounce=0)
+    for text in ("Cli", "Client.", "np.ar", "datetime.da"):
+        list(completer.get_completions(Document(text), CompleteEvent(completion_requested=True)))
+
+
+def _run_session(conn: socket.socket, message: Dict[str, Any], fds: List[int]) -> int:
+    """Run shell session in a forked daemon process on the attached client terminal.
+
+    :param conn: client connection
+    :param message: session parameters
+    :param fds: client stdin, stdout and stderr
+    """
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", buffering=1, closefd=False)
+    os.environ.clear()
+    os.environ.update(message["env"])
+    os.chdir(message["cwd"])
+    send_message(conn, {"pid": os.getpid()})
+
+    from deker_shell.main import open_shell
+
+    try:
+        open_shell(message["uri"], **message["session"])
+        return 0
+    except SystemExit as e:
+        if isinstance(e.code, str):
+            print(e.code, file=sys.stderr)
+        return e.code if isinstance(e.code, int) else int(e.code is not None)
+    except BaseException as e:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        return 1
+
+
+class ShellDaemon:
+    """Fork server of shell sessions of one storage.
+
+    The daemon imports the shell modules and warms jedi up once; each attached session is a forked
+    copy of it running on the client terminal, with its own Client and namespace. Client instances
+    are not shared, as their thread pools and locks don't survive a fork.
+
+    :param uri: storage uri
+    :param path: socket path
+    :param idle_timeout: seconds without sessions after which the daemon exits
+    """
+
+    def __init__(self, uri: str, path: Path, idle_timeout: float = DAEMON_IDLE_TIMEOUT) -> None:
+        self.uri = uri
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.sessions: Dict[int, float] = {}
+        self._idle_since = time.monotonic()
+
+    def _reap(self) -> None:
+        while self.sessions:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            self.sessions.pop(pid, None)
+            if not self.sessions:
+                self._idle_since = time.monotonic()
+
+    def _fork_session(self, server: socket.socket, conn: socket.socket) -> None:
+        try:
+            message, fds = recv_message(conn, with_fds=True)
+        except (OSError, ValueError):
+            return
+        if message is None or len(fds) != 3:
+            for fd in fds:
+                os.close(fd)
+            return
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                server.close()
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.default_int_handler)
+                code = _run_session(conn, message, fds)
+                send_message(conn, {"exit": code})
+            finally:
+                # don't run the daemon cleanup in a session process
+                os._exit(code)
+        for fd in fds:
+            os.close(fd)
+        self.sessions[pid] = time.monotonic()
+
+    def serve(self) -> None:
+        """Accept sessions until the daemon is idle for idle_timeout seconds."""
+        warm_up()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.path.exists():
+            self.path.unlink()
+        server.bind(str(self.path))
+        inode = self.path.stat().st_ino
+        server.listen()
+        server.settimeout(1.0)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self._idle_since = time.monotonic()
+        try:
+            while self.sessions or time.monotonic() - self._idle_since < self.idle_timeout:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    self._reap()
+                    continue
+                with conn:
+                    conn.settimeout(None)
+                    self._fork_session(server, conn)
+                self._reap()
+        finally:
+            server.close()
+            # a new daemon may have replaced the socket already
+            if self.path.exists() and self.path.stat().st_ino == inode:
+                self.path.unlink()
+
+
+def _connect(path: Path) -> Optional[socket.socket]:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(str(path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+
+def connect_daemon(uri: str, idle_timeout: Optional[int] = None) -> socket.socket:
+    """Connect to the storage daemon, starting it if it is not running.
+
+    :param uri: storage uri
+    :param idle_timeout: seconds without sessions after which a started daemon exits
+    """
+    path = get_socket_path(uri)
+    sock = _connect(path)
+    if sock is not None:
+        return sock
+    # only one of concurrently attaching shells starts the daemon
+    with open(path.with_suffix(".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        sock = _connect(path)
+        if sock is not None:
+            return sock
+        if path.exists():
+            path.unlink()
+        with open(path.with_suffix(".log"), "w") as log:
+            subprocess.Popen(
+                [sys.executable, "-m", "deker_shell.daemon", uri, str(idle_timeout or DAEMON_IDLE_TIMEOUT)],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True,
+                close_fds=True,
+            )
+        deadline = time.monotonic() + CONNECT_TIMEOUT
+        while time.monotonic() < deadline:
+            sock = _connect(path)
+            if sock is not None:
+                return sock
+            time.sleep(0.02)
+    raise TimeoutError(f"Shell daemon didn't start in {CONNECT_TIMEOUT}s, see {path.with_suffix('.log')}")
+
+
+def attach(uri: str, session: Dict[str, Any], idle_timeout: Optional[int] = None) -> int:
+    """Run shell session in the storage daemon on this terminal, return its exit code.
+
+    Interrupts and terminal resizes are forwarded to the session process.
+
+    :param uri: storage uri
+    :param session: ``open_shell`` parameters
+    :param idle_timeout: seconds without sessions after which a started daemon exits
+    """
+    with connect_daemon(uri, idle_timeout) as sock:
+        message = {"uri": uri, "session": session, "env": dict(os.environ), "cwd": os.getcwd()}
+        send_message(sock, message, (sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()))
+        # a session exiting at once sends its pid and exit code back to back
+        buffer = bytearray()
+        reply, _ = recv_message(sock, buffer=buffer)
+        if reply is None:
+            return 1
+        pid = reply["pid"]
+        handlers = {sig: signal.signal(sig, lambda signum, _: os.kill(pid, signum)) for sig in FORWARDED_SIGNALS}
+        try:
+            reply, _ = recv_message(sock, buffer=buffer)
+        finally:
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+        return 1 if reply is None else reply["exit"]
+
+
+if __name__ == "__main__":
+    ShellDaemon(sys.argv[1], get_socket_path(sys.argv[1]), float(sys.argv[2])).serve()
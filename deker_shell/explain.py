@@ -0,0 +1,330 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+
+from itertools import product
+from typing import TYPE_CHECKING, Any, Iterator, List, NamedTuple, Optional, Tuple  # noqa: I101
+
+import numpy as np
+
+from deker_shell.chunks import Bound, Index, Split, resolve_bounds, split_bounds
+from deker_shell.profiling import format_bytes, format_time
+from deker_shell.utils import get_config, get_memory_limit, get_workers
+
+
+if TYPE_CHECKING:
+    from deker import Array, VArray
+
+    from deker_shell.telemetry import IOCounters
+
+# bytes read in the session before its throughput is used for estimates
+MIN_SAMPLE_BYTES = 1024**2
+# max amount of VArray files looked up, the others are estimated from them
+MAX_INSPECTED_FILES = 1000
+# vgrid positions shown in the plan representation
+SHOWN_POSITIONS = 8
+
+
+def get_read_limit(obj: Any) -> int:
+    """Return max amount of bytes deker allows to read at once now: the memory limit or the free memory.
+
+    :param obj: Client, Collection, Array, VArray, Subset or VSubset instance
+    """
+    from psutil import swap_memory, virtual_memory
+
+    return min(get_memory_limit(obj), virtual_memory().available + swap_memory().free)
+
+
+def get_storage_chunks(array: "Array") -> Tuple[bool, Optional[Tuple[int, ...]]]:
+    """Return if array file exists and has data and its storage chunk shape, None for contiguous data.
+
+    Storages without local files are assumed to have data chunked as the collection options say.
+
+    :param array: Array instance
+    """
+    adapter = getattr(array, "_BaseArray__adapter", None)
+    if adapter is None or not hasattr(adapter, "_get_main_path_to_file"):
+        options = getattr(array._BaseArray__collection, "options", None)  # type: ignore[attr-defined]
+        chunks = getattr(options, "chunks", None)
+        return True, tuple(chunks) if isinstance(chunks, (tuple, list)) else None
+
+    import h5py
+
+    try:
+        with h5py.File(adapter._get_main_path_to_file(array), "r", locking=False) as f:
+            dataset = f.get("data")
+            # arrays without written data are read as fill value without touching the storage
+            return dataset is not None, dataset.chunks if dataset is not None else None
+    except OSError:
+        return False, None
+
+
+def count_chunks(bounds: Tuple[Bound, ...], shape: Tuple[int, ...], chunks: Tuple[int, ...]) -> Tuple[int, int]:
+    """Return amount of storage chunks touched by bounds and amount of cells in them.
+
+    :param bounds: normalized bounds
+    :param shape: array shape
+    :param chunks: storage chunk shape
+    """
+    count, cells = 1, 1
+    for bound, size, chunk in zip(bounds, shape, chunks):
+        start, stop = (bound, bound + 1) if isinstance(bound, int) else bound
+        first, last = start // chunk, (stop - 1) // chunk
+        count *= last - first + 1
+        cells *= min((last + 1) * chunk, size) - first * chunk
+    return count, cells
+
+
+def iter_vgrid_bounds(
+    bounds: Tuple[Bound, ...], arrays_shape: Tuple[int, ...]
+) -> Iterator[Tuple[Tuple[int, ...], Tuple[Bound, ...]]]:
+    """Yield vgrid positions of VArray arrays touched by bounds and the bounds within each array.
+
+    :param bounds: normalized VArray bounds
+    :param arrays_shape: shape of VArray arrays
+    """
+    per_dimension = []
+    for bound, size in zip(bounds, arrays_shape):
+        if isinstance(bound, int):
+            per_dimension.append([(bound // size, bound % size)])
+            continue
+        start, stop = bound
+        per_dimension.append(
+            [
+                (
+                    position,
+                    (max(start, position * size) - position * size, min(stop, (position + 1) * size) - position * size),
+                )
+                for position in range(start // size, (stop - 1) // size + 1)
+            ]
+        )
+    for combination in product(*per_dimension):
+        yield tuple(item[0] for item in combination), tuple(item[1] for item in combination)
+
+
+def format_bounds(bounds: Tuple[Bound, ...]) -> str:
+    """Return bounds as an index expression.
+
+    :param bounds: normalized bounds
+    """
+    return "[" + ", ".join(str(bound) if isinstance(bound, int) else f"{bound[0]}:{bound[1]}" for bound in bounds) + "]"
+
+
+class ReadPlan(NamedTuple):
+    """Estimated cost of reading a subset, computed before reading it."""
+
+    array: Any
+    bounds: Tuple[Bound, ...]
+    shape: Tuple[int, ...]
+    dtype: np.dtype
+    nbytes: int
+    # storage chunk shape, None for contiguous or unknown layout
+    chunk_shape: Optional[Tuple[int, ...]]
+    chunks: int
+    # bytes decoded from the touched chunks
+    storage_bytes: int
+    files: int
+    # VArray arrays positions touched and how many of them have no data and are read as fill value
+    positions: List[Tuple[int, ...]]
+    missing: int
+    throughput: Optional[float]
+    throughput_source: str
+    time: Optional[float]
+    read_limit: int
+    piece_bytes: int
+
+    @property
+    def fits(self) -> bool:
+        """Check if the subset fits the memory deker allows to read at once."""
+        return self.nbytes <= self.read_limit
+
+    @property
+    def split(self) -> Split:
+        """Pieces of at most ``piece_bytes`` the subset can be read in."""
+        align = tuple(self.array.arrays_shape) if self.positions else self.chunk_shape
+        return split_bounds(self.bounds, self.dtype.itemsize, self.piece_bytes, align)
+
+    @property
+    def pieces(self) -> int:
+        """Amount of pieces the subset is read in by ``iter_pieces``."""
+        return self.split.pieces
+
+    def iter_pieces(self) -> Iterator[Index]:
+        """Yield index expressions of pieces of the subset, each not bigger than ``piece_bytes`` if possible.
+
+        Example:
+            > plan = explain(array[:, 0])
+            > for bounds in plan.iter_pieces():
+            >     data = array[bounds].read()
+        """
+        return self.split.indexes()
+
+    def __repr__(self) -> str:
+        kind = "VArray" if self.positions else "Array"
+        lines = [
+            f"{kind} {self.array.id}{format_bounds(self.bounds)}",
+            f"result: shape {self.shape} {self.dtype}, {format_bytes(self.nbytes)}",
+        ]
+        layout = f"chunks of {self.chunk_shape}" if self.chunk_shape is not None else "contiguous chunks"
+        storage = f"storage: {self.chunks} {layout} in {self.files} files, {format_bytes(self.storage_bytes)} decoded"
+        lines.append(storage)
+        if self.positions:
+            shown = ", ".join(map(str, self.positions[:SHOWN_POSITIONS]))
+            more = f" and {len(self.positions) - SHOWN_POSITIONS} more" if len(self.positions) > SHOWN_POSITIONS else ""
+            lines.append(f"vgrid arrays: {len(self.positions)} touched ({shown}{more}), {self.missing} without data")
+        if self.time is not None and self.throughput is not None:
+            lines.append(
+                f"estimated read time: {format_time(self.time)} at {format_bytes(self.throughput)}/s "
+                f"{self.throughput_source}"
+            )
+        else:
+            lines.append("estimated read time: unknown, read some data or run autotune() first")
+        if self.fits:
+            lines.append(f"fits {format_bytes(self.read_limit)} read limit")
+        else:
+            lines.append(
+                f"doesn't fit {format_bytes(self.read_limit)} read limit, read it in {self.pieces} pieces "
+                f"of at most {format_bytes(self.piece_bytes)}: for bounds in plan.iter_pieces(): array[bounds].read()"
+            )
+        return "\n".join(lines)
+
+
+def _get_throughput(
+    array: Any, throughput: Optional[float], counters: Optional["IOCounters"]
+) -> Tuple[Optional[float], str]:
+    """Return read throughput of one array in bytes per second and where it comes from.
+
+    :param array: Array or VArray
+    :param throughput: throughput passed by the user
+    :param counters: session I/O counters
+    """
+    if throughput:
+        return throughput, "as passed"
+    if counters is not None and counters.read_bytes >= MIN_SAMPLE_BYTES and counters.read_time > 0:
+        return counters.read_bytes / counters.read_time, "measured in this session"
+    from deker_shell.tune import load_read_throughput
+
+    saved = load_read_throughput(get_config(array).uri)
+    if saved:
+        return saved, "measured by autotune"
+    return None, ""
+
+
+def _inspect_varray(
+    varray: "VArray", bounds: Tuple[Bound, ...], itemsize: int
+) -> Tuple[List[Tuple[int, ...]], int, int, int, Optional[Tuple[int, ...]]]:
+    """Look VArray arrays touched by bounds up, return positions, missing arrays, chunks, storage bytes and chunk shape.
+
+    Only MAX_INSPECTED_FILES arrays are looked up, the rest are estimated to be like them.
+
+    :param varray: VArray instance
+    :param bounds: normalized VArray bounds
+    :param itemsize: dtype itemsize
+    """
+    collection = varray._BaseArray__collection  # type: ignore[attr-defined]
+    arrays_shape = tuple(varray.arrays_shape)
+    positions, missing, chunks, cells = [], 0, 0, 0
+    chunk_shape = None
+    for position, array_bounds in iter_vgrid_bounds(bounds, arrays_shape):
+        positions.append(position)
+        if len(positions) > MAX_INSPECTED_FILES:
+            continue
+        array = collection.arrays.filter({"vid": varray.id, "v_position": position}).last()
+        has_data, array_chunks = get_storage_chunks(array) if array is not None else (False, None)
+        if not has_data:
+            missing += 1
+            continue
+        chunk_shape = array_chunks
+        touched, touched_cells = count_chunks(array_bounds, arrays_shape, array_chunks or arrays_shape)
+        chunks += touched
+        cells += touched_cells
+    inspected = min(len(positions), MAX_INSPECTED_FILES)
+    if len(positions) > inspected:
+        scale = len(positions) / inspected
+        missing, chunks, cells = round(missing * scale), round(chunks * scale), round(cells * scale)
+    return positions, missing, chunks, cells * itemsize, chunk_shape
+
+
+def explain(
+    obj: Any,
+    item: Any = None,
+    throughput: Optional[float] = None,
+    piece_bytes: int = 0,
+    counters: Optional["IOCounters"] = None,
+) -> ReadPlan:
+    """Estimate the cost of reading a subset without reading it.
+
+    Computes result shape and size, storage chunks and files touched, VArray arrays touched,
+    and read time from the read throughput measured in the session (or by ``autotune()`` if
+    there were no reads yet). Subsets too big for deker to read at once can be explained
+    by passing the array and the index instead, as deker refuses to create them.
+
+    Example:
+        > explain(array[:, 0])
+        > plan = explain(varray, (slice(None), 0))
+        > for bounds in plan.iter_pieces():
+        >     data = varray[bounds].read()
+
+    :param obj: Subset, VSubset, Array or VArray
+    :param item: index of Array or VArray, the whole array if None
+    :param throughput: read throughput of one array in bytes per second to estimate time with
+    :param piece_bytes: max size of pieces suggested by ``iter_pieces``, half the read limit if 0
+    :param counters: session I/O counters to take the throughput from
+    """
+    from deker import VArray
+
+    array, bounds = resolve_bounds(obj, item)
+    shape = tuple(array.shape)
+    result_shape = tuple(bound[1] - bound[0] for bound in bounds if not isinstance(bound, int))
+    dtype = np.dtype(array.dtype)
+    nbytes = math.prod(result_shape) * dtype.itemsize
+
+    positions: List[Tuple[int, ...]] = []
+    if isinstance(array, VArray):
+        positions, missing, chunks, storage_bytes, chunk_shape = _inspect_varray(array, bounds, dtype.itemsize)
+        files = len(positions) - missing
+    else:
+        has_data, chunk_shape = get_storage_chunks(array)
+        missing, files, chunks, storage_bytes = 0, int(has_data), 0, 0
+        if has_data:
+            chunks, cells = count_chunks(bounds, shape, chunk_shape or shape)
+            storage_bytes = cells * dtype.itemsize if chunk_shape else nbytes
+
+    speed, source = _get_throughput(array, throughput, counters)
+    read_time = None
+    if speed is not None:
+        # VArray arrays are read concurrently on the Client threads
+        read_time = storage_bytes / speed / max(min(get_workers(array), files), 1)
+    read_limit = get_read_limit(array)
+    return ReadPlan(
+        array,
+        bounds,
+        result_shape,
+        dtype,
+        nbytes,
+        chunk_shape,
+        chunks,
+        storage_bytes,
+        files,
+        positions,
+        missing,
+        speed,
+        source,
+        read_time,
+        read_limit,
+        piece_bytes or max(read_limit // 2, 1),
+    )
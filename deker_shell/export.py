@@ -0,0 +1,295 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import time
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from threading import Condition, Lock
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Set, Tuple, Union  # noqa: I101
+
+import click
+import numpy as np
+
+from deker_shell.batch import json_default
+from deker_shell.profiling import format_bytes, format_time
+from deker_shell.utils import get_memory_limit, get_workers
+
+
+if TYPE_CHECKING:
+    from deker import Array, Collection, VArray
+
+MANIFEST = "manifest.jsonl"
+# max size of a chunk read from storage at once
+EXPORT_CHUNK_BYTES = 64 * 1024**2
+
+
+class ExportedArray(NamedTuple):
+    """Manifest record of an exported array."""
+
+    id: str
+    file: str
+    shape: Tuple[int, ...]
+    dtype: str
+    primary_attributes: Dict[str, Any]
+    custom_attributes: Dict[str, Any]
+
+
+class ExportReport(NamedTuple):
+    """Export outcome."""
+
+    exported: int
+    skipped: int
+    bytes: int
+    time: float
+    errors: List[Tuple[str, str]]
+
+    def __repr__(self) -> str:
+        speed = self.bytes / self.time if self.time > 0 else 0.0
+        text = (
+            f"exported {self.exported} arrays, skipped {self.skipped} already exported, "
+            f"{format_bytes(self.bytes)} in {format_time(self.time)} ({format_bytes(speed)}/s)"
+        )
+        for array_id, error in self.errors:
+            text += f"\nfailed {array_id}: {error}"
+        return text
+
+
+class ByteBudget:
+    """Limit amount of bytes held by concurrent readers.
+
+    A request bigger than the whole budget is granted when nothing else is in flight.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = Condition()
+
+    def acquire(self, size: int) -> None:
+        """Wait until size bytes fit the budget and take them.
+
+        :param size: amount of bytes
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.limit)
+            self.in_flight += size
+
+    def release(self, size: int) -> None:
+        """Give size bytes back to the budget.
+
+        :param size: amount of bytes
+        """
+        with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+
+def chunk_split(shape: Tuple[int, ...], itemsize: int, max_bytes: int) -> Tuple[int, int]:
+    """Return axis to split the shape along into chunks of at most max_bytes and chunk length along it.
+
+    The innermost axes are kept whole; the axis is -1 if the whole shape fits.
+
+    :param shape: array shape
+    :param itemsize: array dtype itemsize
+    :param max_bytes: max chunk size in bytes
+    """
+    inner, axis = itemsize, len(shape)
+    while axis > 0 and inner * shape[axis - 1] <= max_bytes:
+        axis -= 1
+        inner *= shape[axis]
+    if axis == 0:
+        return -1, 0
+    return axis - 1, max(max_bytes // inner, 1)
+
+
+def iter_chunk_bounds(shape: Tuple[int, ...], itemsize: int, max_bytes: int) -> Iterator[Tuple[slice, ...]]:
+    """Yield bounds of contiguous chunks covering the shape, each not bigger than max_bytes if possible.
+
+    The innermost axes are kept whole and the array is split along the outermost axis that doesn't fit.
+
+    :param shape: array shape
+    :param itemsize: array dtype itemsize
+    :param max_bytes: max chunk size in bytes
+    """
+    split_axis, step = chunk_split(shape, itemsize, max_bytes)
+    if split_axis < 0:
+        yield tuple(slice(0, size) for size in shape)
+        return
+    whole = tuple(slice(0, size) for size in shape[split_axis:][1:])
+    for outer in np.ndindex(*shape[:split_axis]):
+        for start in range(0, shape[split_axis], step):
+            stop = min(start + step, shape[split_axis])
+            yield tuple(slice(i, i + 1) for i in outer) + (slice(start, stop),) + whole
+
+
+def read_manifest(dest: Path) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """Return manifest header and exported arrays records by array id.
+
+    A torn last line, left by an interrupted export, is ignored.
+
+    :param dest: export directory
+    """
+    header: Dict[str, Any] = {}
+    arrays: Dict[str, Dict[str, Any]] = {}
+    path = dest / MANIFEST
+    if not path.exists():
+        return header, arrays
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "collection" in record:
+                header = record
+            else:
+                arrays[record["id"]] = record
+    return header, arrays
+
+
+def _export_array(array: Union["Array", "VArray"], dest: Path, budget: ByteBudget, chunk_bytes: int) -> ExportedArray:
+    """Stream array data chunk by chunk into a .npy file.
+
+    Data is written to a .part file, which is renamed when the array is complete.
+
+    :param array: Array or VArray
+    :param dest: export directory
+    :param budget: in-flight bytes budget shared by all the workers
+    :param chunk_bytes: max chunk size in bytes
+    """
+    dtype = np.dtype(array.dtype)
+    shape = tuple(array.shape)
+    name = f"{array.id}.npy"
+    part = dest / f"{name}.part"
+    out = np.lib.format.open_memmap(part, mode="w+", dtype=dtype, shape=shape)
+    try:
+        for bounds in iter_chunk_bounds(shape, dtype.itemsize, chunk_bytes):
+            size = int(np.prod([bound.stop - bound.start for bound in bounds], dtype=np.int64)) * dtype.itemsize
+            budget.acquire(size)
+            try:
+                out[bounds] = array[bounds].read()
+            finally:
+                budget.release(size)
+        out.flush()
+    finally:
+        del out
+    os.replace(part, dest / name)
+    return ExportedArray(
+        str(array.id), name, shape, dtype.str, dict(array.primary_attributes), dict(array.custom_attributes or {})
+    )
+
+
+def export(
+    collection: "Collection",
+    dest: Union[str, Path],
+    workers: int = 0,
+    memory_limit: int = 0,
+    resume: bool = True,
+) -> ExportReport:
+    """Export collection arrays to .npy files with a manifest, several arrays at a time.
+
+    Each array is streamed chunk by chunk into ``<dest>/<array id>.npy``, so it never has to fit memory.
+    Array ids, files, shapes and attributes are appended to ``<dest>/manifest.jsonl`` after the
+    collection header as soon as each array is complete; an interrupted export skips them when restarted.
+
+    Example:
+        > export(collection, "/data/dump")
+        # exported 120 arrays, skipped 0 already exported, 3.2 GB in 14.1 s (232 MB/s)
+        > np.load("/data/dump/<array id>.npy", mmap_mode="r")
+
+    :param collection: Collection instance
+    :param dest: export directory, created if it doesn't exist
+    :param workers: number of arrays exported concurrently, Client workers if 0
+    :param memory_limit: max amount of bytes read and not yet written at once, Client memory limit if 0
+    :param resume: skip arrays already listed in the manifest if True, export everything again otherwise
+    """
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    workers = workers or get_workers(collection)
+    memory_limit = memory_limit or get_memory_limit(collection)
+    chunk_bytes = max(min(EXPORT_CHUNK_BYTES, memory_limit // workers), 1)
+    budget = ByteBudget(memory_limit)
+
+    header, done = read_manifest(dest) if resume else ({}, {})
+    if header and header.get("collection") != collection.name:
+        raise ValueError(f"{dest} contains export of collection {header.get('collection')}")
+    done = {array_id: record for array_id, record in done.items() if (dest / record["file"]).exists()}
+
+    start = time.perf_counter()
+    exported, skipped, total_bytes = 0, 0, 0
+    errors: List[Tuple[str, str]] = []
+    lock = Lock()
+    # the manifest is rewritten to drop a torn line and records of deleted files
+    with open(dest / MANIFEST, "w") as manifest:
+
+        def write(record: Dict[str, Any]) -> None:
+            with lock:
+                manifest.write(json.dumps(record, default=json_default) + "\n")
+                manifest.flush()
+
+        write({"collection": collection.name, **collection.as_dict})
+        for record in done.values():
+            write(record)
+
+        with ThreadPoolExecutor(workers, thread_name_prefix="export") as pool:
+            pending: Dict[Future, str] = {}
+
+            def collect(futures: Set[Future]) -> None:
+                nonlocal exported, total_bytes
+                for future in futures:
+                    array_id = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        errors.append((array_id, f"{type(e).__name__}: {e}"))
+                        continue
+                    write(record._asdict())
+                    exported += 1
+                    total_bytes += int(np.prod(record.shape, dtype=np.int64)) * np.dtype(record.dtype).itemsize
+
+            for array in collection:
+                if str(array.id) in done:
+                    skipped += 1
+                    continue
+                # keep the amount of pending arrays bounded for huge collections
+                if len(pending) >= workers * 2:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                pending[pool.submit(_export_array, array, dest, budget, chunk_bytes)] = str(array.id)
+            collect(wait(pending).done)
+    return ExportReport(exported, skipped, total_bytes, time.perf_counter() - start, errors)
+
+
+def export_collection(uri: str, name: str, dest: str, **kwargs: Any) -> int:
+    """Open a client, export collection and print the report, return exit code.
+
+    :param uri: uri to Deker storage
+    :param name: collection name
+    :param dest: export directory
+    :param kwargs: Client parameters
+    """
+    from deker import Client
+
+    with Client(uri, **kwargs) as client:
+        collection = client.get_collection(name)
+        if collection is None:
+            raise click.ClickException(f"Collection {name} doesn't exist")
+        report = export(collection, dest)
+    click.echo(repr(report))
+    return int(bool(report.errors))
@@ -0,0 +1,273 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union  # noqa: I101
+
+from deker_shell.utils import get_config, get_local_adapter
+
+
+if TYPE_CHECKING:
+    from deker import Array, Collection, VArray
+
+# query operators by attribute name suffix
+OPERATORS = {"": "=", "gt": ">", "ge": ">=", "lt": "<", "le": "<=", "ne": "!="}
+# files modified less than this amount of nanoseconds before a refresh are read again on the next one
+RACY_NS = 2 * 10**9
+
+
+def default_index_dir() -> Path:
+    """Return directory of index databases: $XDG_CACHE_HOME/deker-shell/index or ~/.cache/deker-shell/index."""
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(cache) / "deker-shell" / "index"
+
+
+def to_sql_value(value: Any) -> Any:
+    """Convert attribute value to a value stored in the index.
+
+    Datetimes are stored as UTC ISO strings, which sort chronologically, naive ones are taken as UTC
+    as deker does; tuples and lists as JSON.
+
+    :param value: attribute value
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.astimezone(datetime.timezone.utc).isoformat()
+    if isinstance(value, (tuple, list)):
+        return json.dumps(list(value))
+    return value
+
+
+class RefreshReport(NamedTuple):
+    """Index refresh outcome."""
+
+    added: int
+    updated: int
+    removed: int
+    time: float
+
+
+class IndexedArrays(Sequence):
+    """Lazy sequence of arrays found in the index, each array is fetched from the collection on access.
+
+    :param collection: Collection instance
+    :param ids: arrays ids
+    """
+
+    def __init__(self, collection: "Collection", ids: List[str]) -> None:
+        self.collection = collection
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, item: Union[int, slice]) -> Any:  # type: ignore[override]
+        if isinstance(item, slice):
+            return IndexedArrays(self.collection, self.ids[item])
+        return self.collection.filter({"id": self.ids[item]}).last()
+
+    def __iter__(self) -> Iterator[Union["Array", "VArray"]]:
+        for i in range(len(self.ids)):
+            yield self[i]
+
+    def __repr__(self) -> str:
+        shown = ", ".join(repr(array_id) for array_id in self.ids[:10])
+        more = ", ..." if len(self.ids) > 10 else ""
+        return f"IndexedArrays({len(self.ids)} arrays: [{shown}{more}])"
+
+
+class AttributeIndex:
+    """Local SQLite index of collection arrays primary and custom attributes.
+
+    The index is stored on disk and refreshed incrementally: only arrays, which files were added,
+    modified or removed since the last refresh, are read. Storages without local files are reindexed fully.
+
+    Attribute conditions are passed as keyword arguments; a name may have a suffix
+    ``__gt``, ``__ge``, ``__lt``, ``__le``, ``__ne``, ``__in`` or ``__prefix``.
+
+    Example:
+        > index.find(dt__ge=datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc), source__prefix="gfs")
+        # IndexedArrays(24 arrays: [...])
+        > index.find(level__in=[500, 850])[0][:].read()
+
+    :param collection: Collection instance
+    :param index_dir: directory of index databases, see default_index_dir
+    :param ttl: seconds after which find refreshes the index before querying
+    """
+
+    def __init__(self, collection: "Collection", index_dir: Optional[Union[str, Path]] = None, ttl: float = 60.0):
+        self.collection = collection
+        self.ttl = ttl
+        schema = collection.varray_schema or collection.array_schema
+        self.attributes = [attribute.name for attribute in schema.attributes]
+        config = get_config(collection)
+        uri = config.uri if config is not None else ""
+        key = hashlib.sha1(f"{uri}/{collection.name}".encode()).hexdigest()[:16]  # nosec B324
+        index_dir = Path(index_dir) if index_dir is not None else default_index_dir()
+        index_dir.mkdir(parents=True, exist_ok=True)
+        self.path = index_dir / f"{collection.name}-{key}.sqlite"
+        self._refreshed_at: Optional[float] = None
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._create_tables(json.dumps(collection.as_dict, default=str, sort_keys=True))
+
+    def _create_tables(self, schema: str) -> None:
+        """Create index tables, dropping the index if it was built for another collection schema.
+
+        :param schema: serialized collection schema
+        """
+        db = self._connection
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        stored = db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if stored is not None and stored[0] != schema:
+            db.execute("DROP TABLE IF EXISTS arrays")
+        columns = "".join(f', "{name}"' for name in self.attributes)
+        db.execute(f"CREATE TABLE IF NOT EXISTS arrays (id TEXT PRIMARY KEY, file TEXT, mtime INTEGER{columns})")
+        for name in self.attributes:
+            db.execute(f'CREATE INDEX IF NOT EXISTS "arrays_{name}" ON arrays ("{name}")')
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('schema', ?)", (schema,))
+        db.commit()
+
+    def _adapter(self) -> Any:
+        """Return collection local storage adapter, None for storages without local files."""
+        return get_local_adapter(self.collection)
+
+    def _row(self, array_id: str, file: str, mtime: int, primary: dict, custom: dict) -> Tuple[Any, ...]:
+        attrs = {**(custom or {}), **(primary or {})}
+        return (array_id, file, mtime) + tuple(to_sql_value(attrs.get(name)) for name in self.attributes)
+
+    def _scan_files(self, adapter: Any) -> Dict[str, int]:
+        """Return modification times of collection arrays files by path.
+
+        :param adapter: collection local storage adapter
+        """
+        files = {}
+        for root, _, names in os.walk(adapter.collection_path / adapter.data_dir):
+            for name in names:
+                if name.endswith(adapter.file_ext):
+                    path = os.path.join(root, name)
+                    files[path] = os.stat(path).st_mtime_ns
+        return files
+
+    def refresh(self) -> RefreshReport:
+        """Bring the index up to date with the collection, reading only added and modified arrays.
+
+        Updated arrays are the ones which attributes have changed.
+        """
+        start = time.perf_counter()
+        db = self._connection
+        adapter = self._adapter()
+        placeholders = ", ".join("?" * (3 + len(self.attributes)))
+        insert = f"INSERT OR REPLACE INTO arrays VALUES ({placeholders})"
+        if adapter is None:
+            rows = [
+                self._row(str(array.id), "", 0, array.primary_attributes, array.custom_attributes)
+                for array in self.collection
+            ]
+            removed = db.execute("SELECT COUNT(*) FROM arrays").fetchone()[0]
+            db.execute("DELETE FROM arrays")
+            db.executemany(insert, rows)
+            db.commit()
+            self._refreshed_at = time.monotonic()
+            return RefreshReport(len(rows), 0, removed, time.perf_counter() - start)
+
+        indexed = {row[1]: row for row in db.execute("SELECT * FROM arrays")}
+        # files modified within the filesystem timestamp granularity before the scan may change again
+        # without changing their mtime, so they are stored with unknown mtime and read again next time
+        racy = time.time_ns() - RACY_NS
+        files = self._scan_files(adapter)
+        rows, added, updated = [], 0, 0
+        for file, mtime in files.items():
+            old = indexed.get(file)
+            if old is not None and old[2] == mtime:
+                continue
+            meta = adapter.read_meta(Path(file))
+            row = self._row(
+                meta["id"], file, mtime if mtime < racy else -1, meta["primary_attributes"], meta["custom_attributes"]
+            )
+            rows.append(row)
+            if old is None:
+                added += 1
+            elif old[3:] != row[3:]:
+                updated += 1
+        removed = [(row[0],) for file, row in indexed.items() if file not in files]
+        db.executemany("DELETE FROM arrays WHERE id = ?", removed)
+        db.executemany(insert, rows)
+        db.commit()
+        self._refreshed_at = time.monotonic()
+        return RefreshReport(added, updated, len(removed), time.perf_counter() - start)
+
+    def _where(self, conditions: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """Build SQL WHERE clause from keyword conditions.
+
+        :param conditions: attribute conditions
+        """
+        clauses, params = [], []
+        for key, value in conditions.items():
+            name, _, op = key.partition("__")
+            if name not in self.attributes and name != "id":
+                raise KeyError(f"Collection has no attribute {name}, only {', '.join(self.attributes)}")
+            if op == "in":
+                values = [to_sql_value(v) for v in value]
+                clauses.append(f'"{name}" IN ({", ".join("?" * len(values))})')
+                params.extend(values)
+            elif op == "prefix":
+                clauses.append(f'substr("{name}", 1, ?) = ?')
+                params.extend([len(value), value])
+            elif op in OPERATORS:
+                clauses.append(f'"{name}" {OPERATORS[op]} ?')
+                params.append(to_sql_value(value))
+            else:
+                raise ValueError(f"Unknown condition {key}")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def ids(self, **conditions: Any) -> List[str]:
+        """Return ids of arrays matching all the conditions, refreshing the index if it is older than ttl.
+
+        :param conditions: attribute conditions
+        """
+        if self._refreshed_at is None or time.monotonic() - self._refreshed_at > self.ttl:
+            self.refresh()
+        where, params = self._where(conditions)
+        return [row[0] for row in self._connection.execute(f"SELECT id FROM arrays{where} ORDER BY id", params)]
+
+    def find(self, **conditions: Any) -> IndexedArrays:
+        """Return lazy sequence of arrays matching all the conditions.
+
+        :param conditions: attribute conditions
+        """
+        return IndexedArrays(self.collection, self.ids(**conditions))
+
+    def count(self, **conditions: Any) -> int:
+        """Return amount of arrays matching all the conditions.
+
+        :param conditions: attribute conditions
+        """
+        return len(self.ids(**conditions))
+
+    def close(self) -> None:
+        """Close index database."""
+        self._connection.close()
+
+    def __repr__(self) -> str:
+        return f"AttributeIndex({self.collection.name!r}, attributes={self.attributes}, path={str(self.path)!r})"
@@ -0,0 +1,292 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import time
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import (  # noqa: I101
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import click
+import numpy as np
+
+from deker_shell.export import EXPORT_CHUNK_BYTES, ByteBudget, iter_chunk_bounds, read_manifest  # noqa: I101
+from deker_shell.profiling import format_bytes, format_time
+from deker_shell.utils import get_config, get_memory_limit, get_workers
+
+
+if TYPE_CHECKING:
+    from deker import Collection
+
+# suffixes of data files taken from source directories
+SOURCE_SUFFIXES = (".npy", ".raw", ".bin", ".dat")
+
+Source = Union[str, Path]
+AttrsFunction = Callable[[Path], Optional[Dict[str, Any]]]
+T = TypeVar("T")
+
+
+class IngestReport(NamedTuple):
+    """Ingest outcome."""
+
+    ingested: int
+    bytes: int
+    time: float
+    errors: List[Tuple[str, str]]
+
+    def __repr__(self) -> str:
+        speed = self.bytes / self.time if self.time > 0 else 0.0
+        text = (
+            f"ingested {self.ingested} arrays, {format_bytes(self.bytes)} in {format_time(self.time)} "
+            f"({speed / 1024**2:.4g} MB/s)"
+        )
+        for source, error in self.errors:
+            text += f"\nfailed {source}: {error}"
+        return text
+
+
+def iter_sources(sources: Union[Source, Iterable[Source]]) -> Iterator[Path]:
+    """Yield data files paths, expanding directories into their .npy and raw data files.
+
+    :param sources: file or directory path, or an iterable of them
+    """
+    if isinstance(sources, (str, Path)):
+        sources = [sources]
+    for source in sources:
+        path = Path(source)
+        if path.is_dir():
+            yield from sorted(p for p in path.iterdir() if p.suffix in SOURCE_SUFFIXES and p.is_file())
+        else:
+            yield path
+
+
+def open_source(path: Path, dtype: Any, shape: Tuple[int, ...]) -> np.ndarray:
+    """Memory-map .npy or raw data file without reading it.
+
+    Raw files shall contain C-ordered data of the collection dtype and array shape.
+
+    :param path: data file path
+    :param dtype: collection dtype
+    :param shape: collection array shape
+    """
+    if path.suffix == ".npy":
+        data = np.load(path, mmap_mode="r")
+    else:
+        data = np.memmap(path, dtype=dtype, mode="r", shape=shape)
+    if data.shape != shape:
+        raise ValueError(f"{path} shape {data.shape} doesn't match collection array shape {shape}")
+    return data
+
+
+class SidecarAttrs:
+    """Attributes of data files taken from the export manifest next to them or from their .json sidecar files.
+
+    Manifests are read once per directory.
+    """
+
+    def __init__(self) -> None:
+        self._manifests: Dict[Path, Dict[str, Dict[str, Any]]] = {}
+
+    def __call__(self, path: Path) -> Optional[Dict[str, Any]]:
+        """Return data file attributes, None if there are no attributes for it.
+
+        :param path: data file path
+        """
+        if path.parent not in self._manifests:
+            self._manifests[path.parent] = {
+                record["file"]: {**record["primary_attributes"], **record["custom_attributes"]}
+                for record in read_manifest(path.parent)[1].values()
+            }
+        attrs = self._manifests[path.parent].get(path.name)
+        if attrs is not None:
+            return attrs
+        sidecar = path.with_suffix(".json")
+        if sidecar.exists():
+            with open(sidecar) as f:
+                return json.load(f)
+        return None
+
+
+def split_attributes(collection: "Collection", attrs: Optional[Dict[str, Any]]) -> Tuple[dict, dict]:
+    """Split attributes into primary and custom ones by collection schema.
+
+    ISO format strings are converted to datetime for datetime attributes.
+
+    :param collection: Collection instance
+    :param attrs: attributes values by name
+    """
+    primary: Dict[str, Any] = {}
+    custom: Dict[str, Any] = {}
+    schema = collection.varray_schema or collection.array_schema
+    for attribute in schema.attributes:
+        if not attrs or attribute.name not in attrs:
+            continue
+        value = attrs[attribute.name]
+        if attribute.dtype is datetime.datetime and isinstance(value, str):
+            value = datetime.datetime.fromisoformat(value)
+        (primary if attribute.primary else custom)[attribute.name] = value
+    return primary, custom
+
+
+def retry_locked(func: Callable[[], T], timeout: float, interval: float) -> T:
+    """Call func again while it fails with DekerLockError, until timeout expires.
+
+    :param func: callable without arguments
+    :param timeout: seconds to keep retrying for
+    :param interval: seconds to sleep between attempts
+    """
+    from deker.errors import DekerLockError
+
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return func()
+        except DekerLockError:
+            if time.monotonic() + interval > deadline:
+                raise
+            time.sleep(interval)
+
+
+def _ingest_source(
+    collection: "Collection",
+    path: Path,
+    attrs_fn: AttrsFunction,
+    budget: ByteBudget,
+    chunk_bytes: int,
+    retry: Tuple[float, float],
+) -> int:
+    """Create an array for the data file and write its data chunk by chunk, return amount of bytes written.
+
+    :param collection: Collection instance
+    :param path: data file path
+    :param attrs_fn: function returning array attributes by data file path
+    :param budget: in-flight bytes budget shared by all the workers
+    :param chunk_bytes: max chunk size in bytes
+    :param retry: write lock timeout and check interval
+    """
+    schema = collection.varray_schema or collection.array_schema
+    dtype = np.dtype(schema.dtype)
+    data = open_source(path, dtype, tuple(schema.shape))
+    primary, custom = split_attributes(collection, attrs_fn(path))
+    array = retry_locked(lambda: collection.create(primary or None, custom or None), *retry)
+    try:
+        for bounds in iter_chunk_bounds(data.shape, dtype.itemsize, chunk_bytes):
+            chunk = data[bounds]
+            budget.acquire(chunk.nbytes)
+            try:
+                values = np.asarray(chunk, dtype=dtype)
+                retry_locked(lambda: array[bounds].update(values), *retry)  # noqa: B023
+            finally:
+                budget.release(chunk.nbytes)
+    except Exception:
+        # don't leave a partially written array behind
+        array.delete()
+        raise
+    return data.nbytes
+
+
+def ingest(
+    collection: "Collection",
+    sources: Union[Source, Iterable[Source]],
+    attrs_fn: Optional[AttrsFunction] = None,
+    workers: int = 0,
+    memory_limit: int = 0,
+) -> IngestReport:
+    """Create an array per data file and write the files data into the collection, several files at a time.
+
+    Sources are memory-mapped .npy files or raw files with C-ordered data of the collection dtype and
+    array shape; directories are expanded into their .npy, .raw, .bin and .dat files.
+    Data is written chunk by chunk, so a file never has to fit memory. Writes to arrays locked by other
+    processes are retried for the Client write lock timeout, sleeping for the write lock check interval.
+
+    Example:
+        > ingest(collection, "/data/backfill", lambda path: {"dt": datetime.datetime.strptime(path.stem, "%Y%m%d")})
+        # ingested 365 arrays, 2.1 GB in 9.8 s (219 MB/s)
+
+    :param collection: Collection instance
+    :param sources: data file or directory path, or an iterable of them
+    :param attrs_fn: function returning attributes dict by data file path; attributes are taken from
+      an export manifest.jsonl or a <file name>.json sidecar file next to the data file if not passed
+    :param workers: number of files written concurrently, Client workers if 0
+    :param memory_limit: max amount of bytes being written at once, Client memory limit if 0
+    """
+    attrs_fn = attrs_fn or SidecarAttrs()
+    workers = workers or get_workers(collection)
+    memory_limit = memory_limit or get_memory_limit(collection)
+    chunk_bytes = max(min(EXPORT_CHUNK_BYTES, memory_limit // workers), 1)
+    budget = ByteBudget(memory_limit)
+    config = get_config(collection)
+    retry = (config.write_lock_timeout, config.write_lock_check_interval)
+
+    start = time.perf_counter()
+    ingested, total_bytes = 0, 0
+    errors: List[Tuple[str, str]] = []
+    with ThreadPoolExecutor(workers, thread_name_prefix="ingest") as pool:
+        pending: Dict[Future, Path] = {}
+
+        def collect(futures: Set[Future]) -> None:
+            nonlocal ingested, total_bytes
+            for future in futures:
+                path = pending.pop(future)
+                try:
+                    total_bytes += future.result()
+                    ingested += 1
+                except Exception as e:
+                    errors.append((str(path), f"{type(e).__name__}: {e}"))
+
+        for path in iter_sources(sources):
+            # keep the amount of pending files bounded for huge backfills
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending[pool.submit(_ingest_source, collection, path, attrs_fn, budget, chunk_bytes, retry)] = path
+        collect(wait(pending).done)
+    return IngestReport(ingested, total_bytes, time.perf_counter() - start, errors)
+
+
+def ingest_collection(uri: str, name: str, sources: Iterable[str], **kwargs: Any) -> int:
+    """Open a client, ingest data files into collection and print the report, return exit code.
+
+    :param uri: uri to Deker storage
+    :param name: collection name
+    :param sources: data files and directories paths
+    :param kwargs: Client parameters
+    """
+    from deker import Client
+
+    with Client(uri, **kwargs) as client:
+        collection = client.get_collection(name)
+        if collection is None:
+            raise click.ClickException(f"Collection {name} doesn't exist")
+        report = ingest(collection, sources)
+    click.echo(repr(report))
+    return int(bool(report.errors))
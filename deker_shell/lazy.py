@@ -0,0 +1,65 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib
+
+from threading import Thread
+from typing import Any, Dict
+
+
+# modules needed only by the interactive mode
+REPL_MODULES = ("ptpython.repl", "jedi", "deker_shell.config")
+
+
+def deker_namespace() -> Dict[str, Any]:
+    """Import deker public objects, numpy and datetime for the shell namespace.
+
+    These imports are the main part of the shell start time, so they are done only
+    when the chosen mode needs them.
+    """
+    import datetime
+
+    import deker
+    import numpy as np
+
+    namespace: Dict[str, Any] = {name: getattr(deker, name) for name in deker.__all__}
+    namespace.update(np=np, datetime=datetime)
+    return namespace
+
+
+def _import_quietly(*modules: str) -> None:
+    """Import modules ignoring errors: they will be raised again by the actual import.
+
+    :param modules: modules dotted names
+    """
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+
+
+def preload(*modules: str) -> Thread:
+    """Import modules on a daemon thread while the main thread keeps working.
+
+    Module imports are guarded by the import lock, so a later import of the same module
+    in the main thread just waits for the background one to finish.
+
+    :param modules: modules dotted names
+    """
+    thread = Thread(target=_import_quietly, args=modules, name="deker-shell-preload", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,441 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import select
+import sys
+import time
+
+from collections import deque
+from pathlib import Path
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple  # noqa: I101
+
+
+if TYPE_CHECKING:
+    from deker import Client
+
+# kinds of deker lock files by extension
+LOCK_FILES = {
+    ".arrayreadlock": "read",
+    ".varraylock": "varray write",
+    ".arrlock": "array",
+}
+# collection locks and array write locks are flocks of the collection .lock and the array files
+FLOCKED_FILES = {".lock": "collection", ".hdf5": "write", ".json": "metadata"}
+# seconds after which a lock is rechecked even without file events, e.g. released on another NFS client
+LOCK_RECHECK_INTERVAL = 1.0
+# waits kept in LockWaiter.records
+LOCK_WAIT_RECORDS = 100
+
+# inotify events after which locks are rechecked: lock files removed, flocked files closed
+IN_CLOSE_WRITE = 0x008
+IN_CLOSE_NOWRITE = 0x010
+IN_MOVED_FROM = 0x040
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+LOCK_EVENTS = IN_CLOSE_WRITE | IN_CLOSE_NOWRITE | IN_MOVED_FROM | IN_DELETE
+
+
+def is_running(pid: int) -> bool:
+    """Check if process is running on this machine.
+
+    :param pid: process id
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def lock_owner(name: str) -> Optional[int]:
+    """Return id of the process which lock file name has, None if it has none.
+
+    Read locks are named ``id:uuid:pid:thread.arrayreadlock``, varray locks ``file:pid.varraylock``.
+
+    :param name: lock file name
+    """
+    stem = name.rsplit(".", 1)[0]
+    parts = stem.split(":")
+    pid = parts[2] if name.endswith(".arrayreadlock") and len(parts) > 2 else parts[-1]
+    return int(pid) if len(parts) > 1 and pid.isdigit() else None
+
+
+def get_flock_owners() -> Dict[Tuple[int, int], Tuple[int, str]]:
+    """Return process id and mode of flocks held on this machine by device and inode, empty if unknown."""
+    owners: Dict[Tuple[int, int], Tuple[int, str]] = {}
+    try:
+        with open("/proc/locks") as f:
+            lines = f.readlines()
+    except OSError:
+        return owners
+    for line in lines:
+        # "1: FLOCK  ADVISORY  WRITE 1234 fd:01:567 0 EOF", waiters have "->" after the number
+        fields = line.split()
+        if len(fields) < 6 or fields[1] != "FLOCK":
+            continue
+        try:
+            major, minor, inode = fields[5].split(":")
+            owners[(os.makedev(int(major, 16), int(minor, 16)), int(inode))] = (int(fields[4]), fields[3].lower())
+        except ValueError:
+            continue
+    return owners
+
+
+class HeldLock(NamedTuple):
+    """Deker lock held in the storage."""
+
+    collection: str
+    kind: str
+    # array or varray id, empty for collection locks
+    array: str
+    pid: Optional[int]
+    # seconds since the lock file was created, None for flocks
+    age: Optional[float]
+    path: Path
+
+    @property
+    def alive(self) -> Optional[bool]:
+        """Check if the lock owner process is running, None if it is unknown."""
+        return is_running(self.pid) if self.pid is not None else None
+
+
+class LockTable(NamedTuple):
+    """Locks held in the storage."""
+
+    locks: List[HeldLock]
+    time: float
+
+    def __repr__(self) -> str:
+        from deker_shell.profiling import format_time
+
+        if not self.locks:
+            return f"no locks held (listed in {format_time(self.time)})"
+        rows = [("collection", "kind", "array", "pid", "age", "path")]
+        for lock in self.locks:
+            pid = "?" if lock.pid is None else f"{lock.pid}{'' if lock.alive else ' (dead)'}"
+            age = "-" if lock.age is None else f"{lock.age:.0f}s"
+            rows.append((lock.collection, lock.kind, lock.array or "-", pid, age, lock.path.name))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]) - 1)]
+        lines = ["  ".join(value.ljust(width) for value, width in zip(row, widths)) + "  " + row[-1] for row in rows]
+        lines.append(f"{len(self.locks)} locks held (listed in {format_time(self.time)})")
+        return "\n".join(lines)
+
+
+def _iter_files(path: Path) -> Iterator[os.DirEntry]:
+    """Yield files under directory, without following symlinks.
+
+    :param path: directory path
+    """
+    try:
+        entries = list(os.scandir(path))
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_files(Path(entry.path))
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+
+def _file_lock(
+    collection: str, entry: os.DirEntry, flocks: Dict[int, Tuple[int, str]], now: float
+) -> Optional[HeldLock]:
+    """Return lock which file is, None if it isn't a held lock.
+
+    :param collection: collection name
+    :param entry: file entry
+    :param flocks: flocks owners on the storage device by inode
+    :param now: time of listing
+    """
+    name = entry.name
+    suffix = os.path.splitext(name)[1]
+    if suffix in LOCK_FILES:
+        try:
+            age = now - entry.stat(follow_symlinks=False).st_mtime
+        except FileNotFoundError:
+            # released while listed
+            return None
+        array = name.split(":", 1)[0].split(".", 1)[0]
+        return HeldLock(collection, LOCK_FILES[suffix], array, lock_owner(name), age, Path(entry.path))
+    owner = flocks.get(entry.inode()) if suffix in FLOCKED_FILES else None
+    if owner is None:
+        return None
+    array = "" if suffix == ".lock" else name.split(".", 1)[0]
+    # shared flocks are taken by other HDF5 readers, they block deker writes as well
+    kind = FLOCKED_FILES[suffix] if owner[1] == "write" else "shared"
+    return HeldLock(collection, kind, array, owner[0], None, Path(entry.path))
+
+
+def locks(client: "Client", collection: Optional[str] = None) -> LockTable:
+    """List deker locks held in the storage: lock files and flocks, with their owner process and age.
+
+    Flocks of collections and of arrays being written are found in /proc/locks, so they are listed
+    on Linux only and only for processes of this machine.
+
+    Example:
+        > locks()
+        > [lock for lock in locks("weather").locks if not lock.alive]
+
+    :param client: Client instance
+    :param collection: collection name, all the collections if None
+    """
+    from deker_shell.utils import get_config
+
+    uri = get_config(client).uri
+    if not uri.startswith("file://"):
+        raise ValueError(f"Locks are only listed in local file:// storages, not in {uri}")
+    started = time.perf_counter()
+    root = Path(client.root_path)
+    device = root.stat().st_dev if root.exists() else None
+    flocks = {inode: owner for (dev, inode), owner in get_flock_owners().items() if dev == device}
+    now = time.time()
+    held = []
+    for entry in sorted(os.scandir(root), key=lambda item: item.name) if root.exists() else []:
+        name = entry.name[: -len(".lock")] if entry.name.endswith(".lock") else entry.name
+        if collection is not None and name != collection:
+            continue
+        files = [entry] if entry.is_file(follow_symlinks=False) else _iter_files(Path(entry.path))
+        for file in files:
+            lock = _file_lock(name, file, flocks, now)
+            if lock is not None:
+                held.append(lock)
+    return LockTable(held, time.perf_counter() - started)
+
+
+class Inotify:
+    """Minimal inotify watcher of directories on top of libc.
+
+    :param paths: directories to watch
+    :param mask: inotify events mask
+    """
+
+    def __init__(self, paths: List[Path], mask: int = LOCK_EVENTS) -> None:
+        libc = self.libc()
+        if libc is None:
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError("inotify_init1 failed")
+        try:
+            for path in paths:
+                if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+                    raise OSError(f"Can't watch {path}")
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    @staticmethod
+    def libc() -> Optional[Any]:
+        """Return libc with inotify functions, None if the platform has no inotify."""
+        if not sys.platform.startswith("linux"):
+            return None
+        import ctypes
+        import ctypes.util
+
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        except OSError:
+            return None
+        return libc if hasattr(libc, "inotify_init1") else None
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for events and consume them, return if there were any.
+
+        :param timeout: max seconds to wait
+        """
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        """Stop watching."""
+        os.close(self.fd)
+
+
+def _watched_dirs(check_func_args: tuple, caller: Any) -> List[Path]:
+    """Return directories where the awaited locks are released.
+
+    Array write locks pass the directory of the array read locks; VArray write locks keep the locked
+    arrays files in ``currently_locked`` of the waiting method.
+
+    :param check_func_args: arguments of deker lock check function
+    :param caller: frame of the waiting deker lock method
+    """
+    dirs = [arg for arg in check_func_args if isinstance(arg, Path)]
+    if caller is not None:
+        dirs.extend(Path(path).parent for path in caller.f_locals.get("currently_locked", ()))
+    return [path for path in dict.fromkeys(dirs) if path.is_dir()]
+
+
+class LockWait(NamedTuple):
+    """Wait of a deker write for locks held by others."""
+
+    started: float
+    time: float
+    acquired: bool
+    events: bool
+
+
+class LockWaiter:
+    """Deker write locks waiting on inotify events instead of sleeping for the check interval.
+
+    Replaces deker ``wait_for_unlock``, so writes blocked by read locks and VArray writes blocked by
+    arrays locks resume as soon as the lock files are removed or the locked files are closed; locks are
+    still rechecked every ``LOCK_RECHECK_INTERVAL`` seconds. Without inotify the waits are polled as
+    deker does. Wait time is counted for the shell telemetry and execution records.
+
+    Example:
+        > lock_waiter  # waits of this session
+
+    :param use_events: wait on inotify events if available, poll otherwise
+    """
+
+    def __init__(self, use_events: bool = True) -> None:
+        self.use_events = use_events and Inotify.libc() is not None
+        self.waits = 0
+        self.wait_time = 0.0
+        self.records: Deque[LockWait] = deque(maxlen=LOCK_WAIT_RECORDS)
+        self._lock = Lock()
+        self._original: Optional[Callable] = None
+
+    def install(self) -> "LockWaiter":
+        """Replace deker lock waiting."""
+        global _installed
+
+        if self._original is None:
+            from deker import locks as deker_locks
+
+            self._original = deker_locks.wait_for_unlock
+            deker_locks.wait_for_unlock = self.wait
+            _installed = self
+        return self
+
+    def uninstall(self) -> None:
+        """Restore deker lock waiting."""
+        global _installed
+
+        if self._original is not None:
+            from deker import locks as deker_locks
+
+            deker_locks.wait_for_unlock = self._original
+            self._original = None
+            if _installed is self:
+                _installed = None
+
+    def __enter__(self) -> "LockWaiter":
+        return self.install()
+
+    def __exit__(self, *args: Any) -> None:
+        self.uninstall()
+
+    def _wait_events(self, check: Callable[[], bool], dirs: List[Path], timeout: float, interval: float) -> bool:
+        """Wait until check passes, rechecking on file events in dirs.
+
+        :param check: lock release check
+        :param dirs: directories to watch
+        :param timeout: max seconds to wait
+        :param interval: deker check interval, the max recheck interval if it is longer than the default one
+        """
+        deadline = time.monotonic() + timeout
+        recheck = max(interval, LOCK_RECHECK_INTERVAL)
+        watcher = Inotify(dirs)
+        try:
+            # checked again after the watch is set, not to miss a release between the checks
+            while not check():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                watcher.wait(min(remaining, recheck))
+            return True
+        finally:
+            watcher.close()
+
+    def wait(self, check_func: Callable, check_func_args: tuple, timeout: int, interval: float) -> bool:
+        """Wait for locks release as deker ``wait_for_unlock`` does, return False on timeout.
+
+        :param check_func: function checking if locks are released
+        :param check_func_args: its arguments
+        :param timeout: max seconds to wait
+        :param interval: seconds between checks
+        """
+        if check_func(*check_func_args):
+            return True
+        started = time.perf_counter()
+        dirs = _watched_dirs(check_func_args, sys._getframe(1)) if self.use_events else []
+        acquired = False
+        try:
+            if dirs:
+                acquired = self._wait_events(lambda: check_func(*check_func_args), dirs, timeout, interval)
+            else:
+                acquired = (self._original or _poll)(check_func, check_func_args, timeout, interval)
+            return acquired
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.waits += 1
+                self.wait_time += elapsed
+                self.records.append(LockWait(time.time() - elapsed, elapsed, acquired, bool(dirs)))
+
+    def __repr__(self) -> str:
+        from deker_shell.profiling import format_time
+
+        mode = "inotify events" if self.use_events else "polling"
+        lines = [f"LockWaiter ({mode}): {self.waits} waits, {format_time(self.wait_time)} waited"]
+        for record in list(self.records)[-10:]:
+            started = time.strftime("%H:%M:%S", time.localtime(record.started))
+            outcome = "acquired" if record.acquired else "timed out"
+            lines.append(f"{started} {format_time(record.time)} {outcome}{'' if record.events else ' (polled)'}")
+        return "\n".join(lines)
+
+
+def _poll(check_func: Callable, check_func_args: tuple, timeout: float, interval: float) -> bool:
+    """Poll check function as deker does, return False on timeout.
+
+    :param check_func: function checking if locks are released
+    :param check_func_args: its arguments
+    :param timeout: max seconds to wait
+    :param interval: seconds between checks
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() <= deadline:
+        if check_func(*check_func_args):
+            return True
+        time.sleep(interval)
+    return False
+
+
+_installed: Optional[LockWaiter] = None
+
+
+def get_lock_waiter() -> Optional[LockWaiter]:
+    """Return installed LockWaiter, None if deker waits for locks by itself."""
+    return _installed
+
+
+def get_lock_wait_time() -> float:
+    """Return seconds waited for deker locks by the installed LockWaiter, 0 if none is installed."""
+    return _installed.wait_time if _installed is not None else 0.0
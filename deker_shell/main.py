@@ -15,56 +15,110 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio
-import datetime  # noqa F401
+import functools
 import runpy
 import sys
+from contextlib import nullcontext
 from pathlib import Path
 
-from typing import TYPE_CHECKING, Optional, Union, Any  # noqa: I101
+from typing import TYPE_CHECKING, Any, ContextManager, Dict, List, Optional, TextIO, Tuple, Union  # noqa: I101
 
 import click as click
-import numpy as np  # noqa F401
 from click import Context, ClickException
 
-from deker import *  # noqa F403
-from ptpython.repl import embed
-
-from deker_shell.config import configure
 from deker_shell.consts import help_start
 from deker_shell.help import help  # noqa F401
-from deker_shell.utils import validate_uri
+from deker_shell.lazy import REPL_MODULES, preload
+from deker_shell.profiling import mem, prof, timeit  # noqa F401
+from deker_shell.utils import parse_storages, validate_uri
 
 if TYPE_CHECKING:
     from deker import Client, Collection
 
-collection: Optional[Collection] = None  # default collection variable, set by use("coll_name") method
-client: Optional[Client] = None  # default variable for Client instance
+    from deker_shell.index import AttributeIndex
+    from deker_shell.locks import LockWaiter
+    from deker_shell.read_cache import ReadCache
+    from deker_shell.telemetry import Telemetry
+    from deker_shell.trace import Tracer
+
+collection: Optional["Collection"] = None  # default collection variable, set by use("coll_name") method
+client: Optional["Client"] = None  # default variable for Client instance
+index: Optional["AttributeIndex"] = None  # attributes index of collection, set by use("coll_name") with --index
 
 
-async def interactive_shell(uri: str, **kwargs: Any) -> None:
+async def interactive_shell(
+    uri: str,
+    telemetry: Optional["Telemetry"] = None,
+    telemetry_log: Optional[str] = None,
+    use_index: bool = False,
+    read_cache: Optional["ReadCache"] = None,
+    storages: Optional[Dict[str, str]] = None,
+    tracer: Optional["Tracer"] = None,
+    trace_path: Optional[str] = None,
+    lock_waiter: Optional["LockWaiter"] = None,
+    **kwargs: Any,
+) -> None:
     """Coroutine that starts a Python REPL from which we can access the Deker interface.
 
     :param uri: uri to Deker storage
+    :param telemetry: session telemetry, shown in a toolbar and set to 'telemetry' variable if passed
+    :param telemetry_log: path to CSV or JSON file to write per-statement telemetry log to on exit
+    :param use_index: build or refresh local attributes index of a collection on use("coll_name")
+    :param read_cache: session cache of subset reads, set to 'read_cache' variable if passed
+    :param storages: extra storages uris by name, connected on first access through 'clients' variable
+    :param tracer: session tracer of deker calls, set to 'tracer' variable if passed
+    :param trace_path: path to write session trace to on exit
+    :param lock_waiter: installed waiter of deker locks, set to 'lock_waiter' variable if passed
     :param kwargs: Client parameters
     """
     global client
+    # ptpython and jedi are imported in background while deker is imported and the client is opened
+    preload(*REPL_MODULES)
+    namespace = prefetch = io_counters = None
     try:
+        from deker import Client
+
+        from deker_shell.batch import close_namespace, make_namespace
+        from deker_shell.explain import explain
+        from deker_shell.prefetch import MetadataPrefetch, load_recent, record_recent
+        from deker_shell.telemetry import IOCounters
+
         client = Client(uri, **kwargs)
-        collections: list[str] = [coll.name for coll in client]
+        # collections metadata is loaded while the banner and the REPL are built
+        prefetch = MetadataPrefetch(client, load_recent(uri)).start()
+        # the same preset variables as scripts get, the REPL ones below shadow them
+        namespace = make_namespace(client, storages, **kwargs)
+        del namespace["__name__"]
+        globals().update(namespace)
+        # session read throughput for explain() estimates, shared with telemetry if it is on
+        io_counters = telemetry.io if telemetry is not None else IOCounters()
+        explain = functools.partial(explain, counters=io_counters)  # noqa F841
 
         def use(name: str) -> None:
             """Get collection from client and saves it to collection variable.
 
             :param name: collection name
             """
-            global collection
-            collection = client.get_collection(name)  # type: ignore
+            global collection, index
+            collection = prefetch.get(name) or client.get_collection(name)  # type: ignore
             if not collection:
                 print(f"Collection {name} doesn't exist")
             else:
                 print(f"Saved {collection.name} to 'collection' variable")
+                record_recent(uri, name)
+                if use_index:
+                    from deker_shell.index import AttributeIndex
+
+                    if index is not None:
+                        index.close()
+                    index = AttributeIndex(collection)
+                    report = index.refresh()
+                    print(
+                        f"Indexed {collection.name} attributes to 'index' variable: {report.added} added, "
+                        f"{report.updated} updated, {report.removed} removed in {report.time:.3f}s"
+                    )
 
-        def get_global_coll_variable() -> Collection:
+        def get_global_coll_variable() -> "Collection":
             """Return 'collection' global variable."""
             return globals()["collection"]
 
@@ -72,6 +126,22 @@ async def interactive_shell(uri: str, **kwargs: Any) -> None:
             sys.exit("Client is closed")
 
         click.echo(help_start)
+        from ptpython.repl import embed
+
+        from deker_shell.config import configure
+
+        # started first and stopped last, as it wraps the same deker methods as telemetry and read cache
+        if tracer is not None:
+            tracer.start()
+        if telemetry is not None:
+            telemetry.install()
+            configure = functools.partial(configure, telemetry=telemetry)
+        else:
+            io_counters.install()
+        # installed after telemetry, so that telemetry counts only reads that reach the storage
+        if read_cache is not None:
+            read_cache.install()
+
         await embed(  # type: ignore
             globals=globals(), locals=locals(), return_asyncio_coroutine=True, patch_stdout=True, configure=configure
         )
@@ -79,6 +149,23 @@ async def interactive_shell(uri: str, **kwargs: Any) -> None:
         # Stop the loop when quitting the repl. (Ctrl-D press.)
         asyncio.get_running_loop().stop()
     finally:
+        if prefetch is not None:
+            prefetch.cancel(timeout=1)
+        if namespace is not None:
+            close_namespace(namespace)
+        if read_cache is not None:
+            read_cache.uninstall()
+        if io_counters is not None:
+            io_counters.uninstall()
+        if telemetry is not None:
+            telemetry.uninstall()
+            if telemetry_log:
+                telemetry.export(telemetry_log)
+        if tracer is not None:
+            tracer.stop()
+            if trace_path:
+                chrome, collapsed = tracer.export(trace_path)
+                click.echo(f"Trace written to {chrome} and {collapsed}")
         if client is not None:
             try:
                 client.close()
@@ -87,6 +174,103 @@ async def interactive_shell(uri: str, **kwargs: Any) -> None:
                 pass
 
 
+def open_shell(
+    uri: str,
+    use_index: bool = False,
+    read_cache: Optional[str] = None,
+    storages: Optional[Dict[str, str]] = None,
+    with_telemetry: bool = False,
+    telemetry_log: Optional[str] = None,
+    trace_path: Optional[str] = None,
+    inotify_locks: bool = False,
+    **kwargs: Any,
+) -> None:
+    """Set up session telemetry, tracing, locks waiting and read cache and run the interactive shell until it is closed.
+
+    :param uri: uri to Deker storage
+    :param use_index: keep local attributes index of the used collection
+    :param read_cache: size of session subset reads cache, memory limit or a quarter of RAM if "0"
+    :param storages: extra storages uris by name
+    :param with_telemetry: show per-statement resource use toolbar
+    :param telemetry_log: path to CSV or JSON file to write per-statement telemetry log to on exit
+    :param trace_path: path to write Chrome trace of the session deker calls to on exit
+    :param inotify_locks: wait for deker locks on inotify events and count lock wait time per statement
+    :param kwargs: Client parameters
+    """
+    telemetry = None
+    if with_telemetry or telemetry_log:
+        from deker_shell.telemetry import Telemetry
+
+        telemetry = Telemetry()
+
+    cache = None
+    if read_cache is not None:
+        from deker_shell.read_cache import ReadCache, get_cache_size
+
+        cache = ReadCache(get_cache_size(read_cache, kwargs.get("memory_limit")))
+
+    tracer = None
+    if trace_path:
+        from deker_shell.trace import Tracer
+
+        tracer = Tracer("session")
+
+    with waiting_locks(inotify_locks) or nullcontext() as lock_waiter:
+        asyncio.run(
+            interactive_shell(
+                uri, telemetry, telemetry_log, use_index, cache, storages, tracer, trace_path, lock_waiter, **kwargs
+            )
+        )
+
+
+def traced(path: Optional[str], name: str) -> ContextManager:
+    """Return context tracing deker calls and writing the trace to path, doing nothing if path is not set.
+
+    :param path: Chrome trace JSON file path
+    :param name: name of the root span
+    """
+    if not path:
+        return nullcontext()
+
+    from deker_shell.trace import trace
+
+    return trace(path, name)
+
+
+def waiting_locks(inotify_locks: bool) -> Optional["LockWaiter"]:
+    """Return deker locks waiter on inotify events if enabled.
+
+    :param inotify_locks: wait for deker locks on inotify events instead of polling
+    """
+    if not inotify_locks:
+        return None
+
+    from deker_shell.locks import LockWaiter
+
+    return LockWaiter()
+
+
+def get_client_kwargs(args: List[str], **options: Any) -> Dict[str, Any]:
+    """Return Client parameters from the command line options and extra arguments.
+
+    :param args: extra command line arguments, ``--key value`` or ``--key.inner_key value`` pairs
+    :param options: deker client default parameters, unset ones are skipped
+    """
+    kwargs: Dict[str, Any] = {key: value for key, value in options.items() if value}
+
+    # extra parameters
+    for i in range(0, len(args), 2):
+        key = args[i].replace("-", "")
+        value = args[i + 1]
+        if "." in args[i]:
+            kwargs_key, inner_key = key.split(".", 1)
+            kwargs[kwargs_key] = {}
+            kwargs[kwargs_key][inner_key] = value
+        else:
+            kwargs[key] = value
+    return kwargs
+
+
 @click.command(context_settings=dict(ignore_unknown_options=True, allow_extra_args=True))
 @click.argument("uri", required=True, type=str)
 @click.option("-w", "--workers", type=int, help="Number of threads for Deker.")
@@ -115,6 +299,166 @@ async def interactive_shell(uri: str, **kwargs: Any) -> None:
     " Human representations will be converted into bytes. "
     "If result is <= 0, total RAM + total swap is used.",
 )
+@click.option(
+    "-e",
+    "--execute",
+    type=str,
+    multiple=True,
+    help="Python statement to execute against the storage without starting the REPL. "
+    "May be repeated. Results are printed to stdout as NDJSON, one record per statement.",
+)
+@click.option(
+    "-s",
+    "--script",
+    type=click.File("r"),
+    help="Python script to execute against the storage statement by statement without starting the REPL, "
+    "'-' reads it from stdin. Results are printed to stdout as NDJSON, one record per statement.",
+)
+@click.option(
+    "-r",
+    "--run",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help="Python script to run against the storage in a process pool, may be repeated. "
+    "Each worker process has its own Client built from the options above.",
+)
+@click.option(
+    "--collection",
+    "run_collections",
+    type=str,
+    multiple=True,
+    help="Collection name to run each --run script against, may be repeated. "
+    "The collection is set to the 'collection' variable of the script.",
+)
+@click.option(
+    "-j", "--jobs", type=int, help="Number of worker processes for --run scripts and --check, CPU count by default."
+)
+@click.option("--summary", type=click.Path(dir_okay=False, writable=True), help="Path to --run JSON summary file.")
+@click.option(
+    "--export",
+    "export_args",
+    type=(str, click.Path(file_okay=False, writable=True)),
+    help="Export collection NAME arrays to .npy files in DIR with a manifest, without starting the REPL. "
+    "Arrays are exported on --workers threads with at most --memory-limit bytes in flight. "
+    "Restarting an interrupted export skips the arrays already exported.",
+    metavar="NAME DIR",
+)
+@click.option(
+    "--ingest",
+    "ingest_args",
+    type=(str, click.Path(exists=True)),
+    help="Create an array in collection NAME for each .npy or raw data file in PATH (a file or a directory) "
+    "and write its data, without starting the REPL. Attributes are taken from an export manifest.jsonl "
+    "or <file name>.json sidecar files. Files are written on --workers threads with at most --memory-limit "
+    "bytes in flight, writes to locked arrays are retried for --write-lock-timeout.",
+    metavar="NAME PATH",
+)
+@click.option(
+    "--index",
+    "use_index",
+    is_flag=True,
+    help="Keep a local SQLite index of collection attributes, built or refreshed on use('coll_name') and "
+    "available in 'index' variable for fast range, prefix and multi-attribute queries.",
+)
+@click.option(
+    "--read-cache",
+    type=str,
+    is_flag=False,
+    flag_value="0",
+    help="Cache subset reads of the session in RAM, up to SIZE bytes or a human size like '512M'. "
+    "Without SIZE --memory-limit is used, or a quarter of RAM if it is not set. "
+    "Cached data of an array is dropped when it is updated or cleared in the session. "
+    "Counters are available in 'read_cache' variable.",
+    metavar="[SIZE]",
+)
+@click.option(
+    "--storage",
+    "storages",
+    type=str,
+    multiple=True,
+    callback=parse_storages,
+    help="Extra storage as NAME=URI, may be repeated. Storages are available in 'clients' variable, "
+    "e.g. clients['NAME'], and are connected on first access with the options above; "
+    "the main storage is clients['default']. copy(collection, 'NAME') copies a collection between storages.",
+    metavar="NAME=URI",
+)
+@click.option(
+    "--tune",
+    "tune_name",
+    type=str,
+    is_flag=False,
+    flag_value="",
+    help="Probe cores, RAM and read/write throughput of the storage with different numbers of workers, "
+    "without starting the REPL, and save recommended --workers, --memory-limit and lock intervals. "
+    "Saved values are used by later starts with the same uri unless the options are passed. "
+    "Reads and writes sample the layout of collection NAME if it is passed, writes go to a scratch collection.",
+    metavar="[NAME]",
+)
+@click.option(
+    "--check",
+    "check_name",
+    type=str,
+    is_flag=False,
+    flag_value="",
+    help="Check integrity of the storage, or of collection NAME if it is passed, on --jobs worker processes "
+    "without starting the REPL; exits with 1 if there are findings. Findings are written to --check-report "
+    "as JSON lines; running the same command again after an interruption resumes the check.",
+    metavar="[NAME]",
+)
+@click.option(
+    "--check-level",
+    type=click.IntRange(1, 4),
+    default=2,
+    show_default=True,
+    help="--check level: 1 collections, 2 array files, metadata and locks, 3 symlinks, 4 data.",
+)
+@click.option(
+    "--check-report",
+    type=click.Path(dir_okay=False, writable=True),
+    default="deker-check.jsonl",
+    show_default=True,
+    help="Path to --check JSON lines report, its checkpoint is kept next to it.",
+)
+@click.option(
+    "--daemon",
+    is_flag=True,
+    help="Attach to a background shell daemon of the storage, starting it if needed. The daemon keeps deker, "
+    "numpy, ptpython and jedi warm, so the prompt shows up almost instantly; each session gets its own process, "
+    "Client and namespace. The daemon exits after --daemon-idle seconds without sessions.",
+)
+@click.option(
+    "--daemon-idle",
+    type=int,
+    help="Seconds without sessions after which a daemon started by --daemon exits, 900 by default.",
+)
+@click.option(
+    "--telemetry",
+    "with_telemetry",
+    is_flag=True,
+    help="Show wall time, CPU time, peak RSS growth and deker I/O of the last statement and the session "
+    "in a toolbar. Per-statement log is available in 'telemetry' variable.",
+)
+@click.option(
+    "--telemetry-log",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Path to CSV or JSON file to write per-statement telemetry log to on exit, enables --telemetry.",
+)
+@click.option(
+    "--trace",
+    "trace_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Trace deker calls (collections access, filters, subsets reads and writes, HDF5 I/O, lock checks and "
+    "waits) of the session, script or --execute statements and write them to this Chrome trace .json file, "
+    "opened by chrome://tracing, Perfetto or speedscope, with flamegraph collapsed stacks next to it in a "
+    ".folded file. The session tracer is available in 'tracer' variable; --run workers are not traced.",
+)
+@click.option(
+    "--inotify-locks",
+    is_flag=True,
+    help="Make writes of the session, script or --execute statements blocked by deker locks wait on inotify "
+    "events instead of sleeping for --write-lock-check-interval, resuming as soon as the locks are released, "
+    "and record lock wait time per statement in --telemetry and --execute records. Polls on other platforms.",
+)
 @click.pass_context
 def start(
     ctx: Context,
@@ -124,6 +468,27 @@ def start(
     write_lock_check_interval: Optional[int] = None,
     loglevel: Optional[str] = None,
     memory_limit: Optional[Union[int, str]] = None,
+    execute: Tuple[str, ...] = (),
+    script: Optional[TextIO] = None,
+    run: Tuple[str, ...] = (),
+    run_collections: Tuple[str, ...] = (),
+    jobs: Optional[int] = None,
+    summary: Optional[str] = None,
+    export_args: Optional[Tuple[str, str]] = None,
+    ingest_args: Optional[Tuple[str, str]] = None,
+    use_index: bool = False,
+    read_cache: Optional[str] = None,
+    storages: Optional[Dict[str, str]] = None,
+    tune_name: Optional[str] = None,
+    check_name: Optional[str] = None,
+    check_level: int = 2,
+    check_report: str = "deker-check.jsonl",
+    daemon: bool = False,
+    daemon_idle: Optional[int] = None,
+    with_telemetry: bool = False,
+    telemetry_log: Optional[str] = None,
+    trace_path: Optional[str] = None,
+    inotify_locks: bool = False,
 ) -> None:
     """Application entrypoint.
 
@@ -140,41 +505,105 @@ def start(
       converted into bytes. If result is ``<= 0`` - total RAM + total swap is used
 
       .. note:: This parameter is used for early runtime break in case of potential memory overflow
+    :param execute: Python statements to execute against the storage without the REPL
+    :param script: Python script to execute against the storage without the REPL
+    :param run: Python scripts to run against the storage in a process pool
+    :param run_collections: Collections names to run each of the scripts against
+    :param jobs: Number of worker processes for scripts
+    :param summary: Path to scripts run JSON summary file
+    :param export_args: Name of collection to export and export directory
+    :param ingest_args: Name of collection to ingest data files into and data file or directory path
+    :param use_index: Keep local attributes index of the used collection
+    :param read_cache: Size of session subset reads cache, --memory-limit or a quarter of RAM if "0"
+    :param storages: Extra storages uris by name
+    :param tune_name: Collection to sample when tuning Client parameters, a scratch collection if empty
+    :param check_name: Collection to check integrity of, the whole storage if empty
+    :param check_level: Integrity check level from 1 to 4
+    :param check_report: Path to integrity check report
+    :param daemon: Attach to the storage shell daemon, starting it if needed
+    :param daemon_idle: Seconds without sessions after which the daemon exits
+    :param with_telemetry: Show per-statement resource use toolbar
+    :param telemetry_log: Path to CSV or JSON file to write per-statement telemetry log to on exit
+    :param trace_path: Path to Chrome trace JSON file to write deker calls trace to
+    :param inotify_locks: Wait for deker locks on inotify events and record lock wait time per statement
     """
+    if trace_path and not trace_path.endswith(".json"):
+        raise ClickException("Trace shall be a .json file")
     if uri.endswith(".py"):
         path = Path(uri)
         if not path.exists():
             raise ClickException("File does not exist")
-        runpy.run_path(path_name=uri)
+        with traced(trace_path, "script"), waiting_locks(inotify_locks) or nullcontext():
+            runpy.run_path(path_name=uri)
     else:
         validate_uri(uri)
 
-        # deker client default parameters
-        kwargs = {
-            "workers": workers,
-            "write_lock_timeout": write_lock_timeout,
-            "write_lock_check_interval": write_lock_check_interval,
-            "loglevel": loglevel,
-            "memory_limit": memory_limit,
-        }
-        default_keys = tuple(kwargs.keys())
-        for key in default_keys:
-            if not kwargs.get(key):
-                kwargs.pop(key, None)
-
-        # extra parameters
-        if ctx.args:
-            for i in range(0, len(ctx.args), 2):
-                key = ctx.args[i].replace("-", "")
-                value = ctx.args[i + 1]
-                if "." in ctx.args[i]:
-                    kwargs_key, inner_key = key.split(".", 1)
-                    kwargs[kwargs_key] = {}
-                    kwargs[kwargs_key][inner_key] = value
-                else:
-                    kwargs[key] = value
-
-        asyncio.run(interactive_shell(uri, **kwargs))
+        from deker_shell.tune import load_profile
+
+        # options passed on the command line take precedence over the saved tuning profile
+        kwargs = load_profile(uri)
+        kwargs.update(
+            get_client_kwargs(
+                ctx.args,
+                workers=workers,
+                write_lock_timeout=write_lock_timeout,
+                write_lock_check_interval=write_lock_check_interval,
+                loglevel=loglevel,
+                memory_limit=memory_limit,
+            )
+        )
+
+        if run:
+            from deker_shell.runner import run_scripts
+
+            ctx.exit(run_scripts(uri, run, run_collections, jobs, summary, **kwargs))
+
+        if execute or script:
+            from deker_shell.batch import execute as execute_batch
+
+            with traced(trace_path, "script"), waiting_locks(inotify_locks) or nullcontext():
+                code = execute_batch(uri, execute, script, storages, **kwargs)
+            ctx.exit(code)
+
+        if export_args:
+            from deker_shell.export import export_collection
+
+            ctx.exit(export_collection(uri, *export_args, **kwargs))
+
+        if ingest_args:
+            from deker_shell.ingest import ingest_collection
+
+            name, source = ingest_args
+            ctx.exit(ingest_collection(uri, name, [source], **kwargs))
+
+        if tune_name is not None:
+            from deker_shell.tune import tune_storage
+
+            ctx.exit(tune_storage(uri, tune_name, **kwargs))
+
+        if check_name is not None:
+            from deker_shell.check import check_storage
+
+            ctx.exit(check_storage(uri, check_name, check_level, check_report, jobs, **kwargs))
+
+        if telemetry_log and not telemetry_log.endswith((".csv", ".json")):
+            raise ClickException("Telemetry log shall be a .csv or .json file")
+        session = dict(
+            use_index=use_index,
+            read_cache=read_cache,
+            storages=storages,
+            with_telemetry=with_telemetry,
+            telemetry_log=telemetry_log,
+            trace_path=trace_path,
+            inotify_locks=inotify_locks,
+            **kwargs,
+        )
+        if daemon:
+            from deker_shell.daemon import attach
+
+            ctx.exit(attach(uri, session, daemon_idle))
+
+        open_shell(uri, **session)
 
 
 if __name__ == "__main__":
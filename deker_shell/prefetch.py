@@ -0,0 +1,244 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import time
+
+from collections import OrderedDict
+from pathlib import Path
+from threading import Condition, Event, Thread, current_thread
+from typing import TYPE_CHECKING, Iterator, List, NamedTuple, Optional  # noqa: I101
+
+from deker_shell.collection_names import iter_collection_names
+from deker_shell.utils import get_local_adapter
+
+
+if TYPE_CHECKING:
+    from deker import Client, Collection
+
+PREFETCH_MAX_COLLECTIONS = 32
+RECENT_LIMIT = 10
+
+
+def default_recent_path() -> Path:
+    """Return recently used collections file: $XDG_CACHE_HOME/deker-shell/recent.json or ~/.cache/..."""
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(cache) / "deker-shell" / "recent.json"
+
+
+def load_recent(uri: str, path: Optional[Path] = None) -> List[str]:
+    """Return names of collections recently used in the storage shells, the most recent first.
+
+    :param uri: uri to Deker storage
+    :param path: recently used collections file, the default one if not set
+    """
+    try:
+        return list(json.loads((path or default_recent_path()).read_text()).get(uri, []))
+    except (OSError, ValueError, AttributeError):
+        return []
+
+
+def record_recent(uri: str, name: str, path: Optional[Path] = None) -> None:
+    """Move collection name to the top of the storage recently used collections.
+
+    :param uri: uri to Deker storage
+    :param name: collection name
+    :param path: recently used collections file, the default one if not set
+    """
+    path = path or default_recent_path()
+    try:
+        recent = json.loads(path.read_text())
+    except (OSError, ValueError):
+        recent = {}
+    names = [name] + [item for item in recent.get(uri, []) if item != name]
+    recent[uri] = names[:RECENT_LIMIT]
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.part")
+        tmp.write_text(json.dumps(recent))
+        os.replace(tmp, path)
+    except OSError:
+        # a read-only home shall not break use()
+        pass
+
+
+def count_arrays(collection: "Collection", cancelled: Optional[Event] = None) -> Optional[int]:
+    """Count collection arrays by their files, None for storages without local files or if cancelled.
+
+    :param collection: Collection instance
+    :param cancelled: event stopping the count
+    """
+    adapter = get_local_adapter(collection)
+    if adapter is None:
+        return None
+    count = 0
+    for _, _, names in os.walk(adapter.collection_path / adapter.data_dir):
+        if cancelled is not None and cancelled.is_set():
+            return None
+        count += sum(name.endswith(adapter.file_ext) for name in names)
+    return count
+
+
+class Prefetched(NamedTuple):
+    """Collection with metadata loaded in background."""
+
+    collection: "Collection"
+    arrays: Optional[int]
+    time: float
+
+
+class MetadataPrefetch:
+    """Collections metadata loaded on a background thread while the REPL starts.
+
+    Recently used collections are loaded first, then the others in the storage order, up to
+    ``max_collections``; the least recently loaded ones are dropped to keep that bound.
+    ``use()`` takes the collection from here if it is loaded and not older than ``ttl`` seconds,
+    waiting for it if it is being loaded right now.
+
+    Example:
+        > prefetch  # loaded collections and arrays counts
+        > prefetch.count("weather")
+        > prefetch.cancel()
+
+    :param client: Client instance
+    :param recent: recently used collections names, the most recent first
+    :param max_collections: max amount of loaded collections
+    :param ttl: seconds after which a loaded collection is not used
+    """
+
+    def __init__(
+        self,
+        client: "Client",
+        recent: Optional[List[str]] = None,
+        max_collections: int = PREFETCH_MAX_COLLECTIONS,
+        ttl: Optional[float] = 60.0,
+    ) -> None:
+        self.client = client
+        self.recent = list(recent or [])
+        self.max_collections = max_collections
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Prefetched]" = OrderedDict()
+        self._loading: Optional[str] = None
+        self._condition = Condition()
+        self._cancelled = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self) -> "MetadataPrefetch":
+        """Start loading on a daemon thread."""
+        self._thread = Thread(target=self._run, name="deker-shell-prefetch", daemon=True)
+        self._thread.start()
+        return self
+
+    def _names(self) -> Iterator[str]:
+        seen = set()
+        for name in self.recent:
+            if name not in seen:
+                seen.add(name)
+                yield name
+        for name in iter_collection_names(self.client):
+            if len(seen) >= self.max_collections:
+                return
+            if name not in seen:
+                seen.add(name)
+                yield name
+
+    def _run(self) -> None:
+        try:
+            for name in self._names():
+                if self._cancelled.is_set():
+                    return
+                with self._condition:
+                    self._loading = name
+                try:
+                    collection = self.client.get_collection(name)
+                    arrays = count_arrays(collection, self._cancelled) if collection is not None else None
+                except Exception:
+                    # a broken collection is loaded again by use() to show the error
+                    collection = None
+                with self._condition:
+                    if collection is not None:
+                        self._entries[name] = Prefetched(collection, arrays, time.monotonic())
+                        while len(self._entries) > self.max_collections:
+                            self._entries.popitem(last=False)
+                    self._loading = None
+                    self._condition.notify_all()
+        except Exception:
+            pass
+        finally:
+            with self._condition:
+                self._loading = None
+                self._condition.notify_all()
+
+    def _entry(self, name: str, wait: bool) -> Optional[Prefetched]:
+        with self._condition:
+            while wait and self._loading == name:
+                self._condition.wait()
+            entry = self._entries.get(name)
+        if entry is None or (self.ttl is not None and time.monotonic() - entry.time > self.ttl):
+            return None
+        return entry
+
+    def get(self, name: str, wait: bool = True) -> Optional["Collection"]:
+        """Return loaded collection, None if it isn't loaded or is outdated.
+
+        :param name: collection name
+        :param wait: wait for the collection if it is being loaded
+        """
+        entry = self._entry(name, wait)
+        return entry.collection if entry is not None else None
+
+    def count(self, name: str) -> Optional[int]:
+        """Return amount of arrays of loaded collection, None if it isn't known.
+
+        :param name: collection name
+        """
+        entry = self._entry(name, wait=True)
+        return entry.arrays if entry is not None else None
+
+    @property
+    def is_running(self) -> bool:
+        """Check if loading is in progress."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Wait for the loading to finish.
+
+        :param timeout: max seconds to wait
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def cancel(self, timeout: Optional[float] = None) -> None:
+        """Stop loading after the current collection and wait for the thread.
+
+        :param timeout: max seconds to wait for the thread
+        """
+        self._cancelled.set()
+        if self._thread is not None and self._thread is not current_thread():
+            self._thread.join(timeout)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        state = "running" if self.is_running else ("cancelled" if self._cancelled.is_set() else "done")
+        with self._condition:
+            items = [
+                f"{name} ({entry.arrays} arrays)" if entry.arrays is not None else name
+                for name, entry in self._entries.items()
+            ]
+        return f"MetadataPrefetch ({state}): {len(items)} collections loaded" + "".join(f"\n{item}" for item in items)
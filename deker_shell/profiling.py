@@ -0,0 +1,148 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import cProfile
+import pstats
+import sys
+import tracemalloc
+
+from timeit import Timer
+from types import FrameType
+from typing import Any, Callable, Optional, Union
+
+
+Expression = Union[str, Callable[[], Any]]
+
+
+def _to_callable(expr: Expression, frame: Optional[FrameType]) -> Callable[[], Any]:
+    """Compile expression string in the caller namespace.
+
+    :param expr: python expression or statement string, or a callable without arguments
+    :param frame: caller frame
+    """
+    if callable(expr):
+        return expr
+    if not isinstance(expr, str):
+        raise TypeError("expr shall be a string with python code or a callable without arguments")
+
+    globals_ = frame.f_globals if frame else {}
+    locals_ = frame.f_locals if frame else {}
+    try:
+        code = compile(expr, "<shell>", "eval")
+    except SyntaxError:
+        code = compile(expr, "<shell>", "exec")
+    return lambda: eval(code, globals_, locals_)  # nosec B307
+
+
+def format_time(seconds: float) -> str:
+    """Return human representation of time interval.
+
+    :param seconds: time interval in seconds
+    """
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def format_bytes(size: float) -> str:
+    """Return human representation of bytes amount.
+
+    :param size: amount of bytes
+    """
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{sign}{size:.4g} {unit}"
+        size /= 1024
+    return f"{sign}{size:.4g} TB"
+
+
+def timeit(expr: Expression, number: int = 0, repeat: int = 5) -> None:
+    """Time repeated execution of expression and print the best and mean time per loop.
+
+    Example:
+        > timeit("array[0, :].read()")
+        # 10 loops, best of 5: 1.2 ms per loop (mean 1.3 ms)
+
+    :param expr: python code string, evaluated in the shell namespace, or a callable without arguments
+    :param number: amount of executions per measurement, chosen automatically to take at least 0.2s if 0
+    :param repeat: amount of measurements
+    """
+    timer = Timer(_to_callable(expr, sys._getframe(1)))
+    if number <= 0:
+        number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    loops = "loop" if number == 1 else "loops"
+    print(
+        f"{number} {loops}, best of {repeat}: {format_time(min(times))} per loop "
+        f"(mean {format_time(sum(times) / len(times))})"
+    )
+
+
+def prof(expr: Expression, sort: str = "cumulative", limit: int = 20) -> None:
+    """Profile expression with cProfile and print the hottest functions.
+
+    Example:
+        > prof("collection.filter({'id': array_id}).last()", sort="tottime")
+
+    :param expr: python code string, evaluated in the shell namespace, or a callable without arguments
+    :param sort: pstats sort key, e.g. "cumulative", "tottime" or "ncalls"
+    :param limit: amount of functions to print
+    """
+    func = _to_callable(expr, sys._getframe(1))
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        func()
+    finally:
+        profiler.disable()
+        pstats.Stats(profiler, stream=sys.stdout).strip_dirs().sort_stats(sort).print_stats(limit)
+
+
+def mem(expr: Expression, limit: int = 10) -> None:
+    """Trace memory allocations of expression with tracemalloc and print peak and top retained allocations.
+
+    Example:
+        > mem("subset.read()")
+
+    :param expr: python code string, evaluated in the shell namespace, or a callable without arguments
+    :param limit: amount of top allocating lines to print
+    """
+    func = _to_callable(expr, sys._getframe(1))
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        start_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            func()
+        finally:
+            size, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    print(f"peak: {format_bytes(peak - start_size)}, retained: {format_bytes(size - start_size)}")
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        print(f"{format_bytes(stat.size_diff):>12}  {stat.count_diff:>+8} blocks  {frame.filename}:{frame.lineno}")
@@ -0,0 +1,239 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple, Union  # noqa: I101
+
+import numpy as np
+
+from deker_shell.profiling import format_bytes
+
+
+Key = Tuple[str, Tuple[Hashable, ...]]
+
+
+def normalize_bounds(bounds: Any, shape: Tuple[int, ...]) -> Tuple[Hashable, ...]:
+    """Return hashable bounds with resolved negative indexes, open slices and omitted dimensions.
+
+    ``array[2]``, ``array[2, :]`` and ``array[-8, 0:]`` of an array of shape (10, 5) give the same bounds.
+
+    :param bounds: subset bounds: an index, a slice, an Ellipsis or a tuple of them
+    :param shape: array shape
+    """
+    if not isinstance(bounds, tuple):
+        bounds = (bounds,)
+    if any(bound is Ellipsis for bound in bounds):
+        i = bounds.index(Ellipsis)
+        after = i + 1
+        bounds = bounds[:i] + (slice(None),) * (len(shape) - len(bounds) + 1) + bounds[after:]
+    bounds = bounds + (slice(None),) * (len(shape) - len(bounds))
+    normalized: List[Hashable] = []
+    for bound, size in zip(bounds, shape):
+        if isinstance(bound, slice):
+            start, stop, _ = bound.indices(size)
+            normalized.append((start, stop))
+        else:
+            index = int(bound)
+            normalized.append(index + size if index < 0 else index)
+    return tuple(normalized)
+
+
+def get_cache_size(size: str, memory_limit: Optional[Union[int, str]] = None) -> int:
+    """Return cache size in bytes.
+
+    :param size: bytes or human size like "512M"; "0" means memory_limit or a quarter of RAM if it is not set
+    :param memory_limit: --memory-limit option value
+    """
+    from deker.tools.array import convert_human_memory_to_bytes
+
+    value = convert_human_memory_to_bytes(size)
+    if value <= 0 and memory_limit:
+        value = convert_human_memory_to_bytes(memory_limit)
+    if value <= 0:
+        from psutil import virtual_memory
+
+        value = virtual_memory().total // 4
+    return value
+
+
+class ReadCache:
+    """Byte-budgeted LRU cache of Subset reads of a shell session.
+
+    Reads are keyed by array id and normalized subset bounds. Cached data of an array is dropped when
+    any of its subsets is updated or cleared in the session; changes made by other processes are not
+    tracked, call ``clear()`` to drop them. Reads return a copy of the cached data.
+
+    VSubset reads are assembled from Subset reads of the varray arrays, so they are served from the cache too.
+
+    Example:
+        > read_cache  # hits, misses, evictions and size
+        > read_cache.clear()
+
+    :param max_bytes: cache size in bytes, data bigger than it is not cached
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Key, Any]" = OrderedDict()
+        self._keys_by_array: Dict[str, Set[Key]] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = Lock()
+        self._originals: Optional[Tuple[Callable, Callable, Callable]] = None
+
+    def get(self, key: Key) -> Any:
+        """Return copy of the cached data, None if it isn't cached.
+
+        :param key: array id and normalized bounds
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # numpy scalars are immutable
+        return data.copy() if isinstance(data, np.ndarray) else data
+
+    def version(self, array_id: str) -> int:
+        """Return amount of array invalidations, used to skip caching data read before an update.
+
+        :param array_id: array id
+        """
+        return self._versions.get(array_id, 0)
+
+    def put(self, key: Key, data: Any, version: Optional[int] = None) -> None:
+        """Cache copy of the read data, evicting the least recently used data to fit the budget.
+
+        :param key: array id and normalized bounds
+        :param data: read data
+        :param version: array version taken before the read, data is not cached if the array was updated since
+        """
+        if isinstance(data, np.ndarray):
+            data = data.copy()
+        nbytes = np.asarray(data).nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if version is not None and version != self.version(key[0]):
+                return
+            self._pop(key)
+            while self._entries and self.size + nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = data
+            self._keys_by_array.setdefault(key[0], set()).add(key)
+            self.size += nbytes
+
+    def _pop(self, key: Key) -> None:
+        """Remove entry, the lock shall be held.
+
+        :param key: array id and normalized bounds
+        """
+        if key not in self._entries:
+            return
+        self.size -= np.asarray(self._entries.pop(key)).nbytes
+        keys = self._keys_by_array[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_array[key[0]]
+
+    def invalidate(self, array_id: str) -> None:
+        """Drop cached data of array.
+
+        :param array_id: array id
+        """
+        with self._lock:
+            self._versions[array_id] = self.version(array_id) + 1
+            for key in list(self._keys_by_array.get(array_id, ())):
+                self._pop(key)
+
+    def clear(self) -> None:
+        """Drop all the cached data."""
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_array.clear()
+            self.size = 0
+
+    def install(self) -> None:
+        """Wrap Subset read, update and clear methods with the cache."""
+        if self._originals is not None:
+            return
+
+        from deker import Subset
+
+        read, update, clear = Subset.read, Subset.update, Subset.clear
+        self._originals = (read, update, clear)
+        cache = self
+
+        def key_of(subset: Subset) -> Key:
+            array = subset._BaseSubset__array  # type: ignore[attr-defined]
+            return str(array.id), normalize_bounds(subset.bounds, array.shape)
+
+        @wraps(read)
+        def cached_read(subset: Subset) -> Any:
+            key = key_of(subset)
+            data = cache.get(key)
+            if data is None:
+                version = cache.version(key[0])
+                data = read(subset)
+                cache.put(key, data, version)
+            return data
+
+        @wraps(update)
+        def invalidating_update(subset: Subset, data: Any) -> None:
+            try:
+                update(subset, data)
+            finally:
+                cache.invalidate(key_of(subset)[0])
+
+        @wraps(clear)
+        def invalidating_clear(subset: Subset) -> None:
+            try:
+                clear(subset)
+            finally:
+                cache.invalidate(key_of(subset)[0])
+
+        Subset.read = cached_read  # type: ignore
+        Subset.update = invalidating_update  # type: ignore
+        Subset.clear = invalidating_clear  # type: ignore
+
+    def uninstall(self) -> None:
+        """Restore original Subset methods."""
+        if self._originals is None:
+            return
+
+        from deker import Subset
+
+        Subset.read, Subset.update, Subset.clear = self._originals  # type: ignore
+        self._originals = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        total = self.hits + self.misses
+        ratio = f"{self.hits / total:.1%}" if total else "n/a"
+        return (
+            f"ReadCache: {len(self)} subsets, {format_bytes(self.size)} of {format_bytes(self.max_bytes)}, "
+            f"hits {self.hits}, misses {self.misses} (hit ratio {ratio}), evictions {self.evictions}"
+        )
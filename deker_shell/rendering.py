@@ -0,0 +1,253 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import math
+
+from typing import Any, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from deker.ABC.base_subset import BaseSubset
+
+from deker_shell.profiling import format_bytes
+from deker_shell.utils import get_memory_limit
+
+
+# arrays with more elements are rendered as a summary
+RENDER_THRESHOLD = 100_000
+# max size of a block reduced at once while computing summary statistics
+STATS_CHUNK_BYTES = 64 * 1024**2
+# max size of a page shown by view()
+PAGE_BYTES = 1024**2
+# amount of elements shown in head and tail
+EDGE_ITEMS = 5
+
+
+class Summary:
+    """Bounded text representation of a large result."""
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def __repr__(self) -> str:
+        return self.text
+
+
+def _is_data_array(obj: Any) -> bool:
+    return (
+        type(obj).__name__ == "DataArray"
+        and hasattr(obj, "dims")
+        and isinstance(getattr(obj, "data", None), np.ndarray)
+    )
+
+
+def should_summarize(obj: Any, threshold: int = RENDER_THRESHOLD) -> bool:
+    """Check if result shall be rendered as a summary instead of repr.
+
+    :param obj: statement result
+    :param threshold: max amount of array elements rendered with repr
+    """
+    if isinstance(obj, BaseSubset):
+        return True
+    if _is_data_array(obj):
+        obj = obj.data
+    return isinstance(obj, np.ndarray) and obj.size > threshold
+
+
+def iter_blocks(array: np.ndarray, max_bytes: int = STATS_CHUNK_BYTES) -> Any:
+    """Yield views of array blocks along the first axis, each not bigger than max_bytes if possible.
+
+    :param array: numpy array
+    :param max_bytes: max block size in bytes
+    """
+    if array.ndim == 0 or array.size == 0:
+        yield array
+        return
+    row_bytes = max(array[0].nbytes, 1)
+    step = max(max_bytes // row_bytes, 1)
+    for start in range(0, array.shape[0], step):
+        stop = start + step
+        yield array[start:stop]
+
+
+def chunked_stats(array: np.ndarray, max_bytes: int = STATS_CHUNK_BYTES) -> Optional[Tuple[Any, Any, float, int]]:
+    """Compute min, max, mean and NaN count block by block without copying the whole array.
+
+    Returns None for non numeric arrays and for complex ones, which values have no order.
+
+    :param array: numpy array
+    :param max_bytes: max block size in bytes
+    """
+    dtype = array.dtype
+    if not (np.issubdtype(dtype, np.number) or np.issubdtype(dtype, np.bool_)) or array.size == 0:
+        return None
+    if np.issubdtype(dtype, np.complexfloating):
+        return None
+    is_float = np.issubdtype(array.dtype, np.inexact)
+    minimum: Any = None
+    maximum: Any = None
+    total, count, nans = 0.0, 0, 0
+    for block in iter_blocks(array, max_bytes):
+        if is_float:
+            block_nans = int(np.count_nonzero(np.isnan(block)))
+            nans += block_nans
+            if block_nans == block.size:
+                continue
+            block_min, block_max, block_sum = np.nanmin(block), np.nanmax(block), np.nansum(block, dtype=np.float64)
+            count += block.size - block_nans
+        else:
+            block_min, block_max, block_sum = np.min(block), np.max(block), np.sum(block, dtype=np.float64)
+            count += block.size
+        minimum = block_min if minimum is None else min(minimum, block_min)
+        maximum = block_max if maximum is None else max(maximum, block_max)
+        total += float(block_sum)
+    mean = total / count if count else math.nan
+    return minimum, maximum, mean, nans
+
+
+def _edges(array: np.ndarray, items: int = EDGE_ITEMS) -> Tuple[str, str]:
+    """Return first and last flat elements without copying the array.
+
+    :param array: numpy array
+    :param items: amount of elements
+    """
+    flat = array.flat
+    head = np.array([flat[i] for i in range(min(items, array.size))], dtype=array.dtype)
+    tail = np.array([flat[i] for i in range(max(array.size - items, 0), array.size)], dtype=array.dtype)
+    return np.array2string(head, separator=", "), np.array2string(tail, separator=", ")
+
+
+def summarize_array(array: np.ndarray, title: str = "ndarray", max_bytes: int = STATS_CHUNK_BYTES) -> Summary:
+    """Return bounded summary of numpy array.
+
+    :param array: numpy array
+    :param title: summary title
+    :param max_bytes: max block size in bytes for statistics
+    """
+    lines = [f"{title} shape={array.shape} dtype={array.dtype} size={format_bytes(array.nbytes)}"]
+    stats = chunked_stats(array, max_bytes)
+    if stats is not None:
+        minimum, maximum, mean, nans = stats
+        lines.append(f"min={minimum} max={maximum} mean={mean:.6g} nan={nans}")
+    head, tail = _edges(array)
+    lines.append(f"head: {head}")
+    lines.append(f"tail: {tail}")
+    lines.append("Call view(_) to page through the data")
+    return Summary("\n".join(lines))
+
+
+def summarize_subset(subset: BaseSubset) -> Summary:
+    """Return summary of a subset without reading its data.
+
+    :param subset: Subset or VSubset
+    """
+    size = int(np.prod(subset.shape, dtype=np.int64)) * np.dtype(subset.dtype).itemsize
+    limit = get_memory_limit(subset)
+    fits = "fits" if size <= limit else "exceeds"
+    return Summary(
+        f"{subset!r}\n"
+        f"dtype={np.dtype(subset.dtype)} size={format_bytes(size)}, {fits} memory limit {format_bytes(limit)}\n"
+        f"Call .read() to read the data or view(_) to page through it"
+    )
+
+
+def summarize(obj: Any, max_bytes: int = STATS_CHUNK_BYTES) -> Summary:
+    """Return bounded summary of ndarray, xarray.DataArray, Subset or VSubset.
+
+    :param obj: statement result
+    :param max_bytes: max block size in bytes for statistics
+    """
+    if isinstance(obj, BaseSubset):
+        return summarize_subset(obj)
+    if _is_data_array(obj):
+        dims = ", ".join(f"{dim}: {size}" for dim, size in zip(obj.dims, obj.shape))
+        name = f" {obj.name}" if obj.name is not None else ""
+        return summarize_array(obj.data, f"xarray.DataArray{name} ({dims})", max_bytes)
+    return summarize_array(obj, max_bytes=max_bytes)
+
+
+def _subset_page(subset: BaseSubset, start: int, stop: int) -> np.ndarray:
+    """Read rows of the subset first axis.
+
+    :param subset: Subset or VSubset
+    :param start: first row
+    :param stop: row after the last one
+    """
+    array = subset._BaseSubset__array  # type: ignore[attr-defined]
+    bounds: List[Any] = list(subset.bounds)
+    for i, bound in enumerate(bounds):
+        if isinstance(bound, slice):
+            offset = bound.start or 0
+            bounds[i] = slice(offset + start, offset + stop)
+            break
+    return array[tuple(bounds)].read()
+
+
+def view(obj: Any, page: int = 0, rows: int = 0) -> None:
+    """Print one page of array, DataArray or subset rows along the first axis.
+
+    Subsets are read page by page, so only the shown rows are read from storage.
+
+    Example:
+        > view(array[:])  # first page
+        > view(array[:], page=3, rows=10)
+
+    :param obj: ndarray, xarray.DataArray, Subset or VSubset
+    :param page: page number, starts from 0
+    :param rows: rows per page, chosen to fit 1 MB and the memory limit if 0
+    """
+    if _is_data_array(obj):
+        obj = obj.data
+    if not isinstance(obj, (np.ndarray, BaseSubset)):
+        raise TypeError("Only numpy arrays, xarray DataArrays, Subsets and VSubsets can be viewed")
+    shape = obj.shape
+    if not shape:
+        print(obj.read() if isinstance(obj, BaseSubset) else obj)
+        return
+
+    itemsize = np.dtype(obj.dtype).itemsize
+    row_bytes = max(int(np.prod(shape[1:], dtype=np.int64)) * itemsize, 1)
+    if rows <= 0:
+        max_bytes = min(PAGE_BYTES, get_memory_limit(obj) if isinstance(obj, BaseSubset) else PAGE_BYTES)
+        rows = max(max_bytes // row_bytes, 1)
+    pages = max(math.ceil(shape[0] / rows), 1)
+    if not 0 <= page < pages:
+        raise IndexError(f"page shall be in range 0..{pages - 1}")
+
+    start, stop = page * rows, min((page + 1) * rows, shape[0])
+    data = _subset_page(obj, start, stop) if isinstance(obj, BaseSubset) else obj[start:stop]
+    print(np.array2string(np.asarray(data), separator=", "))
+    print(f"rows {start}..{stop - 1} of {shape[0]}, page {page} of {pages - 1}")
+
+
+def render_results(repl: Any, threshold: int = RENDER_THRESHOLD) -> None:
+    """Make ptpython render large arrays and subsets as bounded summaries.
+
+    The original result is still available as ``_`` variable.
+
+    :param repl: ptpython repl
+    :param threshold: max amount of array elements rendered with repr
+    """
+    format_result: Callable = repl._format_result_output
+
+    def format_bounded_result(result: object) -> Any:
+        if should_summarize(result, threshold):
+            client = repl.get_globals().get("client")
+            max_bytes = min(STATS_CHUNK_BYTES, get_memory_limit(client))
+            result = summarize(result, max_bytes)
+        return format_result(result)
+
+    repl._format_result_output = format_bounded_result
@@ -0,0 +1,211 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import atexit
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple, Optional, Sequence  # noqa: I101
+
+import click
+
+
+if TYPE_CHECKING:
+    from deker import Client
+
+# Client of the worker process, created by the pool initializer
+_client: Optional["Client"] = None
+
+
+class Job(NamedTuple):
+    """Script to run, optionally against a preset collection."""
+
+    script: str
+    collection: Optional[str] = None
+
+
+class JobResult(NamedTuple):
+    """Script run outcome."""
+
+    script: str
+    collection: Optional[str]
+    exit_code: int
+    time: float
+    stdout: str
+    stderr: str
+    pid: int
+
+
+def make_jobs(scripts: Iterable[str], collections: Iterable[str] = ()) -> List[Job]:
+    """Return a job per script, or per script and collection pair if collections are passed.
+
+    :param scripts: scripts paths
+    :param collections: collections names
+    """
+    collections = list(collections)
+    if not collections:
+        return [Job(script) for script in scripts]
+    return [Job(script, name) for script, name in product(scripts, collections)]
+
+
+def _close_client() -> None:
+    if _client is not None:
+        _client.close()
+
+
+def _init_worker(uri: str, kwargs: Dict[str, Any]) -> None:
+    """Open the worker process client.
+
+    :param uri: uri to Deker storage
+    :param kwargs: Client parameters
+    """
+    global _client
+    from deker import Client
+
+    _client = Client(uri, **kwargs)
+    atexit.register(_close_client)
+
+
+def _run_job(job: Job) -> JobResult:
+    """Run script in the worker process with the shell namespace.
+
+    :param job: script and collection name
+    """
+    from deker_shell.batch import close_namespace, make_namespace
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    exit_code = 0
+    namespace: Optional[Dict[str, Any]] = None
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            namespace = make_namespace(_client)  # type: ignore[arg-type]
+            namespace["__file__"] = job.script
+            if job.collection is not None:
+                collection = _client.get_collection(job.collection)  # type: ignore[union-attr]
+                if collection is None:
+                    raise LookupError(f"Collection {job.collection} doesn't exist")
+                namespace["collection"] = collection
+            with open(job.script) as f:
+                code = compile(f.read(), job.script, "exec")
+            exec(code, namespace)  # nosec B102
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                exit_code = e.code or 0
+            else:
+                exit_code = 1
+                print(e.code, file=stderr)
+        except Exception as e:
+            exit_code = 1
+            # skip the runner frame
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)  # type: ignore[union-attr]
+        finally:
+            # the worker outlives the job, so its thread pools and extra storages clients are released now
+            if namespace is not None:
+                close_namespace(namespace)
+    return JobResult(
+        job.script,
+        job.collection,
+        exit_code,
+        time.perf_counter() - start,
+        stdout.getvalue(),
+        stderr.getvalue(),
+        os.getpid(),
+    )
+
+
+def run_jobs(uri: str, jobs: Sequence[Job], processes: Optional[int] = None, **kwargs: Any) -> List[JobResult]:
+    """Run jobs concurrently on a bounded process pool with one Client per worker process.
+
+    Results are returned in the order of jobs.
+
+    :param uri: uri to Deker storage
+    :param jobs: scripts to run
+    :param processes: number of worker processes, CPU count by default
+    :param kwargs: Client parameters
+    """
+    processes = min(processes or os.cpu_count() or 1, len(jobs)) or 1
+    context = multiprocessing.get_context("spawn")
+    results: Dict[int, JobResult] = {}
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker, initargs=(uri, kwargs)) as pool:
+        futures = {pool.submit(_run_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:  # worker crashed or failed to open client
+                results[i] = JobResult(jobs[i].script, jobs[i].collection, 1, 0.0, "", f"{type(e).__name__}: {e}\n", 0)
+    return [results[i] for i in range(len(jobs))]
+
+
+def format_summary(results: Sequence[JobResult], elapsed: float) -> str:
+    """Return human readable summary table of script runs.
+
+    :param results: script runs results
+    :param elapsed: total wall time
+    """
+    rows = [("status", "time, s", "script", "collection")]
+    for result in results:
+        status = "ok" if result.exit_code == 0 else f"exit {result.exit_code}"
+        rows.append((status, f"{result.time:.3f}", result.script, result.collection or ""))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows]
+    failed = sum(result.exit_code != 0 for result in results)
+    lines.append(f"{len(results)} jobs, {failed} failed, {elapsed:.3f}s total")
+    return "\n".join(lines)
+
+
+def run_scripts(
+    uri: str,
+    scripts: Sequence[str],
+    collections: Sequence[str] = (),
+    processes: Optional[int] = None,
+    summary_path: Optional[str] = None,
+    **kwargs: Any,
+) -> int:
+    """Run scripts in parallel, print their output and summary, and return exit code.
+
+    :param uri: uri to Deker storage
+    :param scripts: scripts paths
+    :param collections: collections names, each script is run against each of them
+    :param processes: number of worker processes
+    :param summary_path: path to write JSON summary to
+    :param kwargs: Client parameters
+    """
+    jobs = make_jobs(scripts, collections)
+    start = time.perf_counter()
+    results = run_jobs(uri, jobs, processes, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        header = f"--- {result.script}" + (f" [{result.collection}]" if result.collection else "")
+        if result.stdout:
+            click.echo(f"{header} stdout\n{result.stdout}", nl=not result.stdout.endswith("\n"))
+        if result.stderr:
+            click.echo(f"{header} stderr\n{result.stderr}", nl=not result.stderr.endswith("\n"), err=True)
+    click.echo(format_summary(results, elapsed))
+
+    if summary_path:
+        with open(summary_path, "w") as f:
+            json.dump({"time": elapsed, "jobs": [result._asdict() for result in results]}, f, indent=4)
+    return int(any(result.exit_code != 0 for result in results))
@@ -0,0 +1,306 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+import multiprocessing
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Sequence, Union  # noqa: I101
+
+import numpy as np
+
+from deker_shell.export import EXPORT_CHUNK_BYTES, iter_chunk_bounds
+from deker_shell.utils import get_client_params, get_memory_limit
+
+
+if TYPE_CHECKING:
+    from deker import Array, Collection, VArray
+
+STATS = ("count", "nan", "min", "max", "sum", "mean", "std")
+DEFAULT_STATS = ("min", "max", "mean", "nan")
+# amount of rows shown in the table representation
+TABLE_ROWS = 50
+# bytes per value of a chunk being reduced besides the read values: float64 working copy and NaN mask
+SCAN_VALUE_OVERHEAD = 9
+
+
+def get_scan_value_bytes(itemsize: int) -> int:
+    """Return memory a chunk value takes while it is scanned: read value, its reordered copy and the overhead.
+
+    :param itemsize: array dtype itemsize
+    """
+    return 2 * itemsize + SCAN_VALUE_OVERHEAD
+
+
+class Accumulator:
+    """Mergeable vectorised statistics of one or several groups of values.
+
+    Mean and variance are merged with the parallel algorithm of Chan et al., so partial results of
+    chunks and processes can be combined in any order without precision loss.
+
+    :param size: amount of groups
+    """
+
+    def __init__(self, size: int = 1) -> None:
+        self.count = np.zeros(size, dtype=np.int64)
+        self.nan = np.zeros(size, dtype=np.int64)
+        self.min = np.full(size, np.nan)
+        self.max = np.full(size, np.nan)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def _merge_at(
+        self,
+        index: Union[slice, np.ndarray],
+        count: np.ndarray,
+        nan: np.ndarray,
+        minimum: np.ndarray,
+        maximum: np.ndarray,
+        mean: np.ndarray,
+        m2: np.ndarray,
+    ) -> None:
+        """Merge partial statistics into groups at index.
+
+        :param index: groups index
+        :param count: amounts of not NaN values
+        :param nan: amounts of NaN values
+        :param minimum: minimums, NaN for empty groups
+        :param maximum: maximums, NaN for empty groups
+        :param mean: means, 0 for empty groups
+        :param m2: sums of squared deviations from the mean
+        """
+        total = self.count[index] + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean - self.mean[index]
+            weight = np.where(total > 0, count / total, 0.0)
+            self.m2[index] += m2 + delta**2 * self.count[index] * weight
+            self.mean[index] += delta * weight
+        self.count[index] = total
+        self.nan[index] += nan
+        self.min[index] = np.fmin(self.min[index], minimum)
+        self.max[index] = np.fmax(self.max[index], maximum)
+
+    def update(self, block: np.ndarray, axis: Optional[int] = None, offset: int = 0) -> None:
+        """Add block values to the statistics.
+
+        Values are reduced in place in one float64 copy of the block, so that scanning a block takes
+        ``get_scan_value_bytes`` bytes per value at most.
+
+        :param block: numeric numpy array
+        :param axis: block axis, which positions are the groups; all values are one group if None
+        :param offset: group of the first block position along axis
+        """
+        if axis is None:
+            values = block.reshape(1, -1)
+        else:
+            values = np.moveaxis(block, axis, 0).reshape(block.shape[axis], -1)
+        work = np.array(values, dtype=np.float64)
+        nans = np.isnan(work)
+        nan = nans.sum(axis=1)
+        count = work.shape[1] - nan
+        minimum, maximum = np.fmin.reduce(work, axis=1), np.fmax.reduce(work, axis=1)
+        # NaNs are zeroed to add nothing to the sums
+        np.copyto(work, 0.0, where=nans)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, work.sum(axis=1) / count, 0.0)
+        np.subtract(work, mean[:, None], out=work)
+        np.copyto(work, 0.0, where=nans)
+        m2 = np.square(work, out=work).sum(axis=1)
+        self._merge_at(slice(offset, offset + len(values)), count, nan, minimum, maximum, mean, m2)
+
+    def merge(self, other: "Accumulator") -> "Accumulator":
+        """Merge statistics of the same groups computed elsewhere.
+
+        :param other: accumulator of the same size
+        """
+        self._merge_at(slice(None), other.count, other.nan, other.min, other.max, other.mean, other.m2)
+        return self
+
+    def result(self, stats: Sequence[str] = DEFAULT_STATS) -> Dict[str, np.ndarray]:
+        """Return requested statistics of each group.
+
+        :param stats: statistics names
+        """
+        empty = self.count == 0
+        values = {
+            "count": self.count,
+            "nan": self.nan,
+            "min": self.min,
+            "max": self.max,
+            "sum": self.mean * self.count,
+            "mean": np.where(empty, np.nan, self.mean),
+            "std": np.where(empty, np.nan, np.sqrt(self.m2 / np.maximum(self.count, 1))),
+        }
+        return {stat: values[stat] for stat in stats}
+
+
+class ScanTable:
+    """Tidy table of scan results: one row per array, or per array and dimension position.
+
+    Example:
+        > table = scan(collection, by="time")
+        > table.rows[0]
+        > table.column("mean")
+        > table.to_csv("stats.csv")
+    """
+
+    def __init__(self, columns: Sequence[str], rows: List[Dict[str, Any]]) -> None:
+        self.columns = list(columns)
+        self.rows = rows
+
+    def column(self, name: str) -> np.ndarray:
+        """Return column values.
+
+        :param name: column name
+        """
+        return np.array([row[name] for row in self.rows])
+
+    def to_csv(self, path: str) -> None:
+        """Write table to CSV file.
+
+        :param path: file path
+        """
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, self.columns)
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.rows)
+
+    def __repr__(self) -> str:
+        def cell(value: Any) -> str:
+            return f"{value:.6g}" if isinstance(value, float) else str(value)
+
+        cells = [self.columns] + [[cell(row[column]) for column in self.columns] for row in self.rows[:TABLE_ROWS]]
+        widths = [max(len(row[i]) for row in cells) for i in range(len(self.columns))]
+        lines = ["  ".join(value.rjust(width) for value, width in zip(row, widths)) for row in cells]
+        if len(self.rows) > TABLE_ROWS:
+            lines.append(f"... {len(self.rows) - TABLE_ROWS} more rows")
+        return "\n".join(lines)
+
+
+def scan_array(
+    array: Union["Array", "VArray"], by: Optional[str] = None, chunk_bytes: int = EXPORT_CHUNK_BYTES
+) -> Accumulator:
+    """Compute statistics of array in a single pass, reading it chunk by chunk.
+
+    :param array: Array or VArray
+    :param by: dimension name to group statistics by
+    :param chunk_bytes: max memory taken by a chunk while it is read and reduced
+    """
+    shape = tuple(array.shape)
+    dtype = np.dtype(array.dtype)
+    numeric = np.issubdtype(dtype, np.number) or np.issubdtype(dtype, np.bool_)
+    # complex values would be cast to their real part and have no order
+    if not numeric or np.issubdtype(dtype, np.complexfloating):
+        raise TypeError(f"Can't compute statistics of {dtype} array")
+    axis = None
+    if by is not None:
+        names = [dim.name for dim in array.dimensions]
+        if by not in names:
+            raise ValueError(f"Array has no dimension {by}, only {', '.join(names)}")
+        axis = names.index(by)
+
+    accumulator = Accumulator(shape[axis] if axis is not None else 1)
+    for bounds in iter_chunk_bounds(shape, get_scan_value_bytes(dtype.itemsize), chunk_bytes):
+        offset = bounds[axis].start if axis is not None else 0
+        accumulator.update(array[bounds].read(), axis, offset)
+    return accumulator
+
+
+# Collections of the worker process by name
+_collections: Dict[str, "Collection"] = {}
+
+
+def _scan_worker(collection_name: str, array_id: str, by: Optional[str], chunk_bytes: int) -> Accumulator:
+    """Scan array in a worker process of the pool initialized by the scripts runner.
+
+    :param collection_name: collection name
+    :param array_id: array id
+    :param by: dimension name to group statistics by
+    :param chunk_bytes: max memory taken by a chunk while it is read and reduced
+    """
+    from deker_shell import runner
+
+    if collection_name not in _collections:
+        _collections[collection_name] = runner._client.get_collection(collection_name)  # type: ignore[union-attr]
+    array = _collections[collection_name].filter({"id": array_id}).last()
+    if array is None:
+        raise LookupError(f"Array {array_id} doesn't exist")
+    return scan_array(array, by, chunk_bytes)
+
+
+def scan(
+    collection: "Collection",
+    stats: Sequence[str] = DEFAULT_STATS,
+    by: Optional[str] = None,
+    processes: Optional[int] = None,
+    memory_limit: int = 0,
+) -> ScanTable:
+    """Compute statistics of each collection array in a single chunked pass, several arrays at a time.
+
+    Arrays are read in chunks that fit the memory limit and reduced with vectorised numpy accumulators.
+    Arrays are scanned in parallel worker processes, each with its own Client.
+
+    Example:
+        > scan(collection)
+        > scan(collection, stats=["min", "max", "std"], by="time")
+
+    :param collection: Collection instance
+    :param stats: statistics to compute, any of count, nan, min, max, sum, mean and std
+    :param by: dimension name to compute statistics per its positions
+    :param processes: number of worker processes, CPU count if None; 0 scans in the shell process
+    :param memory_limit: max memory taken by the chunks being read and reduced by all the processes,
+      Client memory limit if 0
+    """
+    unknown = [stat for stat in stats if stat not in STATS]
+    if unknown:
+        raise ValueError(f"Unknown statistics {', '.join(unknown)}, choose from {', '.join(STATS)}")
+    if processes is None:
+        processes = os.cpu_count() or 1
+    memory_limit = memory_limit or get_memory_limit(collection)
+    chunk_bytes = max(min(EXPORT_CHUNK_BYTES, memory_limit // max(processes, 1)), 1)
+
+    arrays = list(collection)
+    if processes == 0 or len(arrays) <= 1:
+        accumulators = [scan_array(array, by, chunk_bytes) for array in arrays]
+    else:
+        from deker_shell.runner import _init_worker
+
+        uri, kwargs = get_client_params(collection)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            min(processes, len(arrays)), mp_context=context, initializer=_init_worker, initargs=(uri, kwargs)
+        ) as pool:
+            futures = [pool.submit(_scan_worker, collection.name, str(array.id), by, chunk_bytes) for array in arrays]
+            accumulators = [future.result() for future in futures]
+
+    columns = ["id"] + ([by] if by is not None else []) + list(stats)
+    rows: List[Dict[str, Any]] = []
+    for array, accumulator in zip(arrays, accumulators):
+        result = accumulator.result(stats)
+        for i in range(len(accumulator.count)):
+            row: Dict[str, Any] = {"id": str(array.id)}
+            if by is not None:
+                row[by] = i
+            row.update((stat, values[i].item()) for stat, values in result.items())
+            rows.append(row)
+    return ScanTable(columns, rows)
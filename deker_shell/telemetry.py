@@ -0,0 +1,291 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import csv
+import json
+import sys
+import time
+
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from deker_shell.profiling import format_bytes, format_time
+
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+
+def get_peak_rss() -> int:
+    """Return peak resident set size of the process in bytes, 0 if unavailable."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on MacOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class IOCounters:
+    """Amount of array data bytes read and written through deker Subset and time spent reading.
+
+    VSubset reads and writes its arrays through Subset, so virtual arrays I/O is counted as well;
+    its arrays are read concurrently, so their read times add up to more than the wall time.
+    """
+
+    def __init__(self) -> None:
+        self.read_bytes = 0
+        self.written_bytes = 0
+        self.read_time = 0.0
+        self._lock = Lock()
+        self._originals: Optional[Tuple[Callable, Callable]] = None
+
+    def add(self, read_bytes: int = 0, written_bytes: int = 0, read_time: float = 0.0) -> None:
+        """Add bytes to counters.
+
+        :param read_bytes: amount of bytes read
+        :param written_bytes: amount of bytes written
+        :param read_time: seconds spent reading
+        """
+        with self._lock:
+            self.read_bytes += read_bytes
+            self.written_bytes += written_bytes
+            self.read_time += read_time
+
+    def snapshot(self) -> Tuple[int, int]:
+        """Return bytes read and written so far."""
+        return self.read_bytes, self.written_bytes
+
+    def install(self) -> None:
+        """Wrap Subset read and update methods with counters."""
+        global _installed
+
+        if self._originals is not None:
+            return
+
+        from deker import Subset
+
+        read, update = Subset.read, Subset.update
+        self._originals = (read, update)
+        counters = self
+
+        @wraps(read)
+        def counted_read(subset: Subset) -> Any:
+            start = time.perf_counter()
+            result = read(subset)
+            counters.add(read_bytes=getattr(result, "nbytes", 0), read_time=time.perf_counter() - start)
+            return result
+
+        @wraps(update)
+        def counted_update(subset: Subset, data: Any) -> None:
+            update(subset, data)
+            counters.add(written_bytes=getattr(data, "nbytes", 0))
+
+        Subset.read = counted_read  # type: ignore
+        Subset.update = counted_update  # type: ignore
+        _installed = self
+
+    def uninstall(self) -> None:
+        """Restore original Subset methods."""
+        global _installed
+
+        if self._originals is None:
+            return
+
+        from deker import Subset
+
+        Subset.read, Subset.update = self._originals  # type: ignore
+        self._originals = None
+        if _installed is self:
+            _installed = None
+
+
+_installed: Optional[IOCounters] = None
+
+
+def get_io_counters() -> Optional[IOCounters]:
+    """Return installed IOCounters, to count reads made without deker Subset, None if none is installed."""
+    return _installed
+
+
+class StatementStats(NamedTuple):
+    """Resource use of one statement."""
+
+    index: int
+    code: str
+    ok: bool
+    wall_time: float
+    cpu_time: float
+    peak_rss_delta: int
+    read_bytes: int
+    written_bytes: int
+    # seconds waited for deker write locks, counted with --inotify-locks only
+    lock_wait: float = 0.0
+
+
+class Telemetry:
+    """Per-statement latency, memory and I/O telemetry of a shell session.
+
+    Example:
+        > telemetry  # session totals and the last statements
+        > telemetry.records[-1]
+        > telemetry.export("stats.csv")  # or .json
+    """
+
+    fields = StatementStats._fields
+
+    def __init__(self) -> None:
+        self.records: List[StatementStats] = []
+        self.io = IOCounters()
+        self._started: Optional[Tuple[str, float, float, int, Tuple[int, int], float]] = None
+
+    def install(self) -> None:
+        """Start counting deker I/O."""
+        self.io.install()
+
+    def uninstall(self) -> None:
+        """Stop counting deker I/O."""
+        self.io.uninstall()
+
+    def start(self, code: str) -> None:
+        """Take resource use snapshot before statement execution.
+
+        :param code: statement source
+        """
+        from deker_shell.locks import get_lock_wait_time
+
+        self._started = (
+            code,
+            time.perf_counter(),
+            time.process_time(),
+            get_peak_rss(),
+            self.io.snapshot(),
+            get_lock_wait_time(),
+        )
+
+    def stop(self, ok: bool = True) -> Optional[StatementStats]:
+        """Record statement resource use.
+
+        :param ok: if statement succeeded
+        """
+        if self._started is None:
+            return None
+        from deker_shell.locks import get_lock_wait_time
+
+        code, wall, cpu, peak_rss, (read_bytes, written_bytes), lock_wait = self._started
+        self._started = None
+        now_read, now_written = self.io.snapshot()
+        stats = StatementStats(
+            index=len(self.records),
+            code=code,
+            ok=ok,
+            wall_time=time.perf_counter() - wall,
+            cpu_time=time.process_time() - cpu,
+            peak_rss_delta=get_peak_rss() - peak_rss,
+            read_bytes=now_read - read_bytes,
+            written_bytes=now_written - written_bytes,
+            lock_wait=max(get_lock_wait_time() - lock_wait, 0.0),
+        )
+        self.records.append(stats)
+        return stats
+
+    @property
+    def last(self) -> Optional[StatementStats]:
+        """Last statement stats."""
+        return self.records[-1] if self.records else None
+
+    @property
+    def totals(self) -> StatementStats:
+        """Session totals; peak RSS delta is the session peak RSS growth."""
+        return StatementStats(
+            index=len(self.records),
+            code="",
+            ok=all(r.ok for r in self.records),
+            wall_time=sum(r.wall_time for r in self.records),
+            cpu_time=sum(r.cpu_time for r in self.records),
+            peak_rss_delta=sum(r.peak_rss_delta for r in self.records),
+            read_bytes=sum(r.read_bytes for r in self.records),
+            written_bytes=sum(r.written_bytes for r in self.records),
+            lock_wait=sum(r.lock_wait for r in self.records),
+        )
+
+    @staticmethod
+    def format(stats: StatementStats) -> str:
+        """Return one line human representation of stats.
+
+        :param stats: statement or session stats
+        """
+        text = (
+            f"wall {format_time(stats.wall_time)} | cpu {format_time(stats.cpu_time)} | "
+            f"rss +{format_bytes(stats.peak_rss_delta)} | "
+            f"read {format_bytes(stats.read_bytes)} | written {format_bytes(stats.written_bytes)}"
+        )
+        if stats.lock_wait:
+            text += f" | lock wait {format_time(stats.lock_wait)}"
+        return text
+
+    def toolbar_text(self) -> str:
+        """Return status toolbar text with the last statement stats and session totals."""
+        if not self.records:
+            return " no statements yet"
+        return f" last: {self.format(self.records[-1])}   session ({len(self.records)}): {self.format(self.totals)}"
+
+    def export(self, path: str) -> None:
+        """Write per-statement log to a CSV or JSON file, chosen by file extension.
+
+        :param path: file path ending with .csv or .json
+        """
+        if path.endswith(".json"):
+            with open(path, "w") as f:
+                json.dump([record._asdict() for record in self.records], f, indent=4)
+        elif path.endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(self.fields)
+                writer.writerows(self.records)
+        else:
+            raise ValueError("Only .csv and .json files are supported")
+
+    def __repr__(self) -> str:
+        lines = [f"session ({len(self.records)} statements): {self.format(self.totals)}"]
+        for record in self.records[-10:]:
+            lines.append(
+                f"[{record.index}] {self.format(record)} | {record.code.splitlines()[0] if record.code else ''}"
+            )
+        return "\n".join(lines)
+
+
+def wrap_eval(telemetry: Telemetry, eval_async: Callable) -> Callable:
+    """Wrap ptpython eval coroutine to record statement stats.
+
+    :param telemetry: session telemetry
+    :param eval_async: ptpython repl eval_async method
+    """
+
+    @wraps(eval_async)
+    async def eval_with_telemetry(line: str) -> Any:
+        telemetry.start(line)
+        ok = False
+        try:
+            result = await eval_async(line)
+            ok = True
+            return result
+        finally:
+            telemetry.stop(ok)
+
+    return eval_with_telemetry
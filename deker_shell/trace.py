@@ -0,0 +1,383 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from threading import Lock, current_thread, local
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union  # noqa: I101
+
+import click
+
+from deker_shell.profiling import format_time
+
+
+# max amount of spans kept for the Chrome trace, flamegraph stacks are counted for all of them
+TRACE_MAX_SPANS = 1_000_000
+# rows of the trace summary
+SUMMARY_LIMIT = 15
+
+# traced deker entry points: module, class (None for module functions), methods and span category
+TRACED = (
+    ("deker.client", "Client", ("get_collection", "__iter__"), "metadata"),
+    ("deker.collection", "Collection", ("filter", "__iter__"), "metadata"),
+    ("deker.managers", "FilteredManager", ("first", "last"), "metadata"),
+    ("deker.subset", "Subset", ("read", "update", "clear"), "data"),
+    ("deker.subset", "VSubset", ("read", "update", "clear"), "data"),
+    (
+        "deker_local_adapters.storage_adapters.hdf5.hdf5_storage_adapter",
+        "HDF5StorageAdapter",
+        ("read_data", "update_data", "clear_data", "read_meta"),
+        "hdf5",
+    ),
+    # iter_chunks reads local arrays with h5py directly
+    ("deker_shell.chunks", None, ("_read_direct",), "hdf5"),
+)
+GENERATORS = ("__iter__",)
+
+
+class Span(NamedTuple):
+    """Timed call of a traced deker entry point, times in nanoseconds of ``time.perf_counter_ns``."""
+
+    name: str
+    category: str
+    start: int
+    duration: int
+    thread: int
+
+
+class _Frame:
+    """Span in progress on a thread stack."""
+
+    __slots__ = ("name", "children")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.children = 0
+
+
+_stacks = local()
+_active: List["Tracer"] = []
+_lock = Lock()
+_originals: List[Tuple[Any, str, Callable]] = []
+
+
+def _stack() -> List[_Frame]:
+    """Return spans in progress on the current thread."""
+    stack = getattr(_stacks, "stack", None)
+    if stack is None:
+        stack = _stacks.stack = [_Frame(current_thread().name)]
+    return stack
+
+
+def _finish(stack: List[_Frame], frame: _Frame, category: str, start: int, end: int = 0) -> None:
+    """Pop frame from the thread stack and pass its span to the active tracers.
+
+    :param stack: current thread stack
+    :param frame: finished frame, the last on the stack
+    :param category: span category
+    :param start: span start
+    :param end: span end, now if 0
+    """
+    duration = (end or time.perf_counter_ns()) - start
+    path = ";".join(item.name for item in stack)
+    stack.pop()
+    stack[-1].children += duration
+    span = Span(frame.name, category, start, duration, current_thread().ident or 0)
+    for tracer in _active:
+        tracer.add(span, path, duration - frame.children)
+
+
+def _traced(name: str, category: str, method: Callable) -> Callable:
+    """Wrap method with a span.
+
+    :param name: span name
+    :param category: span category
+    :param method: original method
+    """
+
+    @wraps(method)
+    def traced(*args: Any, **kwargs: Any) -> Any:
+        stack = _stack()
+        frame = _Frame(name)
+        stack.append(frame)
+        start = time.perf_counter_ns()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _finish(stack, frame, category, start)
+
+    return traced
+
+
+def _traced_generator(name: str, category: str, method: Callable) -> Callable:
+    """Wrap generator method with a span per yielded item, so that code iterating it isn't counted.
+
+    :param name: span name
+    :param category: span category
+    :param method: original generator method
+    """
+
+    @wraps(method)
+    def traced(*args: Any, **kwargs: Any) -> Iterator:
+        iterator = iter(method(*args, **kwargs))
+        while True:
+            stack = _stack()
+            frame = _Frame(name)
+            stack.append(frame)
+            start = time.perf_counter_ns()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _finish(stack, frame, category, start)
+            yield item
+
+    return traced
+
+
+def _lock_classes() -> Iterator[Tuple[Any, str]]:
+    """Yield deker lock classes and their methods checking and waiting for locks."""
+    from deker import locks
+    from deker.ABC.base_locks import BaseLock
+
+    classes = [BaseLock] + [
+        cls
+        for cls in vars(locks).values()
+        if isinstance(cls, type) and issubclass(cls, BaseLock) and cls is not BaseLock
+    ]
+    for cls in classes:
+        for method in ("check_existing_lock", "acquire"):
+            if method in vars(cls):
+                yield cls, method
+
+
+def install() -> None:
+    """Wrap traced deker entry points with spans, if they are not wrapped yet."""
+    if _originals:
+        return
+    from importlib import import_module
+
+    targets = [
+        (getattr(import_module(module), cls) if cls else import_module(module), method, category)
+        for module, cls, methods, category in TRACED
+        for method in methods
+    ]
+    targets.extend((cls, method, "lock") for cls, method in _lock_classes())
+    for owner, method, category in targets:
+        original = vars(owner)[method]
+        wrap = _traced_generator if method in GENERATORS else _traced
+        _originals.append((owner, method, original))
+        setattr(owner, method, wrap(f"{owner.__name__.rsplit('.', 1)[-1]}.{method}", category, original))
+
+
+def uninstall() -> None:
+    """Restore original deker entry points."""
+    while _originals:
+        cls, method, original = _originals.pop()
+        setattr(cls, method, original)
+
+
+class Tracer:
+    """Spans of deker calls: metadata access, data reads and writes, HDF5 I/O and lock checks and waits.
+
+    The tracer itself is a span on the thread it is started on, so the time not spent in deker calls,
+    like NumPy code, is its self time. Spans of other threads, like VSubset arrays reads, start with
+    the thread name.
+
+    Example:
+        > with trace("slow.json") as tracer:
+        >     data = collection.filter({"dt": dt}).last()[:].read().mean()
+        > tracer  # time per entry point
+
+    :param name: name of the root span
+    :param max_spans: max amount of spans kept for the Chrome trace
+    """
+
+    def __init__(self, name: str = "trace", max_spans: int = TRACE_MAX_SPANS) -> None:
+        self.name = name
+        self.max_spans = max_spans
+        self.spans: List[Span] = []
+        self.stacks: Dict[str, int] = defaultdict(int)
+        self.threads: Dict[int, str] = {}
+        self.dropped = 0
+        self.started = 0
+        self.stopped = 0
+        self._frame: Optional[_Frame] = None
+        self._lock = Lock()
+
+    def add(self, span: Span, path: str, self_time: int) -> None:
+        """Add finished span.
+
+        :param span: finished span
+        :param path: names of the span and its parents, separated with ``;``
+        :param self_time: span duration without its children spans
+        """
+        if span.start < self.started:
+            return
+        with self._lock:
+            self.stacks[path] += self_time
+            if span.thread not in self.threads:
+                self.threads[span.thread] = path.split(";", 1)[0]
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def start(self) -> "Tracer":
+        """Install the spans and start collecting them."""
+        with _lock:
+            install()
+            _active.append(self)
+        self._frame = _Frame(self.name)
+        _stack().append(self._frame)
+        self.started = time.perf_counter_ns()
+        return self
+
+    def stop(self) -> None:
+        """Stop collecting spans, uninstall them if no other tracer is active."""
+        if self._frame is None:
+            return
+        self.stopped = time.perf_counter_ns()
+        stack = _stack()
+        if self._frame in stack:
+            # tracer can be stopped within a traced call, like a generator closed on exit
+            while stack[-1] is not self._frame:
+                stack.pop()
+            _finish(stack, self._frame, "trace", self.started, self.stopped)
+        self._frame = None
+        with _lock:
+            _active.remove(self)
+            if not _active:
+                uninstall()
+
+    def __enter__(self) -> "Tracer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    @property
+    def duration(self) -> int:
+        """Traced time in nanoseconds."""
+        return (self.stopped or time.perf_counter_ns()) - self.started
+
+    def export_chrome(self, path: Union[str, Path]) -> Path:
+        """Write spans in Chrome trace event format, opened by chrome://tracing, Perfetto and speedscope.
+
+        :param path: JSON file path
+        """
+        pid = os.getpid()
+        with self._lock:
+            spans, threads = list(self.spans), dict(self.threads)
+        events: List[Dict[str, Any]] = [
+            {
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (span.start - self.started) / 1000,
+                "dur": span.duration / 1000,
+                "pid": pid,
+                "tid": span.thread,
+            }
+            for span in spans
+        ]
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}}
+            for thread, name in threads.items()
+        )
+        path = Path(path)
+        path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+        return path
+
+    def export_collapsed(self, path: Union[str, Path]) -> Path:
+        """Write self time of spans stacks in microseconds in collapsed format of flamegraph.pl and speedscope.
+
+        :param path: text file path
+        """
+        with self._lock:
+            stacks = dict(self.stacks)
+        path = Path(path)
+        path.write_text("".join(f"{stack} {self_time // 1000}\n" for stack, self_time in sorted(stacks.items())))
+        return path
+
+    def export(self, path: Union[str, Path]) -> Tuple[Path, Path]:
+        """Write Chrome trace to path and collapsed stacks next to it with .folded suffix.
+
+        :param path: Chrome trace JSON file path
+        """
+        path = Path(path)
+        return self.export_chrome(path), self.export_collapsed(path.with_suffix(".folded"))
+
+    def summary(self) -> List[Tuple[str, str, int, int, int]]:
+        """Return name, category, calls, total and self time in nanoseconds of spans, the longest first."""
+        rows: Dict[str, List[Any]] = {}
+        with self._lock:
+            spans = list(self.spans)
+            stacks = dict(self.stacks)
+        for span in spans:
+            row = rows.setdefault(span.name, [span.name, span.category, 0, 0, 0])
+            row[2] += 1
+            row[3] += span.duration
+        for stack, self_time in stacks.items():
+            name = stack.rsplit(";", 1)[-1]
+            if name in rows:
+                rows[name][4] += self_time
+        return sorted((tuple(row) for row in rows.values()), key=lambda row: -row[3])  # type: ignore[misc]
+
+    def __repr__(self) -> str:
+        state = "running" if self._frame is not None else "stopped"
+        lines = [f"Tracer {self.name} ({state}): {format_time(self.duration / 1e9)}, {len(self.spans)} spans"]
+        if self.dropped:
+            lines[0] += f", {self.dropped} more not kept for the Chrome trace"
+        rows = self.summary()
+        if rows:
+            width = max(len(row[0]) for row in rows[:SUMMARY_LIMIT])
+            lines.append(f"{'span':<{width}}  {'category':<8}  {'calls':>7}  {'total':>9}  {'self':>9}")
+            for name, category, calls, total, self_time in rows[:SUMMARY_LIMIT]:
+                lines.append(
+                    f"{name:<{width}}  {category:<8}  {calls:>7}  "
+                    f"{format_time(total / 1e9):>9}  {format_time(self_time / 1e9):>9}"
+                )
+        return "\n".join(lines)
+
+
+@contextmanager
+def trace(path: Optional[Union[str, Path]] = None, name: str = "trace") -> Iterator[Tracer]:
+    """Trace deker calls in the block, write Chrome trace and collapsed stacks if path is passed.
+
+    Example:
+        > with trace("read.json") as tracer:
+        >     data = array[:].read()
+        > tracer
+
+    :param path: Chrome trace JSON file path, collapsed stacks are written next to it with .folded suffix
+    :param name: name of the root span
+    """
+    tracer = Tracer(name).start()
+    try:
+        yield tracer
+    finally:
+        tracer.stop()
+        if path:
+            chrome, collapsed = tracer.export(path)
+            click.echo(f"Trace written to {chrome} and {collapsed}", err=True)
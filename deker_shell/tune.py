@@ -0,0 +1,359 @@
+# deker-shell - interactive management shell for deker
+# Copyright (C) 2023  OpenWeather
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import datetime
+import functools
+import json
+import math
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Tuple  # noqa: I101
+
+import click
+
+
+if TYPE_CHECKING:
+    from deker import Client, Collection
+
+TUNE_SAMPLE_BYTES = 256 * 1024**2
+# Client parameters saved in a profile
+PROFILE_KEYS = ("workers", "memory_limit", "write_lock_timeout", "write_lock_check_interval")
+SCRATCH_PREFIX = "deker_shell_tune_"
+# scratch array shape of a storage without collections to sample, 8 MB of float64
+SCRATCH_SIZE = 1024**2
+
+
+def default_profiles_path() -> Path:
+    """Return tuning profiles file: $XDG_CONFIG_HOME/deker-shell/tune.json or ~/.config/deker-shell/tune.json."""
+    config = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return Path(config) / "deker-shell" / "tune.json"
+
+
+def load_profile(uri: str, path: Optional[Path] = None) -> Dict[str, Any]:
+    """Return Client parameters saved for the storage by ``--tune`` or ``autotune()``, empty dict if there are none.
+
+    :param uri: uri to Deker storage
+    :param path: profiles file, the default one if not set
+    """
+    path = path or default_profiles_path()
+    try:
+        profiles = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    profile = profiles.get(uri, {})
+    return {key: profile[key] for key in PROFILE_KEYS if profile.get(key)}
+
+
+def load_read_throughput(uri: str, path: Optional[Path] = None) -> Optional[float]:
+    """Return one worker read throughput in bytes per second measured by ``--tune`` or ``autotune()``, if any.
+
+    :param uri: uri to Deker storage
+    :param path: profiles file, the default one if not set
+    """
+    try:
+        profile = json.loads((path or default_profiles_path()).read_text()).get(uri, {})
+    except (OSError, ValueError):
+        return None
+    for item in profile.get("throughput", []):
+        if item.get("workers") == 1 and item.get("read"):
+            return float(item["read"])
+    return None
+
+
+class HardwareInfo(NamedTuple):
+    """Machine resources available to the shell."""
+
+    cores: int
+    total_ram: int
+    available_ram: int
+
+
+def probe_hardware() -> HardwareInfo:
+    """Return cores available to the process and total and available RAM."""
+    from psutil import virtual_memory
+
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    memory = virtual_memory()
+    return HardwareInfo(cores, memory.total, memory.available)
+
+
+class Throughput(NamedTuple):
+    """Throughput measured with a number of workers, in bytes per second."""
+
+    workers: int
+    read: float
+    write: float
+    # seconds of the slowest single write, for which the array is locked
+    max_write_time: float
+
+
+class TuneProfile(NamedTuple):
+    """Recommended Client parameters and the measurements they are based on."""
+
+    workers: int
+    memory_limit: int
+    write_lock_timeout: int
+    write_lock_check_interval: int
+    hardware: HardwareInfo
+    throughput: List[Throughput]
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        """Return Client parameters of the profile."""
+        return {key: getattr(self, key) for key in PROFILE_KEYS}
+
+    def __repr__(self) -> str:
+        from deker_shell.profiling import format_bytes, format_time
+
+        lines = [
+            f"{self.hardware.cores} cores, {format_bytes(self.hardware.available_ram)} of "
+            f"{format_bytes(self.hardware.total_ram)} RAM available",
+            "workers  read/s     write/s    slowest write",
+        ]
+        for item in self.throughput:
+            lines.append(
+                f"{item.workers:<8} {format_bytes(item.read):<10} {format_bytes(item.write):<10} "
+                f"{format_time(item.max_write_time)}"
+            )
+        lines.append(
+            f"recommended: --workers {self.workers} --memory-limit {self.memory_limit} "
+            f"--write-lock-timeout {self.write_lock_timeout} "
+            f"--write-lock-check-interval {self.write_lock_check_interval}"
+        )
+        return "\n".join(lines)
+
+
+def save_profile(uri: str, profile: TuneProfile, path: Optional[Path] = None) -> Path:
+    """Save profile Client parameters for the storage, return the profiles file path.
+
+    :param uri: uri to Deker storage
+    :param profile: tuning profile
+    :param path: profiles file, the default one if not set
+    """
+    path = path or default_profiles_path()
+    try:
+        profiles = json.loads(path.read_text())
+    except (OSError, ValueError):
+        profiles = {}
+    profiles[uri] = dict(
+        profile.client_kwargs(),
+        hardware=profile.hardware._asdict(),
+        throughput=[item._asdict() for item in profile.throughput],
+        tuned_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".part")
+    tmp.write_text(json.dumps(profiles, indent=2))
+    os.replace(tmp, path)
+    return path
+
+
+def get_worker_candidates(cores: int) -> List[int]:
+    """Return worker counts to measure: powers of two up to twice the cores, the cores and deker default.
+
+    :param cores: available cores
+    """
+    candidates = {cores, cores + 4}
+    workers = 1
+    while workers <= cores * 2:
+        candidates.add(workers)
+        workers *= 2
+    return sorted(candidates)
+
+
+def _run_timed(workers: int, tasks: List[Callable[[], Any]]) -> Tuple[float, float]:
+    """Run tasks on a thread pool, return total and slowest task time.
+
+    :param workers: number of threads
+    :param tasks: functions to run
+    """
+
+    def timed(task: Callable[[], Any]) -> float:
+        start = time.perf_counter()
+        task()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        times = list(pool.map(timed, tasks))
+    return time.perf_counter() - start, max(times, default=0.0)
+
+
+def _create_scratch(client: "Client", sample: Optional["Collection"], sample_bytes: int) -> Tuple[Any, List[Any]]:
+    """Create a scratch collection for write measurements, return it and (scratch array, source array) pairs.
+
+    With a sample collection the scratch collection has its schema and arrays with the same shapes and attributes,
+    otherwise it has float64 arrays of SCRATCH_SIZE.
+
+    :param client: Client instance
+    :param sample: sample collection
+    :param sample_bytes: amount of bytes to write per measurement
+    """
+    import numpy as np
+
+    from deker import ArraySchema, DimensionSchema
+
+    name = f"{SCRATCH_PREFIX}{os.getpid()}"
+    pairs, total = [], 0
+    if sample is None:
+        schema = ArraySchema(dimensions=[DimensionSchema(name="i", size=SCRATCH_SIZE)], dtype=float)
+        scratch = client.create_collection(name, schema)
+        for _ in range(max(sample_bytes // (SCRATCH_SIZE * 8), 1)):
+            pairs.append((scratch.create(), None))
+        return scratch, pairs
+    scratch = client.create_collection(name, sample.varray_schema or sample.array_schema, sample.options)
+    for array in sample:
+        primary = dict(array.primary_attributes) or None
+        custom = dict(array.custom_attributes or {}) or None
+        pairs.append((scratch.create(primary, custom), array))
+        total += math.prod(array.shape) * np.dtype(array.dtype).itemsize
+        if total >= sample_bytes:
+            break
+    return scratch, pairs
+
+
+def measure_throughput(
+    client: "Client", sample: Optional["Collection"], candidates: List[int], sample_bytes: int = TUNE_SAMPLE_BYTES
+) -> List[Throughput]:
+    """Measure read and write throughput with each number of workers.
+
+    Writes go to a scratch collection, which is deleted afterwards; reads come from the sample collection
+    arrays or from the scratch ones. Data is read once before the measurements, so reads are measured
+    with the data in the OS page cache, like repeated reads in a shell session.
+
+    :param client: Client instance
+    :param sample: collection to take the schema and data layout from, None to use a scratch float64 layout
+    :param candidates: numbers of workers to measure
+    :param sample_bytes: max amount of bytes read and written per measurement
+    """
+    import numpy as np
+
+    from deker_shell.export import EXPORT_CHUNK_BYTES, iter_chunk_bounds
+
+    if sample is not None and next(iter(sample), None) is None:
+        sample = None
+    scratch, pairs = _create_scratch(client, sample, sample_bytes)
+    try:
+        reads: List[Callable[[], Any]] = []
+        writes: List[Callable[[], Any]] = []
+        nbytes = 0
+        ones: Dict[Tuple[Any, ...], Any] = {}
+        for target, source in pairs:
+            source = source if source is not None else target
+            itemsize = np.dtype(source.dtype).itemsize
+            for bounds in iter_chunk_bounds(tuple(source.shape), itemsize, EXPORT_CHUNK_BYTES):
+                shape = tuple(bound.stop - bound.start for bound in bounds)
+                data = ones.setdefault((shape, source.dtype), np.ones(shape, dtype=source.dtype))
+                writes.append(functools.partial(target[bounds].update, data))
+                reads.append(source[bounds].read)
+                nbytes += data.nbytes
+        # the first pass fills the scratch arrays and the page cache
+        _run_timed(max(candidates), writes)
+        _run_timed(max(candidates), reads)
+        results = []
+        for workers in candidates:
+            write_time, max_write_time = _run_timed(workers, writes)
+            read_time, _ = _run_timed(workers, reads)
+            results.append(Throughput(workers, nbytes / read_time, nbytes / write_time, max_write_time))
+        return results
+    finally:
+        scratch.delete()
+
+
+def recommend(hardware: HardwareInfo, throughput: List[Throughput]) -> TuneProfile:
+    """Choose Client parameters from the measurements.
+
+    Workers: the smallest number giving at least 95% of the best combined read and write throughput.
+    Memory limit: half of the available RAM. Lock timeout: long enough for every worker to wait for ten
+    of the slowest writes, but not shorter than deker default of 60 seconds. Lock check interval: the
+    slowest write time rounded to whole seconds, as deker takes it in seconds, from 1 to 10.
+
+    :param hardware: machine resources
+    :param throughput: measurements by number of workers
+    """
+    best_read = max(item.read for item in throughput) or 1.0
+    best_write = max(item.write for item in throughput) or 1.0
+    scores = {item.workers: item.read / best_read + item.write / best_write for item in throughput}
+    best_score = max(scores.values())
+    chosen = min(workers for workers, score in scores.items() if score >= best_score * 0.95)
+    slowest = max(item.max_write_time for item in throughput)
+    return TuneProfile(
+        workers=chosen,
+        memory_limit=hardware.available_ram // 2,
+        write_lock_timeout=max(60, math.ceil(slowest * chosen * 10)),
+        write_lock_check_interval=min(max(round(slowest), 1), 10),
+        hardware=hardware,
+        throughput=throughput,
+    )
+
+
+def autotune(
+    client: "Client",
+    collection: Optional["Collection"] = None,
+    save: bool = True,
+    sample_bytes: int = TUNE_SAMPLE_BYTES,
+) -> TuneProfile:
+    """Probe the machine and the storage and recommend Client parameters.
+
+    Cores and RAM are probed, read and write throughput is measured with different numbers of workers.
+    The saved profile is loaded by the next shell start for the same storage; options passed on
+    the command line take precedence over it.
+
+    Example:
+        > autotune()  # sample the storage with a scratch collection
+        > autotune(collection)  # sample the layout and data of a collection
+
+    :param client: Client instance
+    :param collection: collection to sample, a scratch float64 collection is used if None
+    :param save: save the profile for the next shell start
+    :param sample_bytes: max amount of bytes read and written per measurement
+    """
+    from deker_shell.utils import get_config
+
+    hardware = probe_hardware()
+    profile = recommend(
+        hardware, measure_throughput(client, collection, get_worker_candidates(hardware.cores), sample_bytes)
+    )
+    if save:
+        path = save_profile(get_config(client).uri, profile)
+        click.echo(f"Saved profile to {path}, it is used from the next start")
+    return profile
+
+
+def tune_storage(uri: str, name: Optional[str], **kwargs: Any) -> int:
+    """Open a client, tune it on collection name and print the profile, return exit code.
+
+    :param uri: uri to Deker storage
+    :param name: collection to sample, a scratch collection is used if empty
+    :param kwargs: Client parameters
+    """
+    from deker import Client
+
+    with Client(uri, **kwargs) as client:
+        collection = None
+        if name:
+            collection = client.get_collection(name)
+            if collection is None:
+                raise click.ClickException(f"Collection {name} doesn't exist")
+        profile = autotune(client, collection, save=False)
+    click.echo(repr(profile))
+    click.echo(f"Saved profile to {save_profile(uri, profile)}, it is used from the next start")
+    return 0
@@ -14,6 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
+
+from typing import Any, Dict, Tuple  # noqa: I101
 from urllib.parse import urlparse
 
 from click import ClickException
@@ -27,3 +30,86 @@ def validate_uri(uri: str) -> None:
     uri_scheme = urlparse(uri).scheme
     if uri_scheme not in ("http", "file"):
         raise ClickException("Invalid uri")
+
+
+def parse_storages(ctx: Any, param: Any, value: Tuple[str, ...]) -> Dict[str, str]:
+    """Parse and validate NAME=URI storages option values.
+
+    :param ctx: click Context
+    :param param: click option
+    :param value: option values
+    """
+    storages = {}
+    for item in value:
+        name, sep, uri = item.partition("=")
+        if not sep or not name or not uri:
+            raise ClickException(f"Invalid storage {item}, NAME=URI expected")
+        if name == "default":
+            raise ClickException("Storage name 'default' is reserved for the main storage")
+        validate_uri(uri)
+        storages[name] = uri
+    return storages
+
+
+def get_config(obj: Any) -> Any:
+    """Return deker config of a Client, Collection, Array or Subset, None if obj has no config.
+
+    :param obj: Client, Collection, Array, VArray, Subset or VSubset instance
+    """
+    for attr in ("_Client__config", "_Collection__adapter", "_BaseArray__adapter", "_BaseSubset__adapter"):
+        value = getattr(obj, attr, None)
+        if value is not None:
+            return value if attr == "_Client__config" else value.ctx.config
+    return None
+
+
+def get_memory_limit(obj: Any = None) -> int:
+    """Return memory limit in bytes of a Client, Collection, Array or Subset config.
+
+    Falls back to total RAM + total swap, which is also the Client default.
+
+    :param obj: Client, Collection, Array, VArray, Subset or VSubset instance
+    """
+    config = get_config(obj)
+    if config is not None and config.memory_limit > 0:
+        return int(config.memory_limit)
+
+    from psutil import swap_memory, virtual_memory
+
+    return int(virtual_memory().total + swap_memory().total)
+
+
+def get_workers(obj: Any = None) -> int:
+    """Return number of Deker threads of a Client, Collection, Array or Subset config.
+
+    Falls back to CPU count + 4, which is also the Client default.
+
+    :param obj: Client, Collection, Array, VArray, Subset or VSubset instance
+    """
+    config = get_config(obj)
+    if config is not None and config.workers > 0:
+        return int(config.workers)
+    return (os.cpu_count() or 1) + 4
+
+
+def get_client_params(obj: Any) -> Tuple[str, Dict[str, Any]]:
+    """Return uri and parameters to open one more Client with the config of a Client, Collection or Array.
+
+    :param obj: Client, Collection, Array, VArray, Subset or VSubset instance
+    """
+    config = get_config(obj)
+    if config is None:
+        raise ValueError(f"{obj!r} has no deker config")
+    params = ("workers", "write_lock_timeout", "write_lock_check_interval", "memory_limit", "loglevel")
+    return config.uri, {param: getattr(config, param) for param in params}
+
+
+def get_local_adapter(collection: Any) -> Any:
+    """Return local storage adapter of a collection, None for storages without local files.
+
+    :param collection: Collection instance
+    """
+    adapter = getattr(collection._Collection__manager, "_adapter", None)
+    if adapter is None or not hasattr(adapter, "collection_path") or not hasattr(adapter, "read_meta"):
+        return None
+    return adapter
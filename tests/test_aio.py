@@ -0,0 +1,100 @@
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, Client, DimensionSchema
+
+from deker_shell.aio import AsyncIO
+from deker_shell.main import start
+
+
+@pytest.fixture()
+def uri(tmp_path):
+    uri = f"file://{tmp_path}"
+    with Client(uri) as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="y", size=10), DimensionSchema(name="x", size=5)], dtype=float
+        )
+        client.create_collection("coll", schema).create()[:].update(np.arange(50.0).reshape(10, 5))
+    return uri
+
+
+@pytest.fixture()
+def array(uri):
+    with Client(uri) as client:
+        yield next(iter(client.get_collection("coll")))
+
+
+class TestAsyncIO:
+    def test_read_update(self, array):
+        async_io = AsyncIO(2, 10**6)
+
+        async def main():
+            await async_io.update(array[0, :], np.zeros(5))
+            return await async_io.read(array[0, :]), await async_io.gather_reads([array[i, :] for i in range(10)])
+
+        try:
+            row, rows = asyncio.run(main())
+        finally:
+            async_io.shutdown()
+        assert (row == 0).all()
+        assert (np.array(rows)[1:] == np.arange(5.0, 50.0).reshape(9, 5)).all()
+
+    def test_concurrency_and_budget(self):
+        """Tests if calls overlap up to workers and bytes in flight stay within the budget."""
+        async_io = AsyncIO(4, 100)
+        lock, running, peaks = threading.Lock(), [0], []
+
+        def work():
+            with lock:
+                running[0] += 1
+                peaks.append((running[0], async_io.budget.in_flight))
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+
+        async def main():
+            start = time.perf_counter()
+            await asyncio.gather(*(async_io.run(40, work) for _ in range(8)))
+            return time.perf_counter() - start
+
+        try:
+            elapsed = asyncio.run(main())
+        finally:
+            async_io.shutdown()
+        assert max(running for running, _ in peaks) == 2
+        assert max(in_flight for _, in_flight in peaks) <= 100
+        assert elapsed < 8 * 0.05
+
+    def test_loop_not_blocked(self):
+        """Tests if the event loop keeps running while a deker call blocks."""
+        async_io = AsyncIO(1, 100)
+        ticks = []
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(async_io.run(0, time.sleep, 0.2), ticker())
+
+        try:
+            asyncio.run(main())
+        finally:
+            async_io.shutdown()
+        assert len(ticks) == 5
+        assert ticks[-1] - ticks[0] < 0.2
+
+    def test_batch_await(self, uri):
+        result = CliRunner(mix_stderr=False).invoke(
+            start,
+            [uri, "-e", "use('coll')", "-e", "(await agather_reads([next(iter(collection))[i, 0] for i in range(3)]))"],
+        )
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.output.splitlines()[-1])["result"] == [0.0, 5.0, 10.0]
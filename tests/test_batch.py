@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from click.testing import CliRunner
+
+from deker_shell.main import start
+
+
+runner = CliRunner(mix_stderr=False)
+
+
+@pytest.fixture()
+def uri(tmp_path):
+    return f"file://{tmp_path}"
+
+
+def records(output):
+    return [json.loads(line) for line in output.splitlines()]
+
+
+class TestBatch:
+    def test_execute(self, uri):
+        """Tests if statements share one namespace and results are printed as NDJSON."""
+        result = runner.invoke(
+            start, [uri, "-e", "x = np.arange(3)", "-e", "x * 2", "-e", "print('hi'); client.is_open"]
+        )
+        assert result.exit_code == 0
+        output = records(result.stdout)
+        assert [r["ok"] for r in output] == [True] * 4
+        assert output[1]["result"] == [0, 2, 4]
+        assert output[2]["stdout"] == "hi\n"
+        assert output[3]["result"] is True
+
+    def test_use(self, uri):
+        """Tests if shell helpers are available."""
+        statements = [
+            "client.create_collection('coll', ArraySchema(dimensions=[DimensionSchema(name='x', size=2)], dtype=float))",
+            "use('coll')",
+            "collection.name",
+            "collections",
+        ]
+        result = runner.invoke(start, [uri, *(arg for s in statements for arg in ("-e", s))])
+        assert result.exit_code == 0
+        assert [r["result"] for r in records(result.stdout)][2:] == ["coll", ["coll"]]
+
+    def test_script_from_stdin(self, uri):
+        """Tests if script statements are executed one by one."""
+        result = runner.invoke(start, [uri, "-s", "-"], input="import math\nif True:\n    y = 2\nmath.floor(2.5) + y\n")
+        assert result.exit_code == 0
+        output = records(result.stdout)
+        assert [r["line"] for r in output] == [1, 2, 4]
+        assert output[-1]["result"] == 4
+
+    def test_stop_on_error(self, uri):
+        """Tests if execution stops on the first failed statement."""
+        result = runner.invoke(start, [uri, "-e", "1 / 0", "-e", "2"])
+        assert result.exit_code == 1
+        output = records(result.stdout)
+        assert len(output) == 1
+        assert output[0]["error"]["type"] == "ZeroDivisionError"
+
+    def test_syntax_error(self, uri):
+        """Tests if syntax error is reported."""
+        result = runner.invoke(start, [uri, "-e", "1 +"])
+        assert result.exit_code == 1
+        assert records(result.stdout)[0]["error"]["type"] == "SyntaxError"
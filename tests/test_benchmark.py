@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from click.testing import CliRunner
+from deker import Client
+
+from deker_shell.benchmark import bench_completion, bench_listing, build_storage, compare, main, percentile
+
+
+@pytest.fixture()
+def uri(tmp_path):
+    return build_storage(str(tmp_path / "storage"), collections=2, arrays=3)
+
+
+def results(**medians):
+    return {"metrics": {metric: {"p50": value} for metric, value in medians.items()}}
+
+
+class TestBenchmark:
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (50, 99, 100)
+        assert percentile([3.0], 90) == 3.0
+
+    def test_build_storage(self, uri, tmp_path):
+        """Tests if storage layout is created and reused."""
+        assert build_storage(str(tmp_path / "storage"), collections=2, arrays=4) == uri
+        with Client(uri) as client:
+            assert sorted(collection.name for collection in client) == ["bench_0", "bench_1"]
+            assert len(list(client.get_collection("bench_0"))) == 4
+
+    def test_listing_and_completion(self, uri):
+        metrics = {**bench_listing(uri, 2), **bench_completion(uri, 1, sizes=(5,), queries=("cli",))}
+        assert set(metrics) == {
+            "listing.use",
+            "listing.collection_names",
+            "listing.collections",
+            "listing.arrays",
+            "completion.uncached.5",
+            "completion.cached.5",
+        }
+        assert metrics["listing.arrays"]["n"] == 2
+        assert metrics["completion.uncached.5"]["p50"] > metrics["completion.cached.5"]["p50"]
+
+    def test_compare(self):
+        """Tests if only metrics slower than the threshold and the noise floor are regressions."""
+        baseline = results(a=1.0, b=1.0, c=0.0001, gone=1.0)
+        current = results(a=1.3, b=1.2, c=0.0005, new=1.0)
+        assert [regression.metric for regression in compare(current, baseline, 1.25)] == ["a"]
+
+    def test_cli(self, uri, tmp_path):
+        """Tests if results are written to JSON and regressions fail the run."""
+        output = tmp_path / "results.json"
+        args = [str(output), "--storage", uri[len("file://") :], "--collections", "2", "--arrays", "3"]
+        result = CliRunner().invoke(main, [*args, "--group", "listing", "--repeat", "2"])
+        assert result.exit_code == 0, result.output
+        data = json.loads(output.read_text())
+        assert data["params"] == {"collections": 2, "arrays": 3, "repeat": 2}
+
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps(results(**{"listing.arrays": 0.0})))
+        result = CliRunner(mix_stderr=False).invoke(main, [*args, "--group", "listing", "--baseline", str(baseline)])
+        assert result.exit_code == 1
+        assert "Regression listing.arrays" in result.stderr
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+
+from deker_shell import check as check_module
+from deker_shell.check import check, check_lock, iter_files
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path / 'storage'}") as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="x", size=4)],
+            dtype=float,
+            attributes=[AttributeSchema(name="k", dtype=int, primary=True)],
+        )
+        collection = client.create_collection("coll", schema)
+        for k in range(6):
+            collection.create({"k": k})[:].update(np.arange(4.0))
+        yield client
+
+
+def data_files(client):
+    return sorted((client.root_path / "coll" / "array_data").rglob("*.hdf5"))
+
+
+def read_report(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+class TestCheck:
+    def test_iter_files(self, tmp_path):
+        """Tests if files are walked in parts order, after the passed file and without skipped directories."""
+        for path in ("a/b/2", "a/b/10", "a/c", "b/x", "skip/y", "z"):
+            (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / path).touch()
+        files = list(iter_files(tmp_path, skip=("skip",)))
+        assert files == [("a", "b", "10"), ("a", "b", "2"), ("a", "c"), ("b", "x"), ("z",)]
+        assert files == sorted(files)
+        assert list(iter_files(tmp_path, after=("a", "b", "2"), skip=("skip",))) == files[2:]
+
+    def test_check_lock(self, tmp_path):
+        """Tests if only old locks of stopped processes are orphaned."""
+        young = tmp_path / f"id:uuid:{2**22 + 1}:1.arrayreadlock"
+        alive = tmp_path / f"id:uuid:{os.getpid()}:1.arrayreadlock"
+        dead = tmp_path / f"id.hdf5:{2**22 + 1}.varraylock"
+        for path in (young, alive, dead):
+            path.touch()
+        for path in (alive, dead):
+            os.utime(path, (time.time() - 100, time.time() - 100))
+        assert check_lock(young, 60) is None
+        assert check_lock(alive, 60) is None
+        assert "not running" in check_lock(dead, 60)
+
+    def test_check(self, client, tmp_path):
+        """Tests if broken files, orphaned locks, missing symlinks and stray files are reported."""
+        symlink = next((client.root_path / "coll" / "array_symlinks" / "3").iterdir())
+        symlink.unlink()
+        # the array of the removed symlink stays readable, so that its symlinks are checked
+        files = [file for file in data_files(client) if file.name != symlink.name]
+        files[0].write_bytes(b"garbage")
+        lock = files[1].parent / f"{files[1].stem}:uuid:{2**22 + 1}:1.arrayreadlock"
+        lock.touch()
+        os.utime(lock, (time.time() - 1000, time.time() - 1000))
+        (files[1].parent / "stray.tmp").touch()
+        (client.root_path / "ghost.lock").touch()
+
+        report = tmp_path / "report.jsonl"
+        result = check(client, level=2, report=report, processes=0, progress=False)
+        assert result.checked == 9
+        assert result.findings == {"orphaned_lock": 2, "unexpected_file": 1, "unreadable": 1}
+        assert [finding["kind"] for finding in read_report(report)] == [
+            "orphaned_lock",
+            "unreadable",
+            "orphaned_lock",
+            "unexpected_file",
+        ]
+        assert not (tmp_path / "report.jsonl.checkpoint").exists()
+
+        result = check(client, "coll", level=3, report=report, processes=0, progress=False)
+        assert result.findings["symlink"] == 1
+        assert result.findings["orphaned_lock"] == 1
+        assert check(client, level=1, report=report, processes=0).checked == 0
+
+    def test_check_resume(self, client, tmp_path, mocker):
+        """Tests if an interrupted check resumes after the last reported file without repeating findings."""
+        for file in data_files(client):
+            (file.parent / "stray.tmp").touch()
+        report = tmp_path / "report.jsonl"
+        mocker.patch.object(check_module, "CHECKPOINT_INTERVAL", 0)
+        check_files = check_module.check_files
+        calls = []
+
+        def interrupted(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return check_files(*args)
+
+        mocker.patch.object(check_module, "check_files", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            check(client, report=report, processes=0, batch_size=2, progress=False)
+        checkpoint = json.loads((tmp_path / "report.jsonl.checkpoint").read_text())
+        assert checkpoint["checked"] == 4
+        assert len(read_report(report)) == checkpoint["findings"]["unexpected_file"] == 2
+
+        mocker.patch.object(check_module, "check_files", check_files)
+        with pytest.raises(ValueError, match="belongs to a check"):
+            check(client, level=3, report=report, processes=0)
+        result = check(client, report=report, processes=0, batch_size=2, progress=False)
+        assert result.resumed
+        assert result.checked == 13
+        assert result.findings == {"unexpected_file": 6}
+        assert len({finding["path"] for finding in read_report(report)}) == 6
+
+    def test_check_processes(self, client, tmp_path):
+        """Tests if files checked in worker processes give the same report."""
+        data_files(client)[0].write_bytes(b"garbage")
+        local = check(client, level=4, report=tmp_path / "local.jsonl", processes=0, progress=False)
+        pooled = check(client, level=4, report=tmp_path / "pool.jsonl", processes=2, batch_size=3, progress=False)
+        assert pooled.findings == local.findings == {"unreadable": 1}
+        assert (tmp_path / "pool.jsonl").read_text() == (tmp_path / "local.jsonl").read_text()
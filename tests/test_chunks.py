@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema, VArraySchema
+from deker_local_adapters.storage_adapters.hdf5 import HDF5Options
+
+from deker_shell.chunks import iter_chunks, split_bounds
+from deker_shell.telemetry import IOCounters, get_io_counters
+from deker_shell.trace import trace
+
+
+DIMENSIONS = [DimensionSchema(name="x", size=40), DimensionSchema(name="y", size=30), DimensionSchema(name="z", size=4)]
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        yield client
+
+
+@pytest.fixture()
+def data():
+    return np.random.default_rng(0).random((40, 30, 4))
+
+
+@pytest.fixture()
+def array(client, data):
+    collection = client.create_collection(
+        "arrays", ArraySchema(dimensions=DIMENSIONS, dtype=float), collection_options=HDF5Options(chunks=(10, 10, 4))
+    )
+    array = collection.create()
+    array[:].update(data)
+    return array
+
+
+class TestChunks:
+    def test_split_bounds(self):
+        """Tests if pieces borders are aligned and pieces are split along the passed axis."""
+        split = split_bounds(((3, 37), (0, 30)), 8, 8 * 30 * 15, align=(10, 10))
+        assert split.ranges == [(3, 10), (10, 20), (20, 30), (30, 37)]
+        assert split.pieces == 4
+        assert split.max_cells == 30 * 10
+        split = split_bounds(((0, 40), (0, 30)), 8, 8 * 40 * 12, along=1)
+        assert list(split.indexes()) == [
+            (slice(0, 40), slice(0, 12)),
+            (slice(0, 40), slice(12, 24)),
+            (slice(0, 40), slice(24, 30)),
+        ]
+        assert list(split_bounds((5, (0, 30)), 8, 16).indexes())[:2] == [(5, slice(0, 2)), (5, slice(2, 4))]
+        with pytest.raises(ValueError, match="320 bytes"):
+            split_bounds(((0, 40), (0, 40)), 8, 100, along=0)
+
+    @pytest.mark.parametrize("prefetch", [True, False])
+    def test_iter_chunks(self, array, data, prefetch):
+        """Tests if blocks cover the subset once, in the reused buffers."""
+        result = np.zeros_like(data)
+        buffers = set()
+        for bounds, block in iter_chunks(array, max_bytes=8 * 30 * 4 * 8, prefetch=prefetch):
+            assert block.nbytes <= 8 * 30 * 4 * 8
+            result[bounds] += block
+            buffers.add(block.base.__array_interface__["data"][0])
+        assert (result == data).all()
+        assert len(buffers) == (2 if prefetch else 1)
+
+    def test_iter_chunks_counted(self, array, data):
+        """Tests if direct reads are added to the installed IO counters and traced."""
+        counters = IOCounters()
+        counters.install()
+        try:
+            assert get_io_counters() is counters
+            with trace() as tracer:
+                blocks = sum(1 for _ in iter_chunks(array, max_bytes=8 * 30 * 4 * 8))
+        finally:
+            counters.uninstall()
+        assert get_io_counters() is None
+        assert counters.read_bytes == data.nbytes and counters.read_time > 0
+        spans = [span for span in tracer.spans if span.name == "chunks._read_direct"]
+        assert len(spans) == blocks and {span.category for span in spans} == {"hdf5"}
+
+    def test_iter_chunks_index(self, array, data, client):
+        """Tests if blocks of a subset with indexes and of an array without data are read."""
+        blocks = [(bounds, block.copy()) for bounds, block in iter_chunks(array[5, 3:25], max_bytes=8 * 4 * 10)]
+        assert [bounds for bounds, _ in blocks] == [
+            (5, slice(3, 10), slice(0, 4)),
+            (5, slice(10, 20), slice(0, 4)),
+            (5, slice(20, 25), slice(0, 4)),
+        ]
+        assert all((block == data[bounds]).all() for bounds, block in blocks)
+        empty = client.get_collection("arrays").create()
+        bounds, block = next(iter_chunks(empty, along="y", max_bytes=8 * 40 * 4 * 15))
+        assert bounds == (slice(0, 40), slice(0, 15), slice(0, 4))
+        assert np.isnan(block).all()
+
+    def test_iter_chunks_varray(self, client, data):
+        """Tests if VArray blocks are aligned to its arrays."""
+        varray = client.create_collection(
+            "varrays", VArraySchema(dimensions=DIMENSIONS, dtype=float, vgrid=(4, 3, 1))
+        ).create()
+        varray[:].update(data)
+        blocks = list(iter_chunks(varray, max_bytes=8 * 30 * 4 * 15))
+        assert [bounds[0] for bounds, _ in blocks] == [slice(0, 10), slice(10, 20), slice(20, 30), slice(30, 40)]
+        assert (np.concatenate([block for _, block in blocks]) == data).all()
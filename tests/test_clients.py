@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+
+from deker_shell.clients import ClientRegistry
+from deker_shell.main import start
+
+
+@pytest.fixture()
+def src(tmp_path):
+    uri = f"file://{tmp_path / 'src'}"
+    (tmp_path / "src").mkdir()
+    with Client(uri) as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="y", size=10), DimensionSchema(name="x", size=5)],
+            dtype=float,
+            attributes=[AttributeSchema(name="k", dtype=int, primary=True)],
+        )
+        collection = client.create_collection("coll", schema)
+        for k in range(3):
+            collection.create({"k": k})[:].update(np.full((10, 5), float(k)))
+    return uri
+
+
+@pytest.fixture()
+def dst(tmp_path):
+    (tmp_path / "dst").mkdir()
+    return f"file://{tmp_path / 'dst'}"
+
+
+class TestClientRegistry:
+    def test_lazy_connect(self, src, dst):
+        """Tests if clients are opened on first access, once per uri, and closed with the registry."""
+        clients = ClientRegistry({"a": src, "b": dst, "c": src})
+        assert not clients.is_connected("a")
+        assert "not connected" in repr(clients)
+        assert clients["a"] is clients["c"]
+        assert clients.is_connected("a") and not clients.is_connected("b")
+        client = clients["a"]
+        clients.close()
+        assert client.is_closed
+        assert list(clients) == ["a", "b", "c"]
+
+    def test_adopted_not_closed(self, src):
+        with Client(src) as client:
+            clients = ClientRegistry()
+            clients.adopt("default", client)
+            assert clients["default"] is client
+            clients.close()
+            assert not client.is_closed
+
+    def test_copy(self, src, dst):
+        """Tests if ids, attributes and data are copied and a repeated copy skips existing arrays."""
+        clients = ClientRegistry({"src": src, "dst": dst})
+        try:
+            collection = clients["src"].get_collection("coll")
+            report = clients.copy(collection, "dst", memory_limit=200)
+            assert (report.copied, report.skipped, report.errors) == (3, 0, [])
+            assert report.bytes == 3 * 400
+            copied = {str(array.id): array for array in clients["dst"].get_collection("coll")}
+            for array in collection:
+                target = copied[str(array.id)]
+                assert target.primary_attributes == array.primary_attributes
+                assert (target[:].read() == array[:].read()).all()
+            report = clients.copy(collection, "dst")
+            assert (report.copied, report.skipped) == (0, 3)
+        finally:
+            clients.close()
+
+
+class TestStorageOption:
+    def test_execute(self, src, dst):
+        result = CliRunner(mix_stderr=False).invoke(
+            start,
+            [dst, "--storage", f"other={src}", "-e", "len(list(clients['other'].get_collection('coll')))"],
+        )
+        assert result.exit_code == 0, result.output
+        assert json.loads(result.output.splitlines()[-1])["result"] == 3
+
+    @pytest.mark.parametrize("value", ["other", "=file:///tmp", "default=file:///tmp", "other=foo://bar"])
+    def test_invalid(self, dst, value):
+        result = CliRunner(mix_stderr=False).invoke(start, [dst, "--storage", value, "-e", "1"])
+        assert result.exit_code != 0
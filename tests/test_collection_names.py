@@ -0,0 +1,61 @@
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema
+
+from deker_shell.collection_names import CollectionNames
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        schema = ArraySchema(dimensions=[DimensionSchema(name="x", size=2)], dtype=float)
+        for name in ("alpha", "beta", "betamax", "gamma", "delta"):
+            client.create_collection(name, schema)
+        yield client
+
+
+class TestCollectionNames:
+    def test_nothing_fetched_on_init(self, client, mocker):
+        """Tests if names are not fetched until accessed."""
+        spy = mocker.patch("deker_shell.collection_names.iter_collection_names")
+        CollectionNames(client)
+        spy.assert_not_called()
+
+    def test_paged_fetch(self, client):
+        """Tests if names are fetched page by page."""
+        names = CollectionNames(client, page_size=2)
+        assert isinstance(names[0], str)
+        assert len(names._names) == 2
+        assert len(names[:3]) == 3
+        assert len(names._names) == 4
+        assert len(names) == 5
+        assert names.is_loaded
+
+    def test_startswith(self, client):
+        """Tests prefix lookup."""
+        names = CollectionNames(client, page_size=2)
+        assert names.startswith("beta") == ["beta", "betamax"]
+        assert names.startswith("z") == []
+        assert "gamma" in names
+        assert "omega" not in names
+
+    def test_refresh(self, client):
+        """Tests if refresh drops cached names."""
+        names = CollectionNames(client)
+        assert len(names) == 5
+        client.get_collection("gamma").delete()
+        assert len(names) == 5
+        names.refresh()
+        assert sorted(names) == ["alpha", "beta", "betamax", "delta"]
+
+    def test_ttl(self, client):
+        """Tests if expired names are fetched again."""
+        names = CollectionNames(client, ttl=0)
+        assert len(names) == 5
+        client.get_collection("gamma").delete()
+        assert len(names) == 4
+
+    def test_repr(self, client):
+        """Tests if only the first page is shown."""
+        assert repr(CollectionNames(client, page_size=2)).endswith(", ...]")
+        assert sorted(eval(repr(CollectionNames(client)))) == ["alpha", "beta", "betamax", "delta", "gamma"]
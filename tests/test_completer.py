@@ -0,0 +1,141 @@
+import jedi
+import pytest
+
+from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+from prompt_toolkit.completion import CompleteEvent
+from prompt_toolkit.document import Document
+
+from deker_shell.collection_names import CollectionNames
+from deker_shell.completer import Candidate, CompletionCache, JediCompleter, get_repl_completer
+
+
+class Namespace:
+    values_a = 1
+    values_b = 2
+    other = 3
+
+
+@pytest.fixture()
+def completer():
+    namespace = {"ns": Namespace, "number": 1, "d": {"alpha": 1, "beta": 2}}
+    return JediCompleter(lambda: namespace, lambda: {}, debounce=0)
+
+
+def complete(completer, text):
+    return [c.text for c in completer.get_completions(Document(text), CompleteEvent(completion_requested=True))]
+
+
+class TestJediCompleter:
+    def test_completions(self, completer):
+        """Tests if completions are found by jedi."""
+        assert complete(completer, "ns.val") == ["values_a", "values_b"]
+
+    def test_prefix_served_from_cache(self, completer, mocker):
+        """Tests if typing more of the same identifier filters cached candidates."""
+        spy = mocker.spy(completer, "_get_candidates")
+        assert set(complete(completer, "ns.")) == {"values_a", "values_b", "other"}
+        assert complete(completer, "ns.v") == ["values_a", "values_b"]
+        assert complete(completer, "ns.values_b") == ["values_b"]
+        assert spy.call_count == 1
+
+        completions = list(completer.get_completions(Document("ns.valu"), CompleteEvent(completion_requested=True)))
+        assert completions[0].start_position == -4
+
+    @pytest.mark.parametrize("text", ['d["al', 'open("/tm'])
+    def test_quoted_completions(self, completer, mocker, text):
+        """Tests if dict keys and paths replace the same text as jedi completions do, also from cache."""
+        script = jedi.Interpreter(text, [completer.get_globals()])
+        expected = [(c.name_with_symbols, -c.get_completion_prefix_length()) for c in script.complete()]
+        spy = mocker.spy(completer, "_get_candidates")
+        complete(completer, text[:-1])
+        completions = completer.get_completions(Document(text), CompleteEvent(completion_requested=True))
+        assert expected
+        assert [(c.text, c.start_position) for c in completions] == expected
+        assert spy.call_count == 1
+
+    def test_invalidate(self, completer, mocker):
+        """Tests if namespace version change makes cache stale."""
+        spy = mocker.spy(completer, "_get_candidates")
+        complete(completer, "ns.v")
+        completer.invalidate()
+        complete(completer, "ns.v")
+        assert spy.call_count == 2
+        assert completer.namespace_version == 1
+
+    def test_stale_request_dropped(self, completer):
+        """Tests if a request stops yielding once a newer one arrives."""
+        stale = completer.get_completions(Document("ns."), CompleteEvent(completion_requested=True))
+        next(stale)
+        complete(completer, "numb")
+        assert list(stale) == []
+
+
+class TestCompletionCache:
+    def test_lru_eviction(self):
+        """Tests if least recently used entries are evicted."""
+        cache = CompletionCache(maxsize=2)
+        candidates = [Candidate("abc", "statement", "")]
+        cache.set(("a", "", 0), "", candidates)
+        cache.set(("b", "", 0), "", candidates)
+        assert cache.get(("a", "", 0), "") == candidates
+        cache.set(("c", "", 0), "", candidates)
+        assert len(cache) == 2
+        assert cache.get(("b", "", 0), "") is None
+        assert cache.get(("a", "", 0), "ab") == candidates
+        assert cache.get(("a", "", 0), "x") == []
+
+    def test_shorter_prefix_is_miss(self):
+        """Tests if a shorter prefix than cached one is not served from cache."""
+        cache = CompletionCache()
+        cache.set(("a", "", 0), "ab", [Candidate("abc", "statement", "")])
+        assert cache.get(("a", "", 0), "a") is None
+
+
+@pytest.fixture()
+def repl_completer(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="x", size=2)],
+            dtype=float,
+            attributes=[
+                AttributeSchema(name="place", dtype=str, primary=True),
+                AttributeSchema(name="product", dtype=str, primary=True),
+                AttributeSchema(name="comment", dtype=str, primary=False),
+            ],
+        )
+        collection = client.create_collection("weather", schema)
+        client.create_collection("water", ArraySchema(dimensions=[DimensionSchema(name="x", size=2)], dtype=float))
+        namespace = {"client": client, "collections": CollectionNames(client), "collection": collection}
+        yield get_repl_completer(lambda: namespace, lambda: {}, False)
+
+
+class TestDekerCompleter:
+    @pytest.mark.parametrize(
+        ("text", "expected"),
+        [
+            ('use("wa', ["water"]),
+            ("use('w", ["water", "weather"]),
+            ('client.get_collection("we', ["weather"]),
+            ('collection.filter({"p', ["place", "product"]),
+            ('collection.filter({"place": "x", "pr', ["product"]),
+            ('client.get_collection("weather").filter({"', ["id", "place", "product"]),
+            ('collection.create({"', ["place", "product"]),
+            ('collection.create(custom_attributes={"', ["comment"]),
+        ],
+    )
+    def test_completions(self, repl_completer, text, expected):
+        """Tests if deker metadata is completed without jedi."""
+        completions = list(repl_completer.get_completions(Document(text), CompleteEvent(completion_requested=True)))
+        assert [c.text for c in completions] == expected
+
+    def test_falls_back_to_jedi(self, repl_completer):
+        """Tests if other input is completed by jedi."""
+        completions = repl_completer.get_completions(Document("collec"), CompleteEvent(completion_requested=True))
+        assert "collection" in [c.text for c in completions]
+
+    def test_schema_index_cached(self, repl_completer, mocker):
+        """Tests if collection schema is read from storage once."""
+        spy = mocker.spy(repl_completer.schema_index.lookup("client"), "get_collection")
+        for _ in range(2):
+            list(repl_completer.get_completions(Document('client.get_collection("water").filter({"'), CompleteEvent()))
+        assert spy.call_count == 1
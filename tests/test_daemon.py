@@ -0,0 +1,70 @@
+import os
+import socket
+import time
+
+import pytest
+
+from deker_shell.benchmark import time_to_prompt
+from deker_shell.daemon import get_daemon_dir, get_socket_path, recv_message, send_message
+
+
+@pytest.fixture()
+def runtime_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path / "run"))
+    return tmp_path / "run"
+
+
+class TestDaemon:
+    def test_socket_path(self, runtime_dir):
+        """Tests if each storage has its own socket in a private directory."""
+        path = get_socket_path("file:///tmp/a")
+        assert path == get_socket_path("file:///tmp/a") != get_socket_path("file:///tmp/b")
+        assert path.parent == get_daemon_dir() == runtime_dir / "deker-shell"
+        assert path.parent.stat().st_mode & 0o777 == 0o700
+
+    def test_shared_daemon_dir(self, runtime_dir):
+        (runtime_dir / "deker-shell").mkdir(parents=True, mode=0o777)
+        os.chmod(runtime_dir / "deker-shell", 0o777)
+        with pytest.raises(PermissionError):
+            get_daemon_dir()
+
+    def test_messages(self, tmp_path):
+        """Tests if messages and file descriptors are passed over the socket."""
+        path = tmp_path / "file"
+        path.write_text("data")
+        left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        with left, right, open(path) as file:
+            send_message(left, {"a": "x" * 100000}, (file.fileno(),))
+            message, fds = recv_message(right, with_fds=True)
+            assert message == {"a": "x" * 100000}
+            with open(fds[0]) as passed:
+                assert passed.read() == "data"
+            left.close()
+            assert recv_message(right) == (None, [])
+
+    def test_messages_back_to_back(self):
+        """Tests if messages received at once are returned one by one."""
+        left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        with left, right:
+            send_message(left, {"pid": 1})
+            send_message(left, {"exit": 0})
+            left.close()
+            buffer = bytearray()
+            assert recv_message(right, buffer=buffer) == ({"pid": 1}, [])
+            assert recv_message(right, buffer=buffer) == ({"exit": 0}, [])
+            assert recv_message(right, buffer=buffer) == (None, [])
+
+    def test_attach(self, runtime_dir, tmp_path):
+        """Tests if sessions attach to one daemon, which exits when idle."""
+        uri = f"file://{tmp_path}"
+        args = ["--daemon", "--daemon-idle", "1"]
+        pycache = str(tmp_path / "pycache")
+        time_to_prompt(uri, pycache, args=args)
+        path = get_socket_path(uri)
+        inode = path.stat().st_ino
+        time_to_prompt(uri, pycache, args=args)
+        assert path.stat().st_ino == inode
+        deadline = time.monotonic() + 30
+        while path.exists() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert not path.exists()
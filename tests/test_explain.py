@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema, VArraySchema
+from deker_local_adapters.storage_adapters.hdf5 import HDF5Options
+
+from deker_shell.explain import count_chunks, explain
+from deker_shell.telemetry import IOCounters
+
+
+DIMENSIONS = [DimensionSchema(name="x", size=100), DimensionSchema(name="y", size=60)]
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        yield client
+
+
+@pytest.fixture()
+def array(client):
+    collection = client.create_collection(
+        "arrays", ArraySchema(dimensions=DIMENSIONS, dtype=float), collection_options=HDF5Options(chunks=(10, 20))
+    )
+    array = collection.create()
+    array[:].update(np.ones((100, 60)))
+    return array
+
+
+class TestExplain:
+    def test_count_chunks(self):
+        """Tests if touched chunks and their cells are counted, clipped to the array shape."""
+        assert count_chunks(((5, 25), 0), (100, 60), (10, 20)) == (3, 600)
+        assert count_chunks(((95, 100), (0, 60)), (100, 60), (10, 20)) == (3, 600)
+        assert count_chunks(((0, 100), (0, 60)), (100, 60), (100, 60)) == (1, 6000)
+
+    def test_explain_array(self, array):
+        """Tests if result size and chunks decoded by an array read are estimated."""
+        plan = explain(array[5:25, 0])
+        assert plan.shape == (20,)
+        assert plan.nbytes == 160
+        assert plan.chunk_shape == (10, 20)
+        assert (plan.chunks, plan.files, plan.storage_bytes) == (3, 1, 4800)
+        assert plan.fits
+        assert plan.time is None
+
+    def test_explain_varray(self, client):
+        """Tests if VArray arrays touched and arrays without data are found."""
+        collection = client.create_collection("varrays", VArraySchema(dimensions=DIMENSIONS, dtype=float, vgrid=(4, 3)))
+        varray = collection.create()
+        varray[0:25, 0:20].update(np.ones((25, 20)))
+        plan = explain(varray, (slice(None), slice(10, 30)))
+        assert plan.shape == (100, 20)
+        assert plan.positions == [(x, y) for x in range(4) for y in range(2)]
+        assert (plan.files, plan.missing) == (1, 7)
+        assert "7 without data" in repr(plan)
+
+    def test_iter_pieces(self, array):
+        """Tests if pieces cover the subset once, each within the piece size and aligned to chunks."""
+        plan = explain(array, (slice(3, 97), slice(None)), piece_bytes=8 * 60 * 25)
+        data = np.zeros((100, 60))
+        for bounds in plan.iter_pieces():
+            piece = array[bounds].read()
+            assert piece.nbytes <= plan.piece_bytes
+            data[bounds] += piece
+        assert plan.pieces == 5
+        assert (data[3:97] == 1).all() and not data[:3].any() and not data[97:].any()
+
+        pieces = list(explain(array, (slice(None), 5), piece_bytes=16).iter_pieces())
+        assert pieces[0] == (slice(0, 2), 5)
+        assert len(pieces) == 50
+
+    def test_throughput(self, array):
+        """Tests if read time is estimated from the session read counters once enough data is read."""
+        counters = IOCounters()
+        counters.add(read_bytes=1024, read_time=1)
+        assert explain(array[0], counters=counters).time is None
+        counters.add(read_bytes=4 * 1024**2 - 1024, read_time=1)
+        plan = explain(array, counters=counters)
+        assert plan.throughput == 2 * 1024**2
+        assert plan.throughput_source == "measured in this session"
+        assert plan.time == pytest.approx(48000 / 2 / 1024**2)
+        assert explain(array, throughput=48000).time == pytest.approx(1)
@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+
+from deker_shell.export import MANIFEST, ByteBudget, export, iter_chunk_bounds, read_manifest
+from deker_shell.main import start
+
+
+@pytest.fixture()
+def uri(tmp_path):
+    uri = f"file://{tmp_path / 'storage'}"
+    with Client(uri) as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="y", size=20), DimensionSchema(name="x", size=30)],
+            dtype=float,
+            attributes=[AttributeSchema(name="n", dtype=int, primary=True)],
+        )
+        collection = client.create_collection("coll", schema)
+        for n in range(4):
+            collection.create({"n": n})[:].update(np.arange(600.0).reshape(20, 30) + n)
+    return uri
+
+
+class TestExport:
+    def test_iter_chunk_bounds(self):
+        """Tests if chunks cover the whole array and fit max bytes."""
+        shape = (3, 5, 7)
+        covered = np.zeros(shape, dtype=int)
+        for bounds in iter_chunk_bounds(shape, 8, 8 * 10):
+            assert covered[bounds].size * 8 <= 80
+            covered[bounds] += 1
+        assert (covered == 1).all()
+        assert list(iter_chunk_bounds(shape, 8, 10**6)) == [(slice(0, 3), slice(0, 5), slice(0, 7))]
+
+    def test_byte_budget_oversized_request(self):
+        """Tests if a request bigger than the budget doesn't block when nothing is in flight."""
+        budget = ByteBudget(10)
+        budget.acquire(100)
+        budget.release(100)
+        assert budget.in_flight == 0
+
+    def test_export(self, uri, tmp_path):
+        """Tests if arrays are streamed to .npy files listed in the manifest."""
+        dest = tmp_path / "dump"
+        with Client(uri) as client:
+            report = export(client.get_collection("coll"), dest, workers=2, memory_limit=1000)
+        assert (report.exported, report.skipped, report.bytes, report.errors) == (4, 0, 4 * 600 * 8, [])
+
+        header, arrays = read_manifest(dest)
+        assert header["collection"] == "coll"
+        assert len(arrays) == 4
+        for record in arrays.values():
+            data = np.load(dest / record["file"], mmap_mode="r")
+            n = record["primary_attributes"]["n"]
+            assert (data == np.arange(600.0).reshape(20, 30) + n).all()
+
+    def test_export_resume(self, uri, tmp_path):
+        """Tests if an interrupted export skips the arrays already exported."""
+        dest = tmp_path / "dump"
+        with Client(uri) as client:
+            export(client.get_collection("coll"), dest)
+        lines = (dest / MANIFEST).read_text().splitlines()
+        # drop the last array and leave a torn line behind
+        (dest / MANIFEST).write_text("\n".join(lines[:-1]) + "\n" + lines[-1][:10])
+        (dest / json.loads(lines[-1])["file"]).unlink()
+
+        with Client(uri) as client:
+            report = export(client.get_collection("coll"), dest)
+        assert (report.exported, report.skipped) == (1, 3)
+        assert len(read_manifest(dest)[1]) == 4
+
+    def test_export_cli(self, uri, tmp_path):
+        dest = tmp_path / "dump"
+        result = CliRunner().invoke(start, [uri, "--export", "coll", str(dest), "-w", "2"])
+        assert result.exit_code == 0, result.output
+        assert result.output.startswith("exported 4 arrays")
+        assert len(list(dest.glob("*.npy"))) == 4
+
+    def test_export_cli_no_collection(self, uri, tmp_path):
+        result = CliRunner().invoke(start, [uri, "--export", "missing", str(tmp_path / "dump")])
+        assert result.exit_code == 1
+        assert "Collection missing doesn't exist" in result.output
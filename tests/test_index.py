@@ -0,0 +1,96 @@
+import datetime
+
+import pytest
+
+from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+
+from deker_shell.index import AttributeIndex
+
+
+UTC = datetime.timezone.utc
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path / 'storage'}") as client:
+        yield client
+
+
+@pytest.fixture()
+def collection(client):
+    schema = ArraySchema(
+        dimensions=[DimensionSchema(name="x", size=4)],
+        dtype=float,
+        attributes=[
+            AttributeSchema(name="n", dtype=int, primary=True),
+            AttributeSchema(name="dt", dtype=datetime.datetime, primary=False),
+            AttributeSchema(name="source", dtype=str, primary=False),
+        ],
+    )
+    collection = client.create_collection("coll", schema)
+    for n in range(10):
+        dt = datetime.datetime(2023, 1, n + 1, tzinfo=UTC)
+        collection.create({"n": n}, {"dt": dt, "source": "gfs" if n % 2 else "icon"})
+    return collection
+
+
+@pytest.fixture()
+def index(collection, tmp_path):
+    index = AttributeIndex(collection, tmp_path / "index")
+    yield index
+    index.close()
+
+
+class TestAttributeIndex:
+    def test_find(self, index):
+        """Tests equality, range, prefix and multi-attribute queries."""
+        assert index.refresh().added == 10
+        assert index.count(n=3) == 1
+        assert index.count(n__ge=2, n__lt=5) == 3
+        assert index.count(dt__gt=datetime.datetime(2023, 1, 8, tzinfo=UTC)) == 2
+        assert index.count(source__prefix="gf", n__in=[1, 2, 3]) == 2
+        assert index.count(source__ne="gfs") == 5
+
+    def test_find_naive_datetime(self, index):
+        """Tests if naive datetimes are queried as UTC ones, as deker takes them."""
+        index.refresh()
+        assert index.count(dt=datetime.datetime(2023, 1, 2)) == 1
+        assert index.find(dt=datetime.datetime(2023, 1, 2))[0].primary_attributes["n"] == 1
+        assert index.count(dt__ge=datetime.datetime(2023, 1, 3), dt__le=datetime.datetime(2023, 1, 5)) == 3
+        assert index.count(dt__gt=datetime.datetime(2023, 1, 8)) == 2
+        kyiv = datetime.timezone(datetime.timedelta(hours=2))
+        assert index.count(dt=datetime.datetime(2023, 1, 2, 2, tzinfo=kyiv)) == 1
+
+    def test_find_returns_arrays(self, index):
+        arrays = index.find(n=4)
+        assert len(arrays) == 1
+        assert arrays[0].primary_attributes["n"] == 4
+        assert arrays[0].custom_attributes["source"] == "icon"
+
+    def test_incremental_refresh(self, index, collection):
+        """Tests if only added, modified and removed arrays are reindexed."""
+        index.refresh()
+        assert index.refresh()[:3] == (0, 0, 0)
+
+        collection.filter({"n": 1}).last().update_custom_attributes({"source": "era5"})
+        collection.filter({"n": 2}).last().delete()
+        collection.create({"n": 20}, {"dt": datetime.datetime(2023, 2, 1, tzinfo=UTC), "source": "new"})
+        report = index.refresh()
+        assert (report.added, report.updated, report.removed) == (1, 1, 1)
+        assert index.count(source="era5") == 1
+        assert index.count(n=2) == 0
+        assert index.count() == 10
+
+    def test_persistent(self, index, collection, tmp_path):
+        """Tests if a reopened index doesn't read unchanged arrays again."""
+        index.refresh()
+        reopened = AttributeIndex(collection, tmp_path / "index")
+        assert reopened.refresh().added == 0
+        assert reopened.count(n__le=4) == 5
+        reopened.close()
+
+    def test_unknown_attribute(self, index):
+        with pytest.raises(KeyError):
+            index.find(level=1)
+        with pytest.raises(ValueError, match="Unknown condition"):
+            index.find(n__like=1)
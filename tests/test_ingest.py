@@ -0,0 +1,102 @@
+import datetime
+import json
+
+import numpy as np
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+from deker.errors import DekerLockError
+
+from deker_shell.export import export
+from deker_shell.ingest import ingest, retry_locked
+from deker_shell.main import start
+
+
+SCHEMA = ArraySchema(
+    dimensions=[DimensionSchema(name="y", size=20), DimensionSchema(name="x", size=30)],
+    dtype=float,
+    attributes=[
+        AttributeSchema(name="n", dtype=int, primary=True),
+        AttributeSchema(name="dt", dtype=datetime.datetime, primary=False),
+    ],
+)
+
+
+@pytest.fixture()
+def uri(tmp_path):
+    uri = f"file://{tmp_path / 'storage'}"
+    with Client(uri) as client:
+        client.create_collection("coll", SCHEMA)
+    return uri
+
+
+@pytest.fixture()
+def sources(tmp_path):
+    path = tmp_path / "sources"
+    path.mkdir()
+    for n in range(3):
+        np.save(path / f"{n}.npy", np.full((20, 30), float(n)))
+        (path / f"{n}.json").write_text(json.dumps({"n": n, "dt": "2023-01-01T00:00:00+00:00"}))
+    np.full((20, 30), 3.0).tofile(path / "3.raw")
+    (path / "3.json").write_text(json.dumps({"n": 3}))
+    return path
+
+
+class TestIngest:
+    def test_ingest(self, uri, sources):
+        """Tests if .npy and raw files are written to arrays with sidecar attributes."""
+        with Client(uri) as client:
+            collection = client.get_collection("coll")
+            report = ingest(collection, sources, workers=2, memory_limit=1000)
+            assert (report.ingested, report.bytes, report.errors) == (4, 4 * 600 * 8, [])
+            for n in range(4):
+                array = collection.filter({"n": n}).last()
+                assert (array[:].read() == n).all()
+            assert collection.filter({"n": 0}).last().custom_attributes["dt"].year == 2023
+
+    def test_ingest_attrs_fn(self, uri, sources):
+        with Client(uri) as client:
+            collection = client.get_collection("coll")
+            report = ingest(collection, sources / "1.npy", lambda path: {"n": 10})
+            assert report.ingested == 1
+            assert (collection.filter({"n": 10}).last()[:].read() == 1).all()
+
+    def test_ingest_bad_shape(self, uri, tmp_path):
+        """Tests if files of wrong shape are reported and no arrays are created for them."""
+        np.save(tmp_path / "bad.npy", np.zeros((2, 2)))
+        with Client(uri) as client:
+            collection = client.get_collection("coll")
+            report = ingest(collection, [tmp_path / "bad.npy"], lambda path: {"n": 0})
+            assert report.ingested == 0
+            assert "doesn't match collection array shape" in report.errors[0][1]
+            assert not list(collection)
+
+    def test_ingest_export_roundtrip(self, uri, sources, tmp_path):
+        """Tests if exported arrays are ingested back with the manifest attributes."""
+        with Client(uri) as client:
+            ingest(client.get_collection("coll"), sources)
+            export(client.get_collection("coll"), tmp_path / "dump")
+            target = client.create_collection("copy", SCHEMA)
+            assert ingest(target, tmp_path / "dump").ingested == 4
+            assert (target.filter({"n": 2}).last()[:].read() == 2).all()
+
+    def test_retry_locked(self):
+        calls = []
+
+        def locked():
+            calls.append(1)
+            if len(calls) < 3:
+                raise DekerLockError("locked")
+            return "ok"
+
+        assert retry_locked(locked, timeout=1, interval=0.01) == "ok"
+        calls.clear()
+        with pytest.raises(DekerLockError):
+            retry_locked(locked, timeout=0.01, interval=0.05)
+
+    def test_ingest_cli(self, uri, sources):
+        result = CliRunner().invoke(start, [uri, "--ingest", "coll", str(sources), "-w", "2"])
+        assert result.exit_code == 0, result.output
+        assert result.output.startswith("ingested 4 arrays")
+        assert "MB/s" in result.output
@@ -0,0 +1,105 @@
+import io
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema
+
+from deker_shell.batch import run_batch
+from deker_shell.locks import LockWaiter, get_lock_waiter, lock_owner, locks
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path / 'storage'}", write_lock_timeout=10, write_lock_check_interval=3) as client:
+        schema = ArraySchema(dimensions=[DimensionSchema(name="x", size=4)], dtype=float)
+        collection = client.create_collection("coll", schema)
+        collection.create()[:].update(np.zeros(4))
+        yield client
+
+
+def read_lock(client):
+    array = next(iter(client.get_collection("coll")))
+    path = next((client.root_path / "coll" / "array_data").rglob("*.hdf5"))
+    return array, path.parent / f"{array.id}:uuid:{2**22 + 1}:1.arrayreadlock"
+
+
+class TestLocks:
+    def test_lock_owner(self):
+        """Tests if owner pid is parsed from deker lock file names."""
+        assert lock_owner("id:uuid:123:456.arrayreadlock") == 123
+        assert lock_owner("id.hdf5:789.varraylock") == 789
+        assert lock_owner("coll.lock") is None
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux"), reason="flocks are read from /proc/locks")
+    def test_locks(self, client):
+        """Tests if lock files and flocks of other processes are listed with their owners."""
+        assert not locks(client).locks
+        array, lock = read_lock(client)
+        lock.touch()
+        data = lock.parent / f"{array.id}.hdf5"
+        holder = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                f"import fcntl, sys, time; f = open({str(data)!r}); fcntl.flock(f, fcntl.LOCK_EX); "
+                "print(flush=True); time.sleep(10)",
+            ],
+            stdout=subprocess.PIPE,
+        )
+        try:
+            holder.stdout.readline()
+            table = locks(client, "coll")
+        finally:
+            holder.kill()
+            holder.wait()
+        held = {held.kind: held for held in table.locks}
+        assert set(held) == {"read", "write"}
+        assert held["read"].array == array.id and held["read"].pid == 2**22 + 1
+        assert held["read"].alive is False and held["read"].age is not None
+        assert held["write"].pid == holder.pid and held["write"].path == data
+        assert "2 locks held" in repr(table)
+        assert [held.kind for held in locks(client).locks] == ["read"]
+        assert not locks(client, "missing").locks
+
+    def test_lock_waiter(self, client):
+        """Tests if a write blocked by a read lock resumes before deker next check and the wait is counted."""
+        import deker.locks
+
+        original = deker.locks.wait_for_unlock
+        array, lock = read_lock(client)
+        lock.touch()
+        threading.Timer(0.3, lock.unlink).start()
+        with LockWaiter() as waiter:
+            assert get_lock_waiter() is waiter
+            start = time.perf_counter()
+            array[:].update(np.ones(4))
+            elapsed = time.perf_counter() - start
+        assert deker.locks.wait_for_unlock is original and get_lock_waiter() is None
+        assert elapsed < 2
+        assert waiter.waits == 1 and waiter.records[0].acquired and waiter.records[0].events
+        assert 0.2 < waiter.wait_time < 2
+        assert (array[:].read() == 1).all()
+
+    def test_batch_lock_wait(self, client):
+        """Tests if statements records get their lock wait time when a waiter is installed."""
+        array, lock = read_lock(client)
+        output = io.StringIO()
+        with LockWaiter():
+            lock.touch()
+            threading.Timer(0.3, lock.unlink).start()
+            code = run_batch(
+                client,
+                [("<execute>", "array = next(iter(client.get_collection('coll')))"), ("<execute>", "array[:].clear()")],
+                output,
+            )
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert code == 0
+        assert records[0]["lock_wait"] == 0
+        assert 0.2 < records[1]["lock_wait"] < 2
+        assert not lock.exists()
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema
+
+from deker_shell.prefetch import MetadataPrefetch, count_arrays, load_recent, record_recent
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        schema = ArraySchema(dimensions=[DimensionSchema(name="x", size=2)], dtype=float)
+        for i in range(5):
+            collection = client.create_collection(f"coll_{i}", schema)
+            for _ in range(i):
+                collection.create()
+        yield client
+
+
+class TestRecent:
+    def test_record(self, tmp_path):
+        """Tests if the last used collection goes first and the list is bounded per storage."""
+        path = tmp_path / "recent.json"
+        assert load_recent("file:///a", path) == []
+        for i in range(12):
+            record_recent("file:///a", f"coll_{i}", path)
+        record_recent("file:///a", "coll_5", path)
+        record_recent("file:///b", "other", path)
+        recent = load_recent("file:///a", path)
+        assert recent[:3] == ["coll_5", "coll_11", "coll_10"]
+        assert len(recent) == 10
+        assert load_recent("file:///b", path) == ["other"]
+
+
+class TestMetadataPrefetch:
+    def test_count_arrays(self, client):
+        assert [count_arrays(client.get_collection(f"coll_{i}")) for i in range(5)] == [0, 1, 2, 3, 4]
+
+    def test_prefetch(self, client, mocker):
+        """Tests if recent collections are loaded first and use() doesn't reach the storage."""
+        prefetch = MetadataPrefetch(client, ["coll_3", "missing"], max_collections=3).start()
+        prefetch.wait(timeout=10)
+        assert list(prefetch._entries)[0] == "coll_3"
+        assert len(prefetch) == 2  # "missing" takes one of the 3 places
+        spy = mocker.spy(client, "get_collection")
+        assert prefetch.get("coll_3").name == "coll_3"
+        assert prefetch.count("coll_3") == 3
+        assert prefetch.get("missing") is None
+        assert spy.call_count == 0
+        assert repr(prefetch).startswith("MetadataPrefetch (done): 2 collections loaded\ncoll_3 (3 arrays)")
+
+    def test_ttl(self, client):
+        prefetch = MetadataPrefetch(client, ttl=0.01).start()
+        prefetch.wait(timeout=10)
+        time.sleep(0.02)
+        assert prefetch.get("coll_0") is None
+
+    def test_wait_for_loading(self, client, mocker):
+        """Tests if get waits for the collection being loaded instead of returning None."""
+        get_collection = client.get_collection
+
+        def slow(name):
+            time.sleep(0.2)
+            return get_collection(name)
+
+        mocker.patch.object(client, "get_collection", side_effect=slow)
+        prefetch = MetadataPrefetch(client, ["coll_1"], max_collections=1).start()
+        time.sleep(0.05)
+        assert prefetch.get("coll_1").name == "coll_1"
+        prefetch.cancel()
+
+    def test_cancel(self, client):
+        prefetch = MetadataPrefetch(client)
+        prefetch._cancelled.set()
+        prefetch.start().cancel(timeout=10)
+        assert len(prefetch) == 0
+        assert not prefetch.is_running
@@ -0,0 +1,46 @@
+import re
+
+import pytest
+
+from deker_shell.profiling import format_bytes, format_time, mem, prof, timeit
+
+
+class TestProfiling:
+    def test_timeit_caller_namespace(self, capsys):
+        """Tests if expression is evaluated in the caller namespace."""
+        values = list(range(100))  # noqa F841
+        timeit("sum(values)", number=10, repeat=2)
+        assert re.match(r"10 loops, best of 2: .+ per loop \(mean .+\)", capsys.readouterr().out)
+
+    def test_prof(self, capsys):
+        """Tests if hot functions table is printed."""
+        prof(lambda: sorted(range(1000)), limit=5)
+        out = capsys.readouterr().out
+        assert "Ordered by: cumulative time" in out
+        assert "sorted" in out
+
+    def test_mem(self, capsys):
+        """Tests if peak memory is reported."""
+        mem("bytearray(10 * 1024 * 1024)")
+        peak = re.match(r"peak: ([\d.]+) MB", capsys.readouterr().out)
+        assert peak is not None
+        assert float(peak.group(1)) >= 10
+
+    def test_bad_expression(self):
+        """Tests if only strings and callables are accepted."""
+        with pytest.raises(TypeError):
+            timeit(42)
+
+    @pytest.mark.parametrize(
+        ("func", "value", "expected"),
+        [
+            (format_time, 2.5, "2.5 s"),
+            (format_time, 0.0012, "1.2 ms"),
+            (format_time, 3e-8, "30 ns"),
+            (format_bytes, 512, "512 B"),
+            (format_bytes, 3 * 1024**2, "3 MB"),
+            (format_bytes, -2048, "-2 KB"),
+        ],
+    )
+    def test_formatting(self, func, value, expected):
+        assert func(value) == expected
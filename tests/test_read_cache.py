@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema, Subset
+
+from deker_shell.read_cache import ReadCache, get_cache_size, normalize_bounds
+from deker_shell.telemetry import IOCounters
+
+
+@pytest.fixture()
+def array(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="y", size=10), DimensionSchema(name="x", size=5)], dtype=float
+        )
+        array = client.create_collection("coll", schema).create()
+        array[:].update(np.arange(50.0).reshape(10, 5))
+        yield array
+
+
+@pytest.fixture()
+def cache():
+    cache = ReadCache(1000)
+    cache.install()
+    yield cache
+    cache.uninstall()
+
+
+class TestReadCache:
+    def test_normalize_bounds(self):
+        shape = (10, 5)
+        assert normalize_bounds((2,), shape) == normalize_bounds((-8, slice(0, None)), shape) == (2, (0, 5))
+        assert normalize_bounds((Ellipsis, 1), shape) == ((0, 10), 1)
+        assert normalize_bounds(slice(None), shape) == ((0, 10), (0, 5))
+
+    def test_hits(self, array):
+        """Tests if repeated reads of the same bounds don't reach the storage."""
+        io, cache = IOCounters(), ReadCache(1000)
+        # installed in the shell order, so that counters see only the storage reads
+        io.install()
+        cache.install()
+        try:
+            first = array[2:4, :].read()
+            second = array[2:4].read()
+        finally:
+            cache.uninstall()
+            io.uninstall()
+        assert (first == second).all()
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert io.read_bytes == first.nbytes
+
+    def test_returns_copy(self, array, cache):
+        array[0].read()[0] = -1
+        assert array[0].read()[0] == 0
+
+    def test_invalidate_on_update(self, array, cache):
+        """Tests if updated and cleared arrays are read from storage again."""
+        array[:].read()
+        array[0, 0].update(np.float64(-1))
+        assert array[:].read()[0, 0] == -1
+        array[:].clear()
+        assert np.isnan(array[:].read()).all()
+        assert cache.hits == 0
+
+    def test_eviction(self, array, cache):
+        """Tests if least recently used reads are evicted to fit the byte budget."""
+        array[0].read()  # 40 bytes
+        array[1].read()  # 40 bytes
+        array[:5].read()  # 200 bytes
+        array[0].read()
+        array[:].read()  # 400 bytes
+        array[5:].read()  # 200 bytes
+        assert (cache.size, cache.evictions) == (880, 0)
+        array[:4].read()  # 160 bytes, evicts the least recently used row 1
+        assert cache.size <= 1000
+        assert cache.evictions == 1
+        assert cache.get((str(array.id), (1, (0, 5)))) is None
+        assert cache.get((str(array.id), (0, (0, 5)))) is not None
+
+    def test_too_big(self, array, cache):
+        cache.max_bytes = 100
+        array[:].read()
+        assert len(cache) == 0
+
+    def test_uninstall(self, array):
+        cache = ReadCache(1000)
+        read = Subset.read
+        cache.install()
+        cache.uninstall()
+        assert Subset.read is read
+
+    def test_cache_size(self):
+        assert get_cache_size("1K") == 1024
+        assert get_cache_size("0", "2M") == 2 * 1024**2
+        assert get_cache_size("0") > 0
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema
+
+from deker_shell.rendering import Summary, chunked_stats, render_results, should_summarize, summarize, view
+
+
+@pytest.fixture()
+def array(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="y", size=50), DimensionSchema(name="x", size=40)], dtype=float
+        )
+        client.create_collection("coll", schema).create()[:].update(np.arange(2000.0).reshape(50, 40))
+    with Client(f"file://{tmp_path}", memory_limit="20K") as client:
+        yield next(iter(client.get_collection("coll")))
+
+
+class TestRendering:
+    def test_chunked_stats(self):
+        """Tests if block by block statistics match numpy ones."""
+        data = np.random.default_rng(0).random((100, 30))
+        data[3, 4] = np.nan
+        minimum, maximum, mean, nans = chunked_stats(data, max_bytes=1000)
+        assert (minimum, maximum, nans) == (np.nanmin(data), np.nanmax(data), 1)
+        assert mean == pytest.approx(np.nanmean(data))
+
+    def test_chunked_stats_not_numeric(self):
+        assert chunked_stats(np.array(["a", "b"])) is None
+
+    def test_summarize_complex_array(self, recwarn):
+        """Tests if complex array summary has no statistics instead of ones of the real part."""
+        data = np.arange(10**6) * (1 + 1j)
+        assert chunked_stats(data) is None
+        text = repr(summarize(data))
+        assert "dtype=complex128" in text and "min=" not in text
+        assert "tail: [999995.+999995.j, 999996.+999996.j" in text
+        assert not recwarn.list
+
+    def test_summarize_array(self):
+        """Tests if large array summary is bounded."""
+        data = np.arange(10**6)
+        assert should_summarize(data)
+        assert not should_summarize(data[:10])
+        text = repr(summarize(data))
+        assert "shape=(1000000,)" in text
+        assert "min=0 max=999999 mean=500000" in text
+        assert "tail: [999995, 999996, 999997, 999998, 999999]" in text
+        assert len(text.splitlines()) == 5
+
+    def test_summarize_subset(self, array):
+        """Tests if subset summary reports its size and memory limit without reading."""
+        text = repr(summarize(array[:]))
+        assert "size=15.62 KB, fits memory limit 20 KB" in text
+
+    def test_view_subset(self, array, capsys):
+        """Tests if subset page is read within memory limit."""
+        view(array[10:, 3])
+        out = capsys.readouterr().out
+        assert out.splitlines()[-1] == "rows 0..39 of 40, page 0 of 0"
+        view(array[10:, 3], page=1, rows=3)
+        assert capsys.readouterr().out == "[523., 563., 603.]\nrows 3..5 of 40, page 1 of 13\n"
+
+    def test_view_bad_page(self):
+        with pytest.raises(IndexError):
+            view(np.arange(10), page=5, rows=5)
+
+    def test_render_results(self):
+        """Tests if repl is given a summary of large results."""
+
+        class Repl:
+            def get_globals(self):
+                return {}
+
+            def _format_result_output(self, result):
+                return result
+
+        repl = Repl()
+        render_results(repl, threshold=10)
+        assert isinstance(repl._format_result_output(np.arange(100)), Summary)
+        assert repl._format_result_output([1, 2]) == [1, 2]
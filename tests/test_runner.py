@@ -0,0 +1,77 @@
+import json
+import threading
+
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, Client, DimensionSchema
+
+from deker_shell import runner as runner_module
+from deker_shell.main import start
+from deker_shell.runner import Job, _run_job, make_jobs
+
+
+runner = CliRunner(mix_stderr=False)
+
+
+@pytest.fixture()
+def uri(tmp_path):
+    uri = f"file://{tmp_path / 'storage'}"
+    with Client(uri) as client:
+        for name in ("c1", "c2"):
+            client.create_collection(name, ArraySchema(dimensions=[DimensionSchema(name="x", size=2)], dtype=float))
+    return uri
+
+
+@pytest.fixture()
+def scripts(tmp_path):
+    sources = {
+        "ok.py": "print(collection.name if collection else client.is_open)\n",
+        "fail.py": "raise ValueError('bad')\n",
+        "exit.py": "import sys\nsys.exit(3)\n",
+    }
+    paths = {}
+    for name, source in sources.items():
+        path = tmp_path / name
+        path.write_text(source)
+        paths[name] = str(path)
+    return paths
+
+
+class TestRunner:
+    def test_make_jobs(self):
+        """Tests if each script is run against each collection."""
+        assert make_jobs(["a.py", "b.py"]) == [Job("a.py"), Job("b.py")]
+        assert make_jobs(["a.py"], ["c1", "c2"]) == [Job("a.py", "c1"), Job("a.py", "c2")]
+
+    def test_job_namespace_closed(self, uri, tmp_path, monkeypatch):
+        """Tests if a job leaves no async I/O threads in the long-lived worker."""
+        script = tmp_path / "aio.py"
+        script.write_text("import asyncio\narray = collection.create()\nasyncio.run(aread(array[:]))\n")
+        with Client(uri) as client:
+            monkeypatch.setattr(runner_module, "_client", client)
+            result = _run_job(Job(str(script), "c1"))
+        assert result.exit_code == 0, result.stderr
+        assert not [thread for thread in threading.enumerate() if thread.name.startswith("deker-async")]
+
+    def test_run_scripts(self, uri, scripts, tmp_path):
+        """Tests if scripts results are summarized."""
+        summary = tmp_path / "summary.json"
+        args = [uri, "-j", "2", "--summary", str(summary)]
+        for name in ("ok.py", "fail.py", "exit.py"):
+            args += ["-r", scripts[name]]
+        result = runner.invoke(start, args)
+        assert result.exit_code == 1
+        assert "3 jobs, 2 failed" in result.stdout
+        assert "ValueError: bad" in result.stderr
+        jobs = json.loads(summary.read_text())["jobs"]
+        assert [job["exit_code"] for job in jobs] == [0, 1, 3]
+        assert jobs[0]["stdout"] == "True\n"
+
+    def test_run_script_per_collection(self, uri, scripts):
+        """Tests if collection variable is preset for each job."""
+        result = runner.invoke(start, [uri, "-r", scripts["ok.py"], "--collection", "c1", "--collection", "c2"])
+        assert result.exit_code == 0
+        assert "c1\n" in result.stdout
+        assert "c2\n" in result.stdout
+        assert "2 jobs, 0 failed" in result.stdout
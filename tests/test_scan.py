@@ -0,0 +1,97 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from deker import ArraySchema, Client, DimensionSchema
+
+from deker_shell.scan import Accumulator, get_scan_value_bytes, scan
+
+
+DATA = np.random.default_rng(0).random((3, 20, 30))
+DATA[0, 1, 2] = np.nan
+
+
+@pytest.fixture()
+def collection(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="y", size=20), DimensionSchema(name="x", size=30)], dtype=float
+        )
+        collection = client.create_collection("coll", schema)
+        for data in DATA:
+            collection.create()[:].update(data)
+        yield collection
+
+
+def expected(collection):
+    """Return test data in the collection iteration order."""
+    return [DATA[np.argmin([np.nanmax(np.abs(array[:].read() - data)) for data in DATA])] for array in collection]
+
+
+class TestScan:
+    def test_accumulator_merge(self):
+        """Tests if merged partial statistics match statistics of the whole data."""
+        data = np.random.default_rng(1).normal(10, 3, size=(40, 7))
+        whole, first, second = Accumulator(7), Accumulator(7), Accumulator(7)
+        whole.update(data, axis=1)
+        first.update(data[:15], axis=1)
+        second.update(data[15:], axis=1)
+        result = first.merge(second).result(["count", "mean", "std", "min", "max", "sum"])
+        for stat, values in whole.result(["count", "mean", "std", "min", "max", "sum"]).items():
+            np.testing.assert_allclose(result[stat], values)
+        np.testing.assert_allclose(result["std"], data.std(axis=0))
+
+    @pytest.mark.parametrize("axis", [None, 1])
+    def test_accumulator_memory(self, axis):
+        """Tests if a float32 block is reduced within the scan memory per value, not in float64 temporaries."""
+        block = np.ones((100, 10000), dtype=np.float32)
+        accumulator = Accumulator(block.shape[1] if axis else 1)
+        tracemalloc.start()
+        try:
+            accumulator.update(block, axis)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert peak <= (get_scan_value_bytes(block.itemsize) - block.itemsize) * block.size
+
+    def test_scan(self, collection):
+        """Tests if chunked statistics of each array match numpy ones."""
+        table = scan(collection, stats=["min", "max", "mean", "std", "nan"], processes=0, memory_limit=1000)
+        assert len(table) == 3
+        assert table.columns == ["id", "min", "max", "mean", "std", "nan"]
+        for row, data in zip(table, expected(collection)):
+            assert row["min"] == np.nanmin(data)
+            assert row["max"] == np.nanmax(data)
+            assert row["mean"] == pytest.approx(np.nanmean(data))
+            assert row["std"] == pytest.approx(np.nanstd(data))
+            assert row["nan"] == np.isnan(data).sum()
+
+    def test_scan_by(self, collection, tmp_path):
+        """Tests if statistics are computed per dimension position."""
+        table = scan(collection, stats=["mean"], by="x", processes=0, memory_limit=1000)
+        assert len(table) == 3 * 30
+        assert table.columns == ["id", "x", "mean"]
+        np.testing.assert_allclose(table.column("mean")[:30], np.nanmean(expected(collection)[0], axis=0))
+        table.to_csv(str(tmp_path / "stats.csv"))
+        assert (tmp_path / "stats.csv").read_text().splitlines()[0] == "id,x,mean"
+
+    def test_scan_processes(self, collection):
+        """Tests if arrays scanned in worker processes give the same results."""
+        local = scan(collection, stats=["count", "sum"], processes=0)
+        assert scan(collection, stats=["count", "sum"], processes=2).rows == local.rows
+
+    def test_scan_errors(self, collection):
+        with pytest.raises(ValueError, match="Unknown statistics median"):
+            scan(collection, stats=["median"])
+        with pytest.raises(ValueError, match="Array has no dimension z"):
+            scan(collection, by="z", processes=0)
+
+    def test_scan_complex(self, tmp_path):
+        """Tests if complex arrays are rejected instead of scanned by their real part."""
+        with Client(f"file://{tmp_path / 'complex'}") as client:
+            schema = ArraySchema(dimensions=[DimensionSchema(name="x", size=4)], dtype=complex)
+            collection = client.create_collection("complex", schema)
+            collection.create()[:].update(np.array([1 + 1j, 2, 3j, 4]))
+            with pytest.raises(TypeError, match="complex128"):
+                scan(collection, processes=0)
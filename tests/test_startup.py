@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+import pytest
+
+
+ROOT = Path(__file__).parent.parent
+
+# Wall time budgets (in seconds) of each entry mode, may be scaled for slow machines
+# with DEKER_SHELL_STARTUP_BUDGET_FACTOR environment variable.
+BUDGETS = {"help": 1.0, "script": 1.0, "repl": 4.0}
+BUDGET_FACTOR = float(os.environ.get("DEKER_SHELL_STARTUP_BUDGET_FACTOR", 1))
+
+HEAVY_MODULES = ("deker", "numpy", "ptpython", "jedi")
+
+
+def run_shell(*args: str, code: str = "from deker_shell.main import start; start()") -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=ROOT,
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+
+def best_time(*args: str, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run_shell(*args)
+        times.append(time.perf_counter() - start)
+        assert result.returncode == 0, result.stderr
+    return min(times)
+
+
+@pytest.fixture()
+def script(tmp_path):
+    path = tmp_path / "script.py"
+    path.write_text("print('done')\n")
+    return str(path)
+
+
+class TestStartup:
+    @pytest.mark.parametrize("mode", ["help", "script"])
+    def test_heavy_modules_not_imported(self, mode, script):
+        """Tests if deker, numpy, ptpython and jedi are not imported in help and script modes."""
+        code = (
+            "import sys\n"
+            "from deker_shell.main import start\n"
+            "try:\n"
+            "    start()\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            f"print(sorted({{m.split('.')[0] for m in sys.modules}} & {set(HEAVY_MODULES)!r}))"
+        )
+        result = run_shell("--help" if mode == "help" else script, code=code)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.splitlines()[-1] == "[]"
+
+    @pytest.mark.parametrize(
+        ("mode", "args"),
+        [("help", ["--help"]), ("script", None), ("repl", ["file:///tmp/deker"])],
+    )
+    def test_startup_budget(self, mode, args, script):
+        """Tests if startup time of each entry mode fits its budget."""
+        budget = BUDGETS[mode] * BUDGET_FACTOR
+        elapsed = best_time(*(args or [script]))
+        assert elapsed < budget, f"{mode} startup took {elapsed:.3f}s, budget is {budget:.3f}s"
@@ -0,0 +1,86 @@
+import asyncio
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, Client, DimensionSchema, Subset
+
+from deker_shell.main import start
+from deker_shell.telemetry import Telemetry, wrap_eval
+
+
+@pytest.fixture()
+def array(tmp_path):
+    with Client(f"file://{tmp_path}") as client:
+        schema = ArraySchema(dimensions=[DimensionSchema(name="x", size=100)], dtype=float)
+        yield client.create_collection("coll", schema).create()
+
+
+@pytest.fixture()
+def telemetry():
+    telemetry = Telemetry()
+    telemetry.install()
+    yield telemetry
+    telemetry.uninstall()
+
+
+class TestTelemetry:
+    def test_io_counted(self, telemetry, array):
+        """Tests if bytes read and written through deker are recorded per statement."""
+        telemetry.start("array[:].update(data)")
+        array[:].update(np.ones(100))
+        first = telemetry.stop()
+        telemetry.start("array[:10].read()")
+        array[:10].read()
+        second = telemetry.stop()
+
+        assert (first.read_bytes, first.written_bytes) == (0, 800)
+        assert (second.read_bytes, second.written_bytes) == (80, 0)
+        assert telemetry.totals.read_bytes == 80
+        assert telemetry.totals.written_bytes == 800
+        assert telemetry.last is second
+        assert "read 80 B" in telemetry.toolbar_text()
+
+    def test_uninstall(self, telemetry):
+        """Tests if original Subset methods are restored."""
+        telemetry.uninstall()
+        assert Subset.read.__qualname__ == "Subset.read"
+
+    def test_wrap_eval_failure(self, telemetry):
+        """Tests if failed statements are recorded."""
+
+        async def eval_async(line):
+            raise ValueError(line)
+
+        with pytest.raises(ValueError):
+            asyncio.run(wrap_eval(telemetry, eval_async)("1/0"))
+        assert telemetry.last.ok is False
+        assert telemetry.last.code == "1/0"
+
+    @pytest.mark.parametrize("extension", ["csv", "json"])
+    def test_export(self, telemetry, tmp_path, extension):
+        """Tests if per-statement log is exported."""
+        for code in ("a = 1", "b = 2"):
+            telemetry.start(code)
+            telemetry.stop()
+        path = tmp_path / f"log.{extension}"
+        telemetry.export(str(path))
+        if extension == "json":
+            records = json.loads(path.read_text())
+        else:
+            records = list(csv.DictReader(path.open()))
+        assert [r["code"] for r in records] == ["a = 1", "b = 2"]
+
+    def test_export_bad_extension(self, telemetry):
+        with pytest.raises(ValueError):
+            telemetry.export("log.txt")
+
+    def test_start_with_telemetry_log(self, tmp_path):
+        """Tests if telemetry log is written on exit."""
+        path = tmp_path / "log.json"
+        result = CliRunner().invoke(start, [f"file://{tmp_path}", "--telemetry-log", str(path)])
+        assert result.exit_code == 0
+        assert json.loads(path.read_text()) == []
@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, Client, DimensionSchema, Subset, VArraySchema
+
+from deker_shell.main import start
+from deker_shell.trace import Tracer, trace
+
+
+@pytest.fixture()
+def client(tmp_path):
+    with Client(f"file://{tmp_path / 'storage'}") as client:
+        yield client
+
+
+class TestTrace:
+    def test_trace(self, client, tmp_path):
+        """Tests if reads, writes, HDF5 I/O and locks are nested in the trace and methods are restored after it."""
+        read = Subset.read
+        collection = client.create_collection("coll", ArraySchema(dimensions=[DimensionSchema("x", 10)], dtype=float))
+        array = collection.create()
+        with trace(tmp_path / "trace.json", "test") as tracer:
+            array[:].update(np.arange(10.0))
+            assert (array[:5].read() == np.arange(5.0)).all()
+            assert len(list(client.get_collection("coll"))) == 1
+        assert Subset.read is read
+        names = {span.name for span in tracer.spans}
+        assert {"Subset.read", "Subset.update", "HDF5StorageAdapter.read_data", "Client.get_collection"} <= names
+        assert {"Collection.__iter__", "ReadArrayLock.acquire", "WriteArrayLock.check_existing_lock"} <= names
+        assert "MainThread;test;Subset.read;HDF5StorageAdapter.read_data" in tracer.stacks
+        assert sum(tracer.stacks.values()) == tracer.duration
+        assert tracer.summary()[0][:3] == ("test", "trace", 1)
+        assert "Subset.update" in repr(tracer)
+
+        events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+        assert len([event for event in events if event["ph"] == "X"]) == len(tracer.spans)
+        assert all(event["dur"] >= 0 for event in events if event["ph"] == "X")
+        lines = (tmp_path / "trace.folded").read_text().splitlines()
+        assert len(lines) == len(tracer.stacks)
+        assert all(int(line.rsplit(" ", 1)[1]) >= 0 for line in lines)
+
+    def test_nested(self, client):
+        """Tests if VArray arrays reads are traced on their threads and nested tracers share the spans."""
+        schema = VArraySchema(dimensions=[DimensionSchema("x", 10)], dtype=float, vgrid=(2,))
+        varray = client.create_collection("varrays", schema).create()
+        with Tracer("outer") as outer:
+            with Tracer("inner") as inner:
+                varray[:].read()
+            varray[:].read()
+        assert len([span for span in inner.spans if span.name == "VSubset.read"]) == 1
+        assert len([span for span in outer.spans if span.name == "VSubset.read"]) == 2
+        assert any(stack.startswith("ThreadPoolExecutor") for stack in inner.stacks)
+        assert "MainThread;outer;inner" in outer.stacks
+
+    def test_start_trace(self, client, tmp_path):
+        """Tests if --trace writes the trace of --execute statements."""
+        path = tmp_path / "out.json"
+        runner = CliRunner(mix_stderr=False)
+        result = runner.invoke(start, [client._Client__uri.raw_url, "--trace", str(path), "-e", "list(client)"])
+        assert result.exit_code == 0, result.stderr
+        assert "Trace written" in result.stderr
+        assert path.exists() and path.with_suffix(".folded").exists()
+        result = runner.invoke(start, [client._Client__uri.raw_url, "--trace", str(tmp_path / "out.txt")])
+        assert result.exit_code != 0
@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pytest
+
+from click.testing import CliRunner
+from deker import ArraySchema, AttributeSchema, Client, DimensionSchema
+
+from deker_shell.main import start
+from deker_shell.tune import (
+    HardwareInfo,
+    Throughput,
+    autotune,
+    get_worker_candidates,
+    load_profile,
+    recommend,
+    save_profile,
+)
+
+
+@pytest.fixture()
+def uri(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    (tmp_path / "storage").mkdir()
+    uri = f"file://{tmp_path / 'storage'}"
+    with Client(uri) as client:
+        schema = ArraySchema(
+            dimensions=[DimensionSchema(name="y", size=10), DimensionSchema(name="x", size=5)],
+            dtype=float,
+            attributes=[AttributeSchema(name="k", dtype=int, primary=True)],
+        )
+        collection = client.create_collection("coll", schema)
+        for k in range(3):
+            collection.create({"k": k})[:].update(np.full((10, 5), float(k)))
+    return uri
+
+
+HARDWARE = HardwareInfo(4, 8 * 1024**3, 6 * 1024**3)
+
+
+class TestTune:
+    def test_worker_candidates(self):
+        assert get_worker_candidates(4) == [1, 2, 4, 8]
+        assert get_worker_candidates(1) == [1, 2, 5]
+
+    def test_recommend(self):
+        """Tests if the smallest number of workers close to the best throughput is chosen."""
+        throughput = [
+            Throughput(1, 100.0, 100.0, 0.1),
+            Throughput(2, 190.0, 200.0, 0.2),
+            Throughput(4, 200.0, 195.0, 2.6),
+            Throughput(8, 150.0, 150.0, 9.0),
+        ]
+        profile = recommend(HARDWARE, throughput)
+        assert profile.workers == 2
+        assert profile.memory_limit == 3 * 1024**3
+        assert profile.write_lock_timeout == 180
+        assert profile.write_lock_check_interval == 9
+
+    def test_save_load(self, tmp_path):
+        path = tmp_path / "tune.json"
+        assert load_profile("file:///a", path) == {}
+        profile = recommend(HARDWARE, [Throughput(1, 1.0, 1.0, 0.1)])
+        save_profile("file:///a", profile, path)
+        save_profile("file:///b", profile._replace(workers=3), path)
+        assert load_profile("file:///a", path) == profile.client_kwargs()
+        assert load_profile("file:///b", path)["workers"] == 3
+        assert "hardware" in json.loads(path.read_text())["file:///a"]
+
+    def test_autotune(self, uri):
+        """Tests if all the candidates are measured and the scratch collection is deleted."""
+        with Client(uri) as client:
+            profile = autotune(client, client.get_collection("coll"), save=False)
+            assert [item.workers for item in profile.throughput] == get_worker_candidates(profile.hardware.cores)
+            assert all(item.read > 0 and item.write > 0 for item in profile.throughput)
+            assert [collection.name for collection in client] == ["coll"]
+            for array in client.get_collection("coll"):
+                assert (array[:].read() == array.primary_attributes["k"]).all()
+
+    def test_cli(self, uri):
+        """Tests if --tune saves a profile used by later starts unless options are passed."""
+        runner = CliRunner(mix_stderr=False)
+        result = runner.invoke(start, [uri, "--tune", "coll"])
+        assert result.exit_code == 0, result.output
+        assert "recommended: --workers" in result.output
+        workers = load_profile(uri)["workers"]
+
+        code = "client._Client__config.workers"
+        result = runner.invoke(start, [uri, "-e", code])
+        assert json.loads(result.output.splitlines()[-1])["result"] == workers
+        result = runner.invoke(start, [uri, "-w", str(workers + 1), "-e", code])
+        assert json.loads(result.output.splitlines()[-1])["result"] == workers + 1